@@ -0,0 +1,366 @@
+"""
+Framework overhead of run_agent, without model or upstream latency.
+
+A deterministic ScriptedBackend stands in for the model: it calls the
+`blob` tool for a fixed number of rounds and then answers, and costs next
+to nothing itself. The tools are mcp_servers/custom.py's, plus `blob`
+(returns a result of the requested size) and `dummy_<i>` tools that widen
+the tool list. So the time measured is everything the client does per
+round: the thread hop into backend.complete, argument coercion, the MCP
+round trip through the SDK, result extraction, message building, logging
+and (optionally) tracing.
+
+Scenarios vary the rounds per conversation, the tool result size, the
+number of tools offered and the number of conversations in flight. They
+run against the custom server either in-process (the SDK's memory streams,
+no network) or over streamable HTTP (a server subprocess on a free local
+port). Every scenario runs in a fresh interpreter so peak RSS is its own.
+
+Output is one JSON document (rounds/s, microseconds per round, peak RSS
+per scenario, plus the git commit) for commit-over-commit comparison:
+
+    python3 -m bench.agent_overhead --output bench.json
+    python3 -m bench.agent_overhead --only inproc --conversations 50
+    python3 -m bench.agent_overhead --log_format jsonl --trace
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import time
+from contextlib import AsyncExitStack
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+
+from utils.backend import ChatResponse, ToolCall
+from utils.misc import dumps_json
+
+SERVER = "custom"
+MAX_DUMMY_TOOLS = 128
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    transport: str  # inproc | http
+    rounds: int  # tool rounds per conversation (plus one final answer round)
+    result_bytes: int
+    tools: int  # tools offered to the backend
+    concurrency: int  # conversations in flight at once
+
+
+SCENARIOS = [
+    Scenario("inproc-r1", "inproc", rounds=1, result_bytes=100, tools=2, concurrency=1),
+    Scenario("inproc-r16", "inproc", rounds=16, result_bytes=100, tools=2, concurrency=1),
+    Scenario("inproc-r16-100kb", "inproc", rounds=16, result_bytes=100_000, tools=2, concurrency=1),
+    Scenario("inproc-r4-tools128", "inproc", rounds=4, result_bytes=100, tools=MAX_DUMMY_TOOLS, concurrency=1),
+    Scenario("inproc-r4-c8", "inproc", rounds=4, result_bytes=100, tools=2, concurrency=8),
+    Scenario("http-r4", "http", rounds=4, result_bytes=100, tools=2, concurrency=1),
+    Scenario("http-r4-10kb-c8", "http", rounds=4, result_bytes=10_000, tools=2, concurrency=8),
+]
+
+
+# ---- tools -------------------------------------------------------------------------
+
+def blob(size: int) -> str:
+    """Return a string of `size` characters."""
+    return "x" * size
+
+
+def _dummy_tool(i: int):
+    def dummy(query: str, limit: int = 5) -> str:
+        return f"dummy_{i}: {query} ({limit})"
+    dummy.__name__ = f"dummy_{i}"
+    dummy.__doc__ = f"Look up `query` in dummy index number {i} and return at most `limit` entries."
+    return dummy
+
+
+def register_bench_tools(server: Any) -> None:
+    """Add `blob` and `dummy_<i>` to a FastMCP server."""
+    server.add_tool(blob)
+    for i in range(MAX_DUMMY_TOOLS):
+        server.add_tool(_dummy_tool(i))
+
+
+def allowlist(scenario: Scenario) -> Dict[str, set]:
+    return {SERVER: {"blob"} | {f"dummy_{i}" for i in range(scenario.tools - 1)}}
+
+
+# ---- backend ------------------------------------------------------------------------
+
+@dataclass
+class ScriptedBackend:
+    """
+    Deterministic stand-in for a model backend: `rounds` calls to
+    `<server>__blob`, then a final answer. Stateless (the round is read
+    off the conversation), so one instance serves concurrent runs.
+    """
+
+    rounds: int
+    result_bytes: int
+    model: str = "scripted"
+
+    def complete(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: Optional[List[Dict[str, Any]]],
+        *,
+        max_new_tokens: int,
+        temperature: float,
+        seed: int,
+        logger: Any,
+    ) -> ChatResponse:
+        done = sum(m["role"] == "tool" for m in messages)
+        usage = {"input_tokens": 0, "output_tokens": 0}
+        if done >= self.rounds:
+            return ChatResponse(content=f"Done after {done} tool calls.", tool_call=None, usage=usage)
+        return ChatResponse(
+            content=None,
+            # A string, as models often emit, so the schema coercion runs too.
+            tool_call=ToolCall(id=f"call_{done}", name=f"{SERVER}__blob", args={"size": str(self.result_bytes)}),
+            usage=usage,
+        )
+
+    # Same message shapes as OpenAIBackend.
+    def build_tool_call_message(self, tc: ToolCall) -> Dict[str, Any]:
+        return {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{
+                "id": tc.id,
+                "type": "function",
+                "function": {"name": tc.name, "arguments": dumps_json(tc.args)},
+            }],
+        }
+
+    def build_tool_result_message(self, tc: ToolCall, result: str) -> Dict[str, Any]:
+        return {"role": "tool", "tool_call_id": tc.id, "content": result}
+
+
+# ---- transports ---------------------------------------------------------------------
+
+class InProcessMcp:
+    """MultiMcp look-alike over the SDK's in-memory streams (no network)."""
+
+    def __init__(self, server: Any):
+        self._server = server
+        self._stack = AsyncExitStack()
+        self.sessions: Dict[str, Any] = {}
+
+    async def __aenter__(self):
+        from mcp.shared.memory import create_connected_server_and_client_session
+
+        self.sessions[SERVER] = await self._stack.enter_async_context(
+            create_connected_server_and_client_session(self._server._mcp_server)
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._stack.aclose()
+
+    async def list_tools(self, server: str):
+        return await self.sessions[server].list_tools()
+
+    async def call_tool(self, server: str, tool_name: str, args: dict):
+        return await self.sessions[server].call_tool(tool_name, args)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Benchmark MCP server did not come up on port {port}")
+
+
+def serve(port: int) -> None:
+    from mcp_servers import custom
+
+    register_bench_tools(custom.mcp)
+    custom.run_server(port=port)
+
+
+# ---- runner --------------------------------------------------------------------------
+
+def _logger(log_format: str) -> Any:
+    from utils.logger import JsonlFormatter, TextFormatter
+
+    logger = logging.getLogger("bench")
+    logger.propagate = False
+    if log_format == "none":
+        logger.setLevel(logging.WARNING)
+        return logger
+    handler = logging.FileHandler(os.devnull, encoding="utf-8")
+    handler.setFormatter(JsonlFormatter() if log_format == "jsonl" else TextFormatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+async def _run_conversations(mcp: Any, scenario: Scenario, conversations: int, args: argparse.Namespace) -> Dict[str, Any]:
+    from utils.agent_loop import run_agent
+    from utils.config import McpConfig
+    from utils.mcp_tools import build_tools
+    from utils.tool_registry import ToolRegistry
+    from utils.tracing import Tracer
+
+    cfg = McpConfig(url_map={}, enabled=[SERVER], allowlist=allowlist(scenario), prefix_tools=True)
+    llm_tools = await build_tools(mcp, cfg)
+    registry = ToolRegistry(llm_tools)
+    backend = ScriptedBackend(rounds=scenario.rounds, result_bytes=scenario.result_bytes)
+    logger = _logger(args.log_format)
+    tracer = Tracer(None) if args.trace else None
+    sem = asyncio.Semaphore(scenario.concurrency)
+
+    async def one(i: int) -> None:
+        async with sem:
+            await run_agent(
+                backend=backend,
+                mcp=mcp,
+                llm_tools=llm_tools,
+                system_message="",
+                user_message=f"benchmark conversation {i}",
+                temperature=0.0,
+                max_new_tokens=16,
+                max_tool_rounds=scenario.rounds + 1,
+                logger=logger,
+                registry=registry,
+                tracer=tracer,
+            )
+
+    await one(-1)  # warm-up: imports, schema compilation, first connection
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(conversations)))
+    wall = time.perf_counter() - t0
+
+    total_rounds = conversations * (scenario.rounds + 1)
+    return {
+        **asdict(scenario),
+        "tools_offered": len(llm_tools),
+        "conversations": conversations,
+        "total_rounds": total_rounds,
+        "wall_s": round(wall, 6),
+        "rounds_per_s": round(total_rounds / wall, 2),
+        "us_per_round": round(wall / total_rounds * 1e6, 1),
+        # ru_maxrss is in KiB on Linux.
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+async def run_scenario(scenario: Scenario, conversations: int, args: argparse.Namespace) -> Dict[str, Any]:
+    if scenario.transport == "inproc":
+        from mcp_servers import custom
+
+        register_bench_tools(custom.mcp)
+        async with InProcessMcp(custom.mcp) as mcp:
+            return await _run_conversations(mcp, scenario, conversations, args)
+
+    from utils.mcp_http import MultiMcp
+
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "bench.agent_overhead", "--serve", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        _wait_for_port(port)
+        async with MultiMcp({SERVER: f"http://127.0.0.1:{port}/mcp"}, [SERVER]) as mcp:
+            return await _run_conversations(mcp, scenario, conversations, args)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', type=str, default=None, help='Write the JSON results here (default: stdout).')
+    parser.add_argument('--only', type=str, default=None, help='Run only scenarios whose name contains this string.')
+    parser.add_argument('--conversations', type=int, default=20, help='Conversations per scenario (after one warm-up).')
+    parser.add_argument('--log_format', type=str, choices=['none', 'text', 'jsonl'], default='none', help='Include logging (to /dev/null) in the measurement.')
+    parser.add_argument('--trace', action='store_true', help='Include span tracing (no export) in the measurement.')
+    parser.add_argument('--scenario', type=str, default=None, help=argparse.SUPPRESS)  # run one scenario in this process
+    parser.add_argument('--serve', type=int, default=None, help=argparse.SUPPRESS)  # HTTP server subprocess
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+
+    if args.serve is not None:
+        serve(args.serve)
+        return
+
+    if args.scenario is not None:
+        scenario = next(s for s in SCENARIOS if s.name == args.scenario)
+        print(json.dumps(asyncio.run(run_scenario(scenario, args.conversations, args))))
+        return
+
+    passthrough = ["--conversations", str(args.conversations), "--log_format", args.log_format]
+    if args.trace:
+        passthrough.append("--trace")
+
+    results = []
+    for scenario in SCENARIOS:
+        if args.only and args.only not in scenario.name:
+            continue
+        out = subprocess.run(
+            [sys.executable, "-m", "bench.agent_overhead", "--scenario", scenario.name, *passthrough],
+            capture_output=True,
+            text=True,
+        )
+        if out.returncode != 0:
+            print(f"[bench] {scenario.name} failed:\n{out.stderr}", file=sys.stderr)
+            results.append({**asdict(scenario), "error": (out.stderr.strip().splitlines() or ["unknown"])[-1]})
+            continue
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        print(
+            f"[bench] {scenario.name:<20} {result['rounds_per_s']:>10.1f} rounds/s "
+            f"{result['us_per_round']:>10.1f} us/round {result['peak_rss_mb']:>8.1f} MB",
+            file=sys.stderr,
+        )
+        results.append(result)
+
+    report = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "conversations": args.conversations,
+        "log_format": args.log_format,
+        "trace": args.trace,
+        "scenarios": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
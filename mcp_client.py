@@ -1,75 +1,77 @@
 import asyncio
 import os
+import sys
+
+from utils.profiling import NULL_PROFILER, SamplingProfiler
+
+# Started before the remaining imports so that --profile covers startup.
+PROFILER = SamplingProfiler().start("startup") if __name__ == "__main__" and "--profile" in sys.argv else NULL_PROFILER
 
 from dotenv import load_dotenv
 load_dotenv("./secrets.env")
 
 from utils.config import LLMConfig, McpConfig
 from utils.backend import create_backend
+from utils.clients import OPENAI_MAX_RETRIES, configure_clients
+from utils.rate_control import configure_rate_control, limiter_stats
+from utils.hf_daemon import DEFAULT_SOCKET
 from utils.mcp_http import MultiMcp
-from utils.misc import apply_allowlist, to_llm_tools
+from utils.mcp_tools import ENABLED_SERVERS, MCP_URLS, TOOL_ALLOWLIST, build_tools
+from utils.schema_compact import compact_llm_tools, tool_token_counts
 from utils.agent_loop import run_agent
+from utils.router_backend import RouterBackend
+from utils.tool_registry import ToolRegistry
+from utils.tool_selection import ToolSelector
+from utils.tracing import Tracer
 
 import argparse
 from pathlib import Path
 from utils.logger import create_logger
 
-MCP_URLS = {
-    "custom": "http://localhost:8001/mcp",
-    "brave_search": "http://localhost:8002/mcp",
-    "perplexity_search": "http://localhost:8003/mcp",
-    "google_search": "http://localhost:8004/mcp",
-}
-
-TOOL_ALLOWLIST = {
-    "custom": {
-        "add"
-    },
-    "brave_search": {
-        "brave_web_search"
-    },
-    "perplexity_search": {
-        "perplexity_search"
-    },
-    "google_search": {
-        "google_search"
-    },
-}
-
-# Default servers to enable. Override at runtime with --enabled custom,brave_search,...
-ENABLED_SERVERS = ["custom"]
-
 MODEL_DIR = Path(os.environ.get("MODEL_DIR", "../hf_models/"))
 
-async def build_tools(mcp: MultiMcp, mcp_cfg: McpConfig):
-    all_tools = []
-    for server in mcp_cfg.enabled:
-        tools_resp = await mcp.list_tools(server)
-        tools = tools_resp.tools
-
-        allow = None
-        if mcp_cfg.allowlist is not None:
-            allow = mcp_cfg.allowlist.get(server)
-
-        tools = apply_allowlist(tools, allow)
-        prefix = server if mcp_cfg.prefix_tools else None
-        all_tools.extend(to_llm_tools(tools, prefix=prefix))
-    return all_tools
-
 def parse_arguments(return_default: bool = False):
     parser = argparse.ArgumentParser()
 
-    parser.add_argument('--device', type=str, default='cuda:0', help="Device to run (HuggingFace only)")
+    parser.add_argument('--device', type=str, default='cuda:0', help="Device to run (HuggingFace only). 'cpu' for CPU-only nodes.")
     parser.add_argument('--dtype', type=str, default='auto', help="Model dtype (HuggingFace only)")
+    parser.add_argument('--quantize', type=str, choices=['none', 'int8', 'int4'], default='none', help="HuggingFace only: weight quantization. int8 = dynamic int8 Linear layers (CPU), int4 = optimum-quanto 4-bit weights.")
+    parser.add_argument('--num_threads', type=int, default=None, help="HuggingFace only: torch intra-op threads for this process.")
+    parser.add_argument('--num_interop_threads', type=int, default=None, help="HuggingFace only: torch inter-op threads for this process.")
     parser.add_argument('--seed', type=int, default=0, help='Random seed')
     parser.add_argument('--temperature', type=float, default=0.0, help='Temperature')
     parser.add_argument('--model', type=str, default='Qwen/Qwen3.5-35B-A3B', help='Model name (HuggingFace local) or API model ID (e.g. gpt-4o, claude-3-5-sonnet-20241022)')
+    parser.add_argument('--route', type=str, default=None, help='Comma-separated models to route between (e.g. gpt-4o,claude-sonnet-4-5,Qwen/Qwen3-8B); each round goes to the fastest healthy one, falling back on errors. Overrides --model.')
+    parser.add_argument('--hedge_after', type=float, default=None, help='With --route: if the chosen backend has not answered after this many seconds, also send the call to the next one and take the first answer.')
     parser.add_argument('--max_tool_rounds', type=int, default=6, help='Maximum number of LLM rounds (each round may invoke one tool or produce the final answer).')
     parser.add_argument('--writing_mode', action='store_true', help='HuggingFace only: also log the model output with special tokens kept (e.g. <|python_tag|>) for inspection. Agent behavior is unchanged.')
     parser.add_argument('--enable_thinking', action='store_true', help='HuggingFace only: pass enable_thinking=True to apply_chat_template (e.g. Qwen3 thinking mode). Default False.')
+    parser.add_argument('--no_kv_reuse', action='store_true', help='HuggingFace only: disable reusing the KV cache of the previous round (re-prefill the whole prompt every round).')
+    parser.add_argument('--no_early_stop', action='store_true', help='HuggingFace only: keep decoding after a complete tool call instead of stopping at it.')
+    parser.add_argument('--hf_batch_size', type=int, default=1, help='HuggingFace only: max sequences decoded together by the continuous-batching scheduler. 1 disables it.')
+    parser.add_argument('--constrained_decoding', action='store_true', help='HuggingFace only: constrain tool calls to the offered tool names and parameter schemas while decoding.')
+    parser.add_argument('--draft_model', type=str, default=None, help='HuggingFace only: small model sharing the tokenizer of --model (dir name under MODEL_DIR), used for assisted/speculative decoding.')
+    parser.add_argument('--hf_daemon_socket', type=str, nargs='?', const=DEFAULT_SOCKET, default='', help=f'HuggingFace only: Unix socket of a running run_hf_daemon.py (bare flag: {DEFAULT_SOCKET}); used instead of loading the model when it serves --model, with the daemon\'s generation options. Off by default.')
+    parser.add_argument('--no_prompt_caching', action='store_true', help='Anthropic only: do not set cache_control breakpoints on the tools, system prompt and latest message.')
     parser.add_argument('--openai_api', type=str, choices=['chat_completions', 'responses', 'responses_url'], default='chat_completions', help='Which OpenAI API mode to use (only for OpenAI models). responses_url: OpenAI server connects to the MCP server directly via --mcp_url. Default: chat_completions.')
+    parser.add_argument('--responses_stateful', action='store_true', help='--openai_api=responses only: keep the conversation on the server and send only new items with previous_response_id.')
+    parser.add_argument('--api_timeout', type=float, default=None, help='API backends: request timeout in seconds for all OpenAI / Anthropic calls (default: 60, 120 for responses_url, 600 for Anthropic).')
+    parser.add_argument('--api_max_retries', type=int, default=None, help='API backends: SDK retries per request (default: 3 for OpenAI, the SDK default of 2 for Anthropic).')
+    parser.add_argument('--api_max_connections', type=int, default=100, help='API backends: size of the shared HTTP connection pool.')
+    parser.add_argument('--api_http2', action='store_true', help='API backends: use HTTP/2 for the shared pool (needs the h2 package).')
+    parser.add_argument('--adaptive_concurrency', action='store_true', help='API backends: client-side AIMD concurrency limit per provider/model that honors retry-after and rate-limit headers (replaces the SDK retries).')
     parser.add_argument('--mcp_url', type=str, default=None, help='Public URL of the MCP server (required for --openai_api=responses_url).')
+    parser.add_argument('--stream', action='store_true', help='Requires --openai_api=responses_url: stream the response, print text as it arrives and log per-call timings of the server-side MCP items.')
     parser.add_argument('--mcp_label', type=str, default='custom', help='server_label exposed to OpenAI in responses_url mode.')
+    parser.add_argument('--tool_top_k', type=int, default=0, help='Offer only the k tools most relevant to the user message each round (BM25 over names, descriptions and parameters); tools already called are kept. 0 offers all tools.')
+    parser.add_argument('--compact_schemas', action='store_true', help='Compact tool input schemas (drop titles / null defaults, inline $defs, collapse Optional) before sending them; logs the token count before and after.')
+    parser.add_argument('--description_budget', type=int, default=None, help='With --compact_schemas: shorten tool and parameter descriptions to at most this many characters.')
+    parser.add_argument('--trace_file', type=str, default=None, help='Append per-round spans of the agent loop (backend call with token usage, argument coercion, MCP calls, message building) to this file and log a model/tools/overhead latency breakdown.')
+    parser.add_argument('--trace_format', type=str, choices=['jsonl', 'otlp'], default='jsonl', help='--trace_file format: one JSON object per span, or one OTLP/JSON ExportTraceServiceRequest per run.')
+    parser.add_argument('--log_format', type=str, choices=['text', 'jsonl'], default='text', help='Log file format: text (cur.log) or compact JSON lines with structured fields and per-round message deltas (cur.jsonl). Both are written by a background thread.')
+    parser.add_argument('--log_level', type=str, choices=['DEBUG', 'INFO', 'WARNING'], default='DEBUG', help='INFO drops the bulky per-round records (full HF prompt, raw model output, raw API responses) without formatting them.')
+    parser.add_argument('--profile', action='store_true', help='Sample Python stacks of all threads for the whole run, tagged by phase (startup, mcp_setup, build_tools, backend.complete, mcp.call_tool, ...); writes flamegraph-ready collapsed stacks and a per-phase wall/CPU table to --profile_dir.')
+    parser.add_argument('--profile_dir', type=str, default='profiles', help='Where --profile writes mcp_client-<pid>.collapsed / .phases.txt.')
     parser.add_argument('--enabled', type=str, default=None, help=f'Comma-separated list of MCP servers to enable. Default: {",".join(ENABLED_SERVERS)}.')
 
     parser.add_argument(
@@ -91,10 +93,15 @@ def parse_arguments(return_default: bool = False):
     return parser.parse_args()
 
 async def main():
-    logger = create_logger()
-
     args = parse_arguments()
 
+    logger = create_logger(
+        filename='cur.jsonl' if args.log_format == 'jsonl' else 'cur.log',
+        log_format=args.log_format,
+        level=args.log_level,
+    )
+    PROFILER.end("startup")
+
     llm_cfg = LLMConfig(
         temperature=args.temperature,
         max_new_tokens=256,
@@ -103,8 +110,19 @@ async def main():
 
     logger.info(f'[User Question] {args.user_message}')
 
-    backend = create_backend(
-        args.model,
+    configure_clients(
+        logger=logger,
+        timeout=args.api_timeout,
+        # With adaptive concurrency the limiter owns retries.
+        max_retries=0 if args.adaptive_concurrency else args.api_max_retries,
+        max_connections=args.api_max_connections,
+        http2=args.api_http2,
+    )
+    if args.adaptive_concurrency:
+        retries = OPENAI_MAX_RETRIES if args.api_max_retries is None else args.api_max_retries
+        configure_rate_control(max_attempts=retries + 1)
+
+    backend_options = dict(
         model_dir=MODEL_DIR,
         device=args.device,
         dtype=args.dtype,
@@ -114,20 +132,47 @@ async def main():
         openai_api=args.openai_api,
         mcp_url=args.mcp_url,
         mcp_label=args.mcp_label,
+        reuse_kv_cache=not args.no_kv_reuse,
+        early_stop_tool_calls=not args.no_early_stop,
+        hf_batch_size=args.hf_batch_size,
+        constrained_decoding=args.constrained_decoding,
+        draft_model=args.draft_model,
+        quantize=args.quantize,
+        num_threads=args.num_threads,
+        num_interop_threads=args.num_interop_threads,
+        hf_daemon_socket=args.hf_daemon_socket,
+        prompt_caching=not args.no_prompt_caching,
+        responses_stateful=args.responses_stateful,
+        stream=args.stream,
     )
+    if args.stream and args.openai_api != "responses_url":
+        raise ValueError("--stream requires --openai_api=responses_url")
+    with PROFILER.phase("backend_setup"):
+        if args.route:
+            if args.openai_api == "responses_url":
+                raise ValueError("--route cannot be combined with --openai_api=responses_url")
+            names = [n.strip() for n in args.route.split(",") if n.strip()]
+            backend = RouterBackend(
+                [create_backend(name, **backend_options) for name in names],
+                names,
+                hedge_after=args.hedge_after,
+            )
+        else:
+            backend = create_backend(args.model, **backend_options)
 
     if args.openai_api == "responses_url":
         # OpenAI server talks to the MCP server directly. No local MCP
         # connection, no client-side tool routing -- the backend makes a
         # single Responses API call and returns the final answer.
-        answer = backend.run(
-            system_message=args.system_message,
-            user_message=args.user_message,
-            max_new_tokens=llm_cfg.max_new_tokens,
-            temperature=llm_cfg.temperature,
-            seed=args.seed,
-            logger=logger,
-        )
+        with PROFILER.phase("backend.run"):
+            answer = backend.run(
+                system_message=args.system_message,
+                user_message=args.user_message,
+                max_new_tokens=llm_cfg.max_new_tokens,
+                temperature=llm_cfg.temperature,
+                seed=args.seed,
+                logger=logger,
+            )
     else:
         enabled = [s.strip() for s in args.enabled.split(",")] if args.enabled else list(ENABLED_SERVERS)
         mcp_cfg = McpConfig(
@@ -137,25 +182,57 @@ async def main():
             prefix_tools=True,
         )
 
+        PROFILER.begin("mcp_setup")
         async with MultiMcp(mcp_cfg.url_map, mcp_cfg.enabled) as mcp:
-            llm_tools = await build_tools(mcp, mcp_cfg)
+            PROFILER.end("mcp_setup")
+            with PROFILER.phase("build_tools"):
+                llm_tools = await build_tools(mcp, mcp_cfg)
+            if args.compact_schemas:
+                before = tool_token_counts(llm_tools, backend, args.model)
+                llm_tools = compact_llm_tools(llm_tools, args.description_budget)
+                after = tool_token_counts(llm_tools, backend, args.model)
+                for (name, old, method), (_, new, _) in zip(before, after):
+                    logger.info(f'Compacted tool schemas for {name}: {old} -> {new} tokens ({method})')
 
             logger.info(f'Available Tools:\n{llm_tools}\n')
 
-            answer = await run_agent(
-                backend=backend,
-                mcp=mcp,
-                llm_tools=llm_tools,
-                system_message=args.system_message,
-                user_message=args.user_message,
-                temperature=llm_cfg.temperature,
-                max_new_tokens=llm_cfg.max_new_tokens,
-                max_tool_rounds=llm_cfg.max_tool_rounds,
-                seed=args.seed,
-                logger=logger,
-            )
+            tracer = None
+            if args.trace_file or args.profile:
+                tracer = Tracer(args.trace_file, fmt=args.trace_format, logger=logger if args.trace_file else None)
+                if args.profile:
+                    tracer.add_listener(PROFILER.span_listener)
+            try:
+                with PROFILER.phase("run_agent"):
+                    answer = await run_agent(
+                        backend=backend,
+                        mcp=mcp,
+                        llm_tools=llm_tools,
+                        system_message=args.system_message,
+                        user_message=args.user_message,
+                        temperature=llm_cfg.temperature,
+                        max_new_tokens=llm_cfg.max_new_tokens,
+                        max_tool_rounds=llm_cfg.max_tool_rounds,
+                        seed=args.seed,
+                        logger=logger,
+                        registry=ToolRegistry(llm_tools),
+                        tool_selector=ToolSelector(llm_tools, args.tool_top_k) if args.tool_top_k > 0 else None,
+                        tracer=tracer,
+                    )
+            finally:
+                if tracer is not None:
+                    tracer.close()
 
     logger.info(f'Final Answer:\n{answer}')
+    for stats in limiter_stats():
+        logger.info(f'[rate] {stats}')
+    if isinstance(backend, RouterBackend):
+        for stats in backend.stats():
+            logger.info(f'[router] {stats}')
+        backend.close()
+    if args.profile:
+        PROFILER.stop()
+        paths = PROFILER.write(os.path.join(args.profile_dir, f'mcp_client-{os.getpid()}'))
+        logger.info(f'[profile] written to {", ".join(paths)}\n{PROFILER.table()}')
 
 if __name__ == "__main__":
     asyncio.run(main())
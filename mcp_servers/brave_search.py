@@ -10,6 +10,8 @@ from mcp.server.fastmcp import FastMCP
 from dotenv import load_dotenv
 import uvicorn
 
+from utils.profiling import server_profile
+
 load_dotenv("./secrets.env")
 
 server_name = "brave_search"
@@ -17,7 +19,10 @@ mcp = FastMCP(server_name, json_response=True)
 
 BRAVE_API_KEY = os.environ.get("BRAVE_API_KEY", "").strip()
 
-BRAVE_WEB_SEARCH_ENDPOINT = "https://api.search.brave.com/res/v1/web/search"
+# Override to point at a local stand-in (e.g. stubs/brave_api.py).
+BRAVE_WEB_SEARCH_ENDPOINT = os.environ.get(
+    "BRAVE_WEB_SEARCH_ENDPOINT", "https://api.search.brave.com/res/v1/web/search"
+).strip()
 
 # Keep enums intentionally small (representative 5).
 Country = Literal["US", "GB", "DE", "KR", "JP"]
@@ -186,11 +191,12 @@ def brave_web_search(
     return _extract_web_results(payload)
 
 
-def run_server(host: str = "127.0.0.1", port: int = 8001):
+def run_server(host: str = "127.0.0.1", port: int = 8001, profile: bool = False):
     print(f"[{server_name}] starting on {host}:{port}")
 
     app = mcp.streamable_http_app()
-    uvicorn.run(app, host=host, port=port)
+    with server_profile(server_name, profile):
+        uvicorn.run(app, host=host, port=port)
 
 if __name__ == "__main__":
     run_server()
\ No newline at end of file
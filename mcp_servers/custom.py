@@ -1,6 +1,8 @@
 from mcp.server.fastmcp import FastMCP
 import uvicorn
 
+from utils.profiling import server_profile
+
 server_name = "custom-server"
 mcp = FastMCP(server_name, json_response=True, stateless_http=True)
 
@@ -14,11 +16,12 @@ def get_weather() -> str:
     """Return current weather."""
     return "Sunny"
 
-def run_server(host: str = "127.0.0.1", port: int = 8001):
+def run_server(host: str = "127.0.0.1", port: int = 8001, profile: bool = False):
     print(f"[{server_name}] starting on {host}:{port}")
 
     app = mcp.streamable_http_app()
-    uvicorn.run(app, host=host, port=port)
+    with server_profile(server_name, profile):
+        uvicorn.run(app, host=host, port=port)
 
 if __name__ == "__main__":
     run_server()
\ No newline at end of file
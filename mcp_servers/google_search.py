@@ -11,6 +11,10 @@ HTTP MCP session and relay calls.
 
 Requires:
   - SERPAPI_API_KEY in secrets.env
+
+Set SERPAPI_MCP_URL to relay to a different endpoint instead (e.g. the
+offline stub in stubs/serpapi_mcp.py). A `{key}` placeholder in it is
+filled with SERPAPI_API_KEY.
 """
 
 import os
@@ -22,12 +26,16 @@ from mcp import ClientSession
 from mcp.client.streamable_http import streamable_http_client
 import uvicorn
 
+from utils.profiling import server_profile
+
 from dotenv import load_dotenv
 
 load_dotenv("./secrets.env")
 
 server_name = "google-search"
 
+SERPAPI_MCP_URL = "https://mcp.serpapi.com/{key}/mcp"
+
 
 class _UpstreamHolder:
     session: Optional[ClientSession] = None
@@ -43,7 +51,8 @@ async def lifespan(app):
     if not api_key:
         raise RuntimeError("SERPAPI_API_KEY must be set (e.g. in secrets.env).")
 
-    upstream_url = f"https://mcp.serpapi.com/{api_key}/mcp"
+    url_template = os.environ.get("SERPAPI_MCP_URL", "").strip() or SERPAPI_MCP_URL
+    upstream_url = url_template.format(key=api_key)
 
     _upstream.exit_stack = AsyncExitStack()
     read, write, _ = await _upstream.exit_stack.enter_async_context(
@@ -97,10 +106,11 @@ async def google_search(query: str, count: int = 5) -> str:
     return "\n".join(texts) if texts else ""
 
 
-def run_server(host: str = "127.0.0.1", port: int = 8004):
+def run_server(host: str = "127.0.0.1", port: int = 8004, profile: bool = False):
     print(f"[{server_name}] starting on {host}:{port}")
     app = mcp.streamable_http_app()
-    uvicorn.run(app, host=host, port=port)
+    with server_profile(server_name, profile):
+        uvicorn.run(app, host=host, port=port)
 
 
 if __name__ == "__main__":
@@ -13,9 +13,13 @@ for the lifetime of this process via FastMCP's lifespan. Each
 Requires:
   - Node.js / npx available on PATH
   - PERPLEXITY_API_KEY in secrets.env
+
+Set PERPLEXITY_MCP_COMMAND to spawn a different stdio server instead of
+npx (e.g. "python3 -m stubs.perplexity_mcp" for the offline stub).
 """
 
 import os
+import shlex
 from contextlib import AsyncExitStack, asynccontextmanager
 from typing import Optional
 
@@ -24,12 +28,16 @@ from mcp import ClientSession
 from mcp.client.stdio import StdioServerParameters, stdio_client
 import uvicorn
 
+from utils.profiling import server_profile
+
 from dotenv import load_dotenv
 
 load_dotenv("./secrets.env")
 
 server_name = "perplexity-search"
 
+PERPLEXITY_MCP_COMMAND = "npx -y @perplexity-ai/mcp-server"
+
 
 class _UpstreamHolder:
     session: Optional[ClientSession] = None
@@ -45,10 +53,14 @@ async def lifespan(app):
     if not api_key:
         raise RuntimeError("PERPLEXITY_API_KEY must be set (e.g. in secrets.env).")
 
+    command = shlex.split(
+        os.environ.get("PERPLEXITY_MCP_COMMAND", "").strip() or PERPLEXITY_MCP_COMMAND
+    )
+
     _upstream.exit_stack = AsyncExitStack()
     server_params = StdioServerParameters(
-        command="npx",
-        args=["-y", "@perplexity-ai/mcp-server"],
+        command=command[0],
+        args=command[1:],
         env={**os.environ, "PERPLEXITY_API_KEY": api_key},
     )
     read, write = await _upstream.exit_stack.enter_async_context(
@@ -99,10 +111,11 @@ async def perplexity_search(query: str, max_results: int = 5) -> str:
     return "\n".join(texts) if texts else ""
 
 
-def run_server(host: str = "127.0.0.1", port: int = 8003):
+def run_server(host: str = "127.0.0.1", port: int = 8003, profile: bool = False):
     print(f"[{server_name}] starting on {host}:{port}")
     app = mcp.streamable_http_app()
-    uvicorn.run(app, host=host, port=port)
+    with server_profile(server_name, profile):
+        uvicorn.run(app, host=host, port=port)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,118 @@
+"""
+Offline evaluation over the provider Batch APIs.
+
+Runs every question of an input file through the agent loop, but each
+round of all conversations goes out as one OpenAI / Anthropic batch (see
+utils/batch_engine.py). Much cheaper than mcp_client.py in a loop, at the
+cost of batch turnaround per round.
+
+Input: JSONL with {"user_message": ..., "id": ..., "system_message": ...}
+per line ("id" / "system_message" optional), or plain text with one
+question per line.
+
+Run:
+    python3 run_batch.py --model gpt-4o --input questions.jsonl --output answers.jsonl
+
+Re-running with the same --checkpoint resumes an interrupted run. Against
+the local stub (stubs/batch_api.py):
+    OPENAI_BASE_URL=http://127.0.0.1:9010/v1 OPENAI_API_KEY=stub \
+    python3 run_batch.py --model gpt-4o --input q.txt --poll_interval 0.5
+"""
+
+import argparse
+import asyncio
+import json
+from pathlib import Path
+
+from dotenv import load_dotenv
+load_dotenv("./secrets.env")
+
+from utils.batch_engine import BatchEngine, create_batch_backend, create_transport
+from utils.config import McpConfig
+from utils.logger import create_logger
+from utils.mcp_http import MultiMcp
+from utils.mcp_tools import ENABLED_SERVERS, MCP_URLS, TOOL_ALLOWLIST, build_tools
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--model', type=str, required=True, help='OpenAI or Anthropic model ID.')
+    parser.add_argument('--input', type=str, required=True, help='Questions: JSONL ({"user_message", "id", "system_message"}) or one per line.')
+    parser.add_argument('--output', type=str, default='batch_answers.jsonl', help='Where to write one JSON result per conversation.')
+    parser.add_argument('--checkpoint', type=str, default='batch_state.json', help='State file; resumed from if it exists.')
+    parser.add_argument('--poll_interval', type=float, default=30.0, help='Seconds between batch status polls.')
+    parser.add_argument('--max_tool_rounds', type=int, default=6, help='Maximum LLM rounds per conversation.')
+    parser.add_argument('--max_new_tokens', type=int, default=256)
+    parser.add_argument('--temperature', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tool_concurrency', type=int, default=16, help='Tool calls in flight at once per step.')
+    parser.add_argument('--system_message', type=str, default='', help='Default system message for questions without one.')
+    parser.add_argument('--enabled', type=str, default=None, help=f'Comma-separated list of MCP servers to enable. Default: {",".join(ENABLED_SERVERS)}.')
+
+    return parser.parse_args()
+
+
+def read_questions(path: str, default_system: str):
+    text = Path(path).read_text(encoding="utf-8")
+    for n, line in enumerate(l for l in text.splitlines() if l.strip()):
+        if path.endswith(".jsonl"):
+            item = json.loads(line)
+            yield str(item.get("id", n)), item["user_message"], item.get("system_message", default_system)
+        else:
+            yield str(n), line.strip(), default_system
+
+
+async def main():
+    args = parse_arguments()
+    logger = create_logger(filename='batch.log')
+
+    # Fails here, before any connection is made, for a model without a batch API.
+    transport = create_transport(args.model)
+    backend = create_batch_backend(args.model)
+    enabled = [s.strip() for s in args.enabled.split(",")] if args.enabled else list(ENABLED_SERVERS)
+    mcp_cfg = McpConfig(url_map=MCP_URLS, enabled=enabled, allowlist=TOOL_ALLOWLIST, prefix_tools=True)
+
+    async with MultiMcp(mcp_cfg.url_map, mcp_cfg.enabled) as mcp:
+        llm_tools = await build_tools(mcp, mcp_cfg)
+        engine = BatchEngine(
+            backend=backend,
+            transport=transport,
+            mcp=mcp,
+            llm_tools=llm_tools,
+            checkpoint_path=Path(args.checkpoint),
+            logger=logger,
+            max_tool_rounds=args.max_tool_rounds,
+            max_new_tokens=args.max_new_tokens,
+            temperature=args.temperature,
+            seed=args.seed,
+            poll_interval=args.poll_interval,
+            tool_concurrency=args.tool_concurrency,
+        )
+
+        if engine.checkpoint_path.exists():
+            engine.load()
+            logger.info(f'[batch] resuming {len(engine.conversations)} conversation(s) from {args.checkpoint}')
+        else:
+            for conv_id, user_message, system_message in read_questions(args.input, args.system_message):
+                engine.add(conv_id, user_message, system_message)
+            engine.save()
+
+        conversations = await engine.run()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        for c in conversations:
+            f.write(json.dumps({
+                "id": c.id,
+                "status": c.status,
+                "answer": c.answer,
+                "error": c.error,
+                "rounds": c.rounds,
+            }, ensure_ascii=False) + "\n")
+
+    done = sum(c.status == "done" for c in conversations)
+    logger.info(f'[batch] {done}/{len(conversations)} answered; results in {args.output}')
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+"""
+Long-lived local generation daemon.
+
+Loads a HuggingFace model once and serves HFBackend.complete over a Unix
+socket (see utils/hf_daemon.py). While it runs, `mcp_client.py --model
+<same model> --hf_daemon_socket` connects to it instead of loading the
+weights again, using this process's generation options.
+
+Run:
+    python3 run_hf_daemon.py --model Qwen/Qwen3.5-35B-A3B --device cuda:0
+
+Stop with Ctrl+C; the socket file is removed on exit.
+"""
+
+import argparse
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+load_dotenv("./secrets.env")
+
+from utils.backend import create_backend
+from utils.hf_daemon import DEFAULT_SOCKET, serve
+from utils.logger import create_logger
+
+MODEL_DIR = Path(os.environ.get("MODEL_DIR", "../hf_models/"))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--model', type=str, default='Qwen/Qwen3.5-35B-A3B', help='Model name (dir under MODEL_DIR).')
+    parser.add_argument('--socket', type=str, default=DEFAULT_SOCKET, help='Unix socket path to listen on.')
+    parser.add_argument('--device', type=str, default='cuda:0', help="Device to run. 'cpu' for CPU-only nodes.")
+    parser.add_argument('--dtype', type=str, default='auto', help="Model dtype")
+    parser.add_argument('--quantize', type=str, choices=['none', 'int8', 'int4'], default='none', help="Weight quantization.")
+    parser.add_argument('--num_threads', type=int, default=None, help="torch intra-op threads.")
+    parser.add_argument('--num_interop_threads', type=int, default=None, help="torch inter-op threads.")
+    parser.add_argument('--draft_model', type=str, default=None, help='Draft model for assisted decoding.')
+    parser.add_argument('--hf_batch_size', type=int, default=1, help='Continuous-batching width; >1 lets concurrent clients share decode steps.')
+    parser.add_argument('--no_kv_reuse', action='store_true', help='Disable KV cache reuse between rounds.')
+    parser.add_argument('--no_early_stop', action='store_true', help='Keep decoding after a complete tool call.')
+    parser.add_argument('--constrained_decoding', action='store_true', help='Constrain tool calls to the offered schemas.')
+    parser.add_argument('--writing_mode', action='store_true', help='Log raw output with special tokens.')
+    parser.add_argument('--enable_thinking', action='store_true', help='Pass enable_thinking=True to apply_chat_template.')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    logger = create_logger(filename='hf_daemon.log')
+
+    backend = create_backend(
+        args.model,
+        model_dir=MODEL_DIR,
+        device=args.device,
+        dtype=args.dtype,
+        logger=logger,
+        writing_mode=args.writing_mode,
+        enable_thinking=args.enable_thinking,
+        reuse_kv_cache=not args.no_kv_reuse,
+        early_stop_tool_calls=not args.no_early_stop,
+        hf_batch_size=args.hf_batch_size,
+        constrained_decoding=args.constrained_decoding,
+        draft_model=args.draft_model,
+        quantize=args.quantize,
+        num_threads=args.num_threads,
+        num_interop_threads=args.num_interop_threads,
+    )
+    serve(backend, args.model, socket_path=args.socket, logger=logger)
+
+
+if __name__ == "__main__":
+    main()
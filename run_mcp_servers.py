@@ -1,3 +1,4 @@
+import argparse
 import os
 import signal
 import sys
@@ -17,12 +18,15 @@ PORTS = {
 PARENT_PID = None
 procs = []
 
-def start_one(module_name: str, host: str, port: int):
+def start_one(module_name: str, host: str, port: int, profile: bool = False):
     signal.signal(signal.SIGINT, signal.SIG_IGN)
 
     mod = importlib.import_module(f"{SERVERS_PACKAGE}.{module_name}")
     try:
-        mod.run_server(host=host, port=port)
+        if profile:
+            mod.run_server(host=host, port=port, profile=True)
+        else:
+            mod.run_server(host=host, port=port)
     except KeyboardInterrupt:
         pass
 
@@ -53,8 +57,14 @@ def shutdown(signum, frame):
 
     sys.exit(0)
 
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profile', action='store_true', help="Run every server under the sampling profiler (utils/profiling.py); each writes profiles/<server>-<pid>.collapsed / .phases.txt on shutdown.")
+    return parser.parse_args()
+
 def main():
     global PARENT_PID, procs
+    args = parse_arguments()
     PARENT_PID = os.getpid()
 
     host = "127.0.0.1"
@@ -68,7 +78,7 @@ def main():
 
     for i, name in enumerate(modules):
         port = PORTS.get(name, 8100 + i)
-        p = mp.Process(target=start_one, args=(name, host, port))
+        p = mp.Process(target=start_one, args=(name, host, port, args.profile))
         p.start()
         procs.append(p)
         print(f"Started {name} pid={p.pid} on {host}:{port}")
@@ -0,0 +1,192 @@
+"""
+Shared behaviour for the offline upstream stubs.
+
+Every stub reads the same knobs from the environment (CLI flags of the
+individual stub override them):
+
+  STUB_LATENCY       per-request latency in milliseconds. One of
+                       "0"                 no delay (default)
+                       "const:50"          fixed 50 ms
+                       "uniform:20,200"    uniform between 20 and 200 ms
+                       "normal:120,30"     gaussian (mean, stddev), clipped at 0
+                       "lognormal:100,0.5" lognormal (median, sigma)
+                       "exp:80"            exponential with the given mean
+  STUB_ERROR_RATE    probability in [0, 1] that a request fails (default 0)
+  STUB_PAYLOADS      JSON / JSONL file of recorded payloads to replay.
+                     A JSON object is treated as {query: payload}; a list or
+                     JSONL file is replayed round-robin. Without it the stubs
+                     synthesize payloads.
+  STUB_RESULT_CHARS  description length of synthetic results (default 200)
+  STUB_SEED          RNG seed for reproducible latency / error sequences
+
+The perplexity stub is spawned by `mcp_servers/perplexity_search.py` as a
+stdio subprocess, so it picks these up from the proxy's environment.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+class StubError(RuntimeError):
+    """Injected upstream failure."""
+
+
+class LatencyModel:
+    def __init__(self, spec: str, rng: random.Random):
+        self.spec = spec
+        self._rng = rng
+
+        kind, _, params = spec.partition(":")
+        kind = kind.strip().lower()
+        values = [float(v) for v in params.split(",") if v.strip()]
+
+        if not params and kind.replace(".", "", 1).isdigit():
+            # Bare number is shorthand for const.
+            kind, values = "const", [float(kind)]
+
+        expected = {"const": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exp": 1}
+        if kind not in expected:
+            raise ValueError(f"Unknown latency distribution: {spec!r}")
+        if len(values) != expected[kind]:
+            raise ValueError(f"Latency '{kind}' expects {expected[kind]} value(s), got: {spec!r}")
+
+        self.kind = kind
+        self.values = values
+
+    def sample_ms(self) -> float:
+        v = self.values
+        if self.kind == "const":
+            ms = v[0]
+        elif self.kind == "uniform":
+            ms = self._rng.uniform(v[0], v[1])
+        elif self.kind == "normal":
+            ms = self._rng.gauss(v[0], v[1])
+        elif self.kind == "lognormal":
+            # median * exp(N(0, sigma)) keeps the first parameter intuitive.
+            ms = v[0] * self._rng.lognormvariate(0.0, v[1])
+        else:  # exp
+            ms = self._rng.expovariate(1.0 / v[0]) if v[0] > 0 else 0.0
+        return max(0.0, ms)
+
+
+class PayloadSource:
+    def __init__(self, path: Optional[str]):
+        self.by_query: Dict[str, Any] = {}
+        self.sequence: List[Any] = []
+        self._cursor = 0
+
+        if not path:
+            return
+
+        text = Path(path).read_text(encoding="utf-8")
+        if path.endswith(".jsonl"):
+            self.sequence = [json.loads(line) for line in text.splitlines() if line.strip()]
+            return
+
+        data = json.loads(text)
+        if isinstance(data, dict):
+            self.by_query = data
+            self.sequence = list(data.values())
+        elif isinstance(data, list):
+            self.sequence = data
+        else:
+            raise ValueError(f"Unsupported payload file layout: {path}")
+
+    def next(self, query: str) -> Optional[Any]:
+        """Recorded payload for `query`, or the next one round-robin. None if nothing recorded."""
+        if query in self.by_query:
+            return self.by_query[query]
+        if not self.sequence:
+            return None
+        payload = self.sequence[self._cursor % len(self.sequence)]
+        self._cursor += 1
+        return payload
+
+
+@dataclass
+class StubConfig:
+    latency: str = "0"
+    error_rate: float = 0.0
+    payloads: Optional[str] = None
+    result_chars: int = 200
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "StubConfig":
+        seed = os.environ.get("STUB_SEED", "").strip()
+        return cls(
+            latency=os.environ.get("STUB_LATENCY", "0").strip() or "0",
+            error_rate=float(os.environ.get("STUB_ERROR_RATE", "0") or 0),
+            payloads=os.environ.get("STUB_PAYLOADS", "").strip() or None,
+            result_chars=int(os.environ.get("STUB_RESULT_CHARS", "200") or 200),
+            seed=int(seed) if seed else None,
+        )
+
+    @staticmethod
+    def add_arguments(parser: argparse.ArgumentParser) -> None:
+        env = StubConfig.from_env()
+        parser.add_argument('--latency', type=str, default=env.latency, help='Latency distribution in ms (see stubs/_common.py).')
+        parser.add_argument('--error_rate', type=float, default=env.error_rate, help='Probability that a request fails.')
+        parser.add_argument('--payloads', type=str, default=env.payloads, help='JSON/JSONL file of recorded payloads to replay.')
+        parser.add_argument('--result_chars', type=int, default=env.result_chars, help='Description length of synthetic results.')
+        parser.add_argument('--seed', type=int, default=env.seed, help='RNG seed.')
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace) -> "StubConfig":
+        return cls(
+            latency=args.latency,
+            error_rate=args.error_rate,
+            payloads=args.payloads,
+            result_chars=args.result_chars,
+            seed=args.seed,
+        )
+
+
+class StubBehavior:
+    """Latency, error injection and payload replay for one stub process."""
+
+    def __init__(self, cfg: StubConfig):
+        if not 0.0 <= cfg.error_rate <= 1.0:
+            raise ValueError("error_rate must be within [0, 1].")
+        self.cfg = cfg
+        self._rng = random.Random(cfg.seed)
+        self.latency = LatencyModel(cfg.latency, self._rng)
+        self.payloads = PayloadSource(cfg.payloads)
+
+    async def delay(self) -> None:
+        ms = self.latency.sample_ms()
+        if ms > 0:
+            await asyncio.sleep(ms / 1000.0)
+
+    def should_fail(self) -> bool:
+        return self.cfg.error_rate > 0 and self._rng.random() < self.cfg.error_rate
+
+    async def before_request(self) -> None:
+        """Sleep for a sampled latency, then raise StubError with probability error_rate."""
+        await self.delay()
+        if self.should_fail():
+            raise StubError("Injected upstream failure (stub error_rate).")
+
+    def synthetic_results(self, query: str, count: int) -> List[Dict[str, Any]]:
+        slug = "-".join(query.lower().split())[:60] or "empty"
+        filler = (f"Synthetic snippet about {query}. " * (self.cfg.result_chars // 20 + 1))[: self.cfg.result_chars]
+        return [
+            {
+                "title": f"Result {i + 1} for {query}",
+                "url": f"https://example.com/{slug}/{i + 1}",
+                "description": filler,
+            }
+            for i in range(count)
+        ]
+
+    def describe(self) -> str:
+        return (
+            f"latency={self.cfg.latency} error_rate={self.cfg.error_rate} "
+            f"payloads={self.cfg.payloads or 'synthetic'} seed={self.cfg.seed}"
+        )
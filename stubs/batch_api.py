@@ -0,0 +1,282 @@
+"""
+Offline stand-in for the OpenAI Batch API and the Anthropic Message
+Batches API, enough for utils/batch_engine.py / run_batch.py.
+
+OpenAI:     POST /v1/files, GET /v1/files/{id}/content,
+            POST /v1/batches, GET /v1/batches/{id}
+Anthropic:  POST /v1/messages/batches, GET /v1/messages/batches/{id},
+            GET /v1/messages/batches/{id}/results
+
+Each batch "processes" for one sampled latency, then every request gets a
+scripted answer: if tools are offered and the conversation has no tool
+result yet, a call to the first tool with placeholder arguments built from
+its schema; otherwise a final text answer. Requests fail individually with
+probability error_rate.
+
+Run:
+    python3 -m stubs.batch_api --port 9010 --latency const:500
+
+Point the SDKs at it:
+    OPENAI_BASE_URL=http://127.0.0.1:9010/v1 OPENAI_API_KEY=stub
+    ANTHROPIC_BASE_URL=http://127.0.0.1:9010 ANTHROPIC_API_KEY=stub
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+import uvicorn
+
+from stubs._common import StubBehavior, StubConfig
+
+server_name = "batch-api-stub"
+
+
+def _placeholder_args(schema: Dict[str, Any]) -> Dict[str, Any]:
+    values = {"string": "stub", "integer": 1, "number": 1, "boolean": True, "array": [], "object": {}}
+    args = {}
+    props = schema.get("properties") or {}
+    for name in schema.get("required") or []:
+        prop = props.get(name) or {}
+        if prop.get("enum"):
+            args[name] = prop["enum"][0]
+        else:
+            args[name] = values.get(prop.get("type"), "stub")
+    return args
+
+
+def _openai_reply(body: Dict[str, Any]) -> Dict[str, Any]:
+    tools = body.get("tools") or []
+    tool_results = sum(m.get("role") == "tool" for m in body.get("messages", []))
+    message: Dict[str, Any] = {"role": "assistant", "content": None}
+    if tools and tool_results == 0:
+        fn = tools[0]["function"]
+        message["tool_calls"] = [{
+            "id": f"call_{uuid.uuid4().hex[:24]}",
+            "type": "function",
+            "function": {"name": fn["name"], "arguments": json.dumps(_placeholder_args(fn.get("parameters") or {}))},
+        }]
+        finish = "tool_calls"
+    else:
+        message["content"] = f"Stub answer after {tool_results} tool result(s)."
+        finish = "stop"
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "message": message, "finish_reason": finish}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+def _anthropic_reply(params: Dict[str, Any]) -> Dict[str, Any]:
+    tools = params.get("tools") or []
+    tool_results = sum(
+        1
+        for m in params.get("messages", [])
+        if isinstance(m.get("content"), list)
+        for b in m["content"]
+        if b.get("type") == "tool_result"
+    )
+    if tools and tool_results == 0:
+        content = [{
+            "type": "tool_use",
+            "id": f"toolu_{uuid.uuid4().hex[:24]}",
+            "name": tools[0]["name"],
+            "input": _placeholder_args(tools[0].get("input_schema") or {}),
+        }]
+        stop = "tool_use"
+    else:
+        content = [{"type": "text", "text": f"Stub answer after {tool_results} tool result(s)."}]
+        stop = "end_turn"
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": params.get("model", "stub"),
+        "content": content,
+        "stop_reason": stop,
+        "stop_sequence": None,
+        "usage": {"input_tokens": 0, "output_tokens": 0},
+    }
+
+
+def _iso(t: datetime) -> str:
+    return t.isoformat().replace("+00:00", "Z")
+
+
+def create_app(behavior: StubBehavior) -> Starlette:
+    files: Dict[str, bytes] = {}
+    openai_batches: Dict[str, Dict[str, Any]] = {}
+    anthropic_batches: Dict[str, Dict[str, Any]] = {}
+    anthropic_results: Dict[str, List[Dict[str, Any]]] = {}
+    tasks = set()  # keep references to the background "processing" tasks
+
+    def spawn(coro) -> None:
+        task = asyncio.create_task(coro)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    # ---- OpenAI -------------------------------------------------------------
+
+    async def upload_file(request: Request) -> JSONResponse:
+        form = await request.form()
+        upload = form["file"]
+        data = await upload.read()
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        files[file_id] = data
+        return JSONResponse({
+            "id": file_id,
+            "object": "file",
+            "bytes": len(data),
+            "created_at": int(time.time()),
+            "filename": upload.filename or "batch.jsonl",
+            "purpose": form.get("purpose", "batch"),
+            "status": "processed",
+        })
+
+    async def file_content(request: Request) -> Response:
+        file_id = request.path_params["file_id"]
+        if file_id not in files:
+            return JSONResponse({"error": {"message": f"No such file: {file_id}"}}, status_code=404)
+        return Response(files[file_id], media_type="application/jsonl")
+
+    async def process_openai(batch: Dict[str, Any]) -> None:
+        await behavior.delay()
+        out, err = [], []
+        for line in files[batch["input_file_id"]].decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            req = json.loads(line)
+            if behavior.should_fail():
+                err.append({
+                    "id": f"batch_req_{uuid.uuid4().hex[:16]}",
+                    "custom_id": req["custom_id"],
+                    "response": {"status_code": 500, "request_id": "", "body": {"error": {"message": "Injected failure (stub error_rate)."}}},
+                    "error": None,
+                })
+            else:
+                out.append({
+                    "id": f"batch_req_{uuid.uuid4().hex[:16]}",
+                    "custom_id": req["custom_id"],
+                    "response": {"status_code": 200, "request_id": "", "body": _openai_reply(req["body"])},
+                    "error": None,
+                })
+        for key, lines in (("output_file_id", out), ("error_file_id", err)):
+            if lines:
+                file_id = f"file-{uuid.uuid4().hex[:24]}"
+                files[file_id] = "".join(json.dumps(l) + "\n" for l in lines).encode("utf-8")
+                batch[key] = file_id
+        batch["request_counts"] = {"total": len(out) + len(err), "completed": len(out), "failed": len(err)}
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+
+    async def create_openai_batch(request: Request) -> JSONResponse:
+        body = await request.json()
+        if body.get("input_file_id") not in files:
+            return JSONResponse({"error": {"message": "input_file_id not found"}}, status_code=400)
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex[:24]}",
+            "object": "batch",
+            "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"],
+            "completion_window": body.get("completion_window", "24h"),
+            "status": "in_progress",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": int(time.time()),
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        openai_batches[batch["id"]] = batch
+        spawn(process_openai(batch))
+        return JSONResponse(batch)
+
+    async def get_openai_batch(request: Request) -> JSONResponse:
+        batch = openai_batches.get(request.path_params["batch_id"])
+        if batch is None:
+            return JSONResponse({"error": {"message": "No such batch"}}, status_code=404)
+        return JSONResponse(batch)
+
+    # ---- Anthropic ------------------------------------------------------------
+
+    async def process_anthropic(batch: Dict[str, Any], requests: List[Dict[str, Any]], results_url: str) -> None:
+        await behavior.delay()
+        results, counts = [], {"processing": 0, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+        for req in requests:
+            if behavior.should_fail():
+                result = {"type": "errored", "error": {"type": "error", "error": {"type": "api_error", "message": "Injected failure (stub error_rate)."}}}
+            else:
+                result = {"type": "succeeded", "message": _anthropic_reply(req["params"])}
+            counts[result["type"]] += 1
+            results.append({"custom_id": req["custom_id"], "result": result})
+        anthropic_results[batch["id"]] = results
+        batch["request_counts"] = counts
+        batch["processing_status"] = "ended"
+        batch["ended_at"] = _iso(datetime.now(timezone.utc))
+        batch["results_url"] = results_url
+
+    async def create_anthropic_batch(request: Request) -> JSONResponse:
+        body = await request.json()
+        now = datetime.now(timezone.utc)
+        batch = {
+            "id": f"msgbatch_{uuid.uuid4().hex[:24]}",
+            "type": "message_batch",
+            "processing_status": "in_progress",
+            "request_counts": {"processing": len(body["requests"]), "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0},
+            "created_at": _iso(now),
+            "expires_at": _iso(now + timedelta(hours=24)),
+            "ended_at": None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": None,
+        }
+        anthropic_batches[batch["id"]] = batch
+        results_url = f"{str(request.base_url).rstrip('/')}/v1/messages/batches/{batch['id']}/results"
+        spawn(process_anthropic(batch, body["requests"], results_url))
+        return JSONResponse(batch)
+
+    async def get_anthropic_batch(request: Request) -> JSONResponse:
+        batch = anthropic_batches.get(request.path_params["batch_id"])
+        if batch is None:
+            return JSONResponse({"type": "error", "error": {"type": "not_found_error", "message": "No such batch"}}, status_code=404)
+        return JSONResponse(batch)
+
+    async def anthropic_batch_results(request: Request) -> Response:
+        results = anthropic_results.get(request.path_params["batch_id"])
+        if results is None:
+            return JSONResponse({"type": "error", "error": {"type": "not_found_error", "message": "Results not ready"}}, status_code=404)
+        return Response("".join(json.dumps(r) + "\n" for r in results), media_type="application/x-jsonl")
+
+    return Starlette(routes=[
+        Route("/v1/files", upload_file, methods=["POST"]),
+        Route("/v1/files/{file_id}/content", file_content, methods=["GET"]),
+        Route("/v1/batches", create_openai_batch, methods=["POST"]),
+        Route("/v1/batches/{batch_id}", get_openai_batch, methods=["GET"]),
+        Route("/v1/messages/batches", create_anthropic_batch, methods=["POST"]),
+        Route("/v1/messages/batches/{batch_id}", get_anthropic_batch, methods=["GET"]),
+        Route("/v1/messages/batches/{batch_id}/results", anthropic_batch_results, methods=["GET"]),
+    ])
+
+
+def run_server(host: str = "127.0.0.1", port: int = 9010, cfg: StubConfig | None = None):
+    behavior = StubBehavior(cfg or StubConfig.from_env())
+    print(f"[{server_name}] starting on {host}:{port} ({behavior.describe()})")
+    uvicorn.run(create_app(behavior), host=host, port=port, log_level="warning")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=9010)
+    StubConfig.add_arguments(parser)
+    args = parser.parse_args()
+    run_server(host=args.host, port=args.port, cfg=StubConfig.from_args(args))
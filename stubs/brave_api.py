@@ -0,0 +1,86 @@
+"""
+Offline stand-in for the Brave Web Search REST API.
+
+Serves `GET /res/v1/web/search` with the same response shape the real API
+returns (`{"web": {"results": [...]}}`), which is all
+`mcp_servers/brave_search.py` reads.
+
+Run:
+    python3 -m stubs.brave_api --port 9002 --latency lognormal:150,0.4
+
+Point the real server at it (any non-empty key works):
+    BRAVE_API_KEY=stub \
+    BRAVE_WEB_SEARCH_ENDPOINT=http://127.0.0.1:9002/res/v1/web/search \
+    python3 run_mcp_servers.py
+"""
+
+import argparse
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+import uvicorn
+
+from stubs._common import StubBehavior, StubConfig, StubError
+
+server_name = "brave-api-stub"
+
+ERROR_STATUS = 503
+MAX_COUNT = 20  # the real API's limit
+
+
+def _validation_error(detail: str) -> JSONResponse:
+    # Same shape as the real API's 422 for a bad query parameter.
+    return JSONResponse(
+        {
+            "type": "ErrorResponse",
+            "error": {"status": 422, "code": "VALIDATION", "detail": detail},
+        },
+        status_code=422,
+    )
+
+
+def create_app(behavior: StubBehavior) -> Starlette:
+    async def web_search(request: Request) -> JSONResponse:
+        if not request.headers.get("X-Subscription-Token"):
+            return JSONResponse({"error": "missing X-Subscription-Token"}, status_code=401)
+
+        query = request.query_params.get("q", "")
+        try:
+            count = int(request.query_params.get("count", "10"))
+        except ValueError:
+            return _validation_error("count: value is not a valid integer")
+        if not 1 <= count <= MAX_COUNT:
+            return _validation_error(f"count: must be between 1 and {MAX_COUNT}")
+
+        try:
+            await behavior.before_request()
+        except StubError as e:
+            return JSONResponse({"error": str(e)}, status_code=ERROR_STATUS)
+
+        payload = behavior.payloads.next(query)
+        if payload is None:
+            payload = {
+                "type": "search",
+                "query": {"original": query},
+                "web": {"type": "search", "results": behavior.synthetic_results(query, count)},
+            }
+        return JSONResponse(payload)
+
+    return Starlette(routes=[Route("/res/v1/web/search", web_search, methods=["GET"])])
+
+
+def run_server(host: str = "127.0.0.1", port: int = 9002, cfg: StubConfig | None = None):
+    behavior = StubBehavior(cfg or StubConfig.from_env())
+    print(f"[{server_name}] starting on {host}:{port} ({behavior.describe()})")
+    uvicorn.run(create_app(behavior), host=host, port=port, log_level="warning")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=9002)
+    StubConfig.add_arguments(parser)
+    args = parser.parse_args()
+    run_server(host=args.host, port=args.port, cfg=StubConfig.from_args(args))
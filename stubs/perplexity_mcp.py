@@ -0,0 +1,48 @@
+"""
+Offline stand-in for `@perplexity-ai/mcp-server` (stdio transport).
+
+Not started by hand: `mcp_servers/perplexity_search.py` spawns it in place
+of npx when PERPLEXITY_MCP_COMMAND is set:
+
+    PERPLEXITY_API_KEY=stub \
+    PERPLEXITY_MCP_COMMAND="python3 -m stubs.perplexity_mcp" \
+    STUB_LATENCY=lognormal:800,0.5 \
+    python3 run_mcp_servers.py
+
+Behaviour is configured through the STUB_* environment variables (see
+stubs/_common.py), which the proxy passes through to the subprocess.
+stdout is the MCP channel, so diagnostics go to stderr only.
+"""
+
+import json
+import sys
+
+from mcp.server.fastmcp import FastMCP
+
+from stubs._common import StubBehavior, StubConfig
+
+server_name = "perplexity-stub"
+mcp = FastMCP(server_name)
+
+_behavior = StubBehavior(StubConfig.from_env())
+
+
+@mcp.tool()
+async def perplexity_search(query: str, max_results: int = 5) -> str:
+    """Search the web using (stubbed) Perplexity."""
+    await _behavior.before_request()
+
+    payload = _behavior.payloads.next(query)
+    if payload is None:
+        payload = {
+            "results": [
+                {"title": r["title"], "url": r["url"], "snippet": r["description"]}
+                for r in _behavior.synthetic_results(query, max_results)
+            ],
+        }
+    return payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    print(f"[{server_name}] serving on stdio ({_behavior.describe()})", file=sys.stderr)
+    mcp.run(transport="stdio")
@@ -0,0 +1,68 @@
+"""
+Offline stand-in for SerpAPI's hosted MCP server (Streamable HTTP).
+
+Exposes the `search` tool with the argument shape
+`mcp_servers/google_search.py` sends (`{"params": {"q", "engine", "num"},
+"mode"}`) and returns a JSON text blob with `organic_results`.
+
+Run:
+    python3 -m stubs.serpapi_mcp --port 9004 --latency uniform:100,400
+
+Point the real server at it:
+    SERPAPI_API_KEY=stub \
+    SERPAPI_MCP_URL=http://127.0.0.1:9004/mcp \
+    python3 run_mcp_servers.py
+"""
+
+import argparse
+import json
+from typing import Any, Dict
+
+from mcp.server.fastmcp import FastMCP
+import uvicorn
+
+from stubs._common import StubBehavior, StubConfig
+
+server_name = "serpapi-stub"
+mcp = FastMCP(server_name, json_response=True, stateless_http=True)
+
+_behavior = StubBehavior(StubConfig.from_env())
+
+
+@mcp.tool()
+async def search(params: Dict[str, Any], mode: str = "complete") -> str:
+    """Search via the (stubbed) SerpAPI engines."""
+    # StubError propagates and FastMCP turns it into an isError tool result,
+    # which is what a failing upstream call looks like to the proxy.
+    await _behavior.before_request()
+
+    query = str(params.get("q", ""))
+    payload = _behavior.payloads.next(query)
+    if payload is None:
+        results = _behavior.synthetic_results(query, int(params.get("num", 5)))
+        payload = {
+            "search_parameters": {"q": query, "engine": params.get("engine", "google")},
+            "organic_results": [
+                {"position": i + 1, "title": r["title"], "link": r["url"], "snippet": r["description"]}
+                for i, r in enumerate(results)
+            ],
+        }
+    return payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+
+
+def run_server(host: str = "127.0.0.1", port: int = 9004, cfg: StubConfig | None = None):
+    global _behavior
+    if cfg is not None:
+        _behavior = StubBehavior(cfg)
+    print(f"[{server_name}] starting on {host}:{port} ({_behavior.describe()})")
+    app = mcp.streamable_http_app()
+    uvicorn.run(app, host=host, port=port, log_level="warning")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=9004)
+    StubConfig.add_arguments(parser)
+    args = parser.parse_args()
+    run_server(host=args.host, port=args.port, cfg=StubConfig.from_args(args))
@@ -0,0 +1,128 @@
+from utils.router_backend import RouterBackend
+from utils.schema_compact import compact_schema, tool_token_counts
+
+
+def test_data_keywords_are_copied_unchanged():
+    schema = {
+        "type": "object",
+        "title": "Args",
+        "properties": {
+            "title": {"type": "string", "title": "Title"},
+            "opts": {"type": "object", "default": {"title": "keepme", "default": None}},
+            "mode": {"enum": [None, {"title": "x"}], "default": None},
+            "fixed": {"const": {"title": "y"}, "examples": [{"title": "z"}]},
+        },
+        "required": ["title", "opts", "mode", "fixed"],
+    }
+    assert compact_schema(schema) == {
+        "type": "object",
+        "properties": {
+            "title": {"type": "string"},
+            "opts": {"type": "object", "default": {"title": "keepme", "default": None}},
+            "mode": {"enum": [None, {"title": "x"}]},
+            "fixed": {"const": {"title": "y"}, "examples": [{"title": "z"}]},
+        },
+        "required": ["title", "opts", "mode", "fixed"],
+    }
+
+
+def test_small_and_single_use_defs_are_inlined():
+    schema = {
+        "type": "object",
+        "properties": {
+            "unit": {"$ref": "#/$defs/Unit", "description": "Temperature unit"},
+            "a": {"$ref": "#/$defs/Point"},
+            "b": {"$ref": "#/$defs/Point"},
+        },
+        "required": ["unit", "a", "b"],
+        "$defs": {
+            "Unit": {"enum": ["c", "f"], "title": "Unit", "type": "string"},
+            "Point": {"type": "object", "title": "Point", "properties": {"x": {"type": "number"}}},
+            "Unused": {"type": "string"},
+        },
+    }
+    point = {"type": "object", "properties": {"x": {"type": "number"}}}
+    assert compact_schema(schema) == {
+        "type": "object",
+        "properties": {
+            "unit": {"enum": ["c", "f"], "type": "string", "description": "Temperature unit"},
+            "a": point,
+            "b": point,
+        },
+        "required": ["unit", "a", "b"],
+    }
+
+
+def test_large_shared_defs_stay_refs_and_identical_ones_merge():
+    big = {"type": "object", "description": "x" * 250, "properties": {"a": {"type": "string"}}}
+    schema = {
+        "type": "object",
+        "properties": {name: {"$ref": f"#/$defs/{ref}"} for name, ref in
+                       (("p", "Big1"), ("q", "Big1"), ("r", "Big2"), ("s", "Big2"))},
+        "required": ["p", "q", "r", "s"],
+        "$defs": {"Big1": big, "Big2": dict(big)},
+    }
+    out = compact_schema(schema)
+    assert out["$defs"] == {"Big1": big}
+    assert {p["$ref"] for p in out["properties"].values()} == {"#/$defs/Big1"}
+
+
+def test_recursive_defs_stay_refs():
+    schema = {
+        "type": "object",
+        "properties": {"root": {"$ref": "#/$defs/Node"}},
+        "required": ["root"],
+        "$defs": {
+            "Node": {
+                "type": "object",
+                "title": "Node",
+                "properties": {
+                    "value": {"type": "integer"},
+                    "child": {"anyOf": [{"$ref": "#/$defs/Node"}, {"type": "null"}], "default": None},
+                },
+                "required": ["value"],
+            },
+        },
+    }
+    assert compact_schema(schema) == {
+        "type": "object",
+        "properties": {"root": {"$ref": "#/$defs/Node"}},
+        "required": ["root"],
+        "$defs": {
+            "Node": {
+                "type": "object",
+                "properties": {"value": {"type": "integer"}, "child": {"$ref": "#/$defs/Node"}},
+                "required": ["value"],
+            },
+        },
+    }
+
+
+def test_optional_anyof_collapses_only_when_omittable():
+    nullable_int = {"anyOf": [{"type": "integer"}, {"type": "null"}], "default": None, "title": "N"}
+    schema = {
+        "type": "object",
+        "properties": {
+            "opt": dict(nullable_int, description="How many"),
+            "req": dict(nullable_int),
+            "multi": {"anyOf": [{"type": "integer"}, {"type": "string"}, {"type": "null"}]},
+        },
+        "required": ["req"],
+    }
+    assert compact_schema(schema)["properties"] == {
+        "opt": {"type": "integer", "description": "How many"},
+        "req": {"anyOf": [{"type": "integer"}, {"type": "null"}]},
+        "multi": {"anyOf": [{"type": "integer"}, {"type": "string"}, {"type": "null"}]},
+    }
+
+
+def test_token_counts_are_per_routed_backend():
+    class Fake:
+        def __init__(self, model):
+            self.model = model
+
+    router = RouterBackend([Fake("claude-x"), Fake("claude-y")], ["claude-x", "claude-y"])
+    tools = [{"type": "function", "function": {"name": "a", "description": "", "parameters": {}}}]
+    counts = tool_token_counts(tools, router, "claude-x,claude-y")
+    assert [(name, method) for name, _, method in counts] == [("claude-x", "chars/4"), ("claude-y", "chars/4")]
+    router.close()
@@ -0,0 +1,89 @@
+from utils.tool_parser import StreamingToolCallParser, parse_tool_calls
+
+
+def _calls(text):
+    calls, errors = parse_tool_calls(text)
+    return [(c.name, c.args, c.fmt) for c in calls], [e.message for e in errors]
+
+
+def test_llama_python_tag():
+    text = '<|python_tag|>{"name": "custom__add", "parameters": {"a": 1, "b": 2}}'
+    assert _calls(text) == ([("custom__add", {"a": 1, "b": 2}, "llama")], [])
+
+
+def test_llama_bare_json_output():
+    text = '  {"name": "custom__add", "parameters": {"a": 1, "b": "{x}"}}'
+    assert _calls(text) == ([("custom__add", {"a": 1, "b": "{x}"}, "llama")], [])
+
+
+def test_hermes_tool_call():
+    text = 'Let me check.\n<tool_call>\n{"name": "search__web", "arguments": {"q": "a } b"}}\n</tool_call>'
+    assert _calls(text) == ([("search__web", {"q": "a } b"}, "hermes")], [])
+
+
+def test_qwen_xml_inside_and_outside_tool_call():
+    text = (
+        "<tool_call><function=custom__add><parameter=a>1</parameter>"
+        "<parameter=b>\n2\n</parameter></function></tool_call>"
+        "<function=custom__echo><parameter=text>hi</parameter></function>"
+    )
+    assert _calls(text) == (
+        [("custom__add", {"a": "1", "b": "2"}, "xml"), ("custom__echo", {"text": "hi"}, "xml")],
+        [],
+    )
+
+
+def test_multiple_calls_in_order():
+    text = (
+        '<tool_call>{"name": "a", "arguments": {}}</tool_call>\n'
+        '<tool_call>{"name": "b", "arguments": {"n": 1}}</tool_call>'
+    )
+    calls, errors = parse_tool_calls(text)
+    assert [c.name for c in calls] == ["a", "b"]
+    assert calls[0].end <= calls[1].start
+    assert errors == []
+
+
+def test_think_block_is_skipped():
+    text = (
+        '<think>maybe <tool_call>{"name": "wrong", "arguments": {}}</tool_call></think>'
+        '<tool_call>{"name": "right", "arguments": {}}</tool_call>'
+    )
+    assert _calls(text) == ([("right", {}, "hermes")], [])
+
+
+def test_braces_in_prose_are_not_errors():
+    assert _calls("Use {braces} like {this} in templates.") == ([], [])
+    assert _calls("<think>{not json}</think>The answer is {42}.") == ([], [])
+
+
+def test_json_after_prose_is_the_fallback():
+    text = 'Calling it now: {"name": "custom__add", "arguments": {"a": 1}} done'
+    assert _calls(text) == ([("custom__add", {"a": 1}, "json")], [])
+
+
+def test_unterminated_calls_are_reported():
+    assert _calls('<tool_call>{"name": "a", "arguments": {')[1] == ["unterminated JSON tool call"]
+    assert _calls("<function=a><parameter=x>1</parameter>")[1] == [
+        "unterminated <function=... (no </function>)"
+    ]
+    assert _calls('<tool_call>{"name": "a", "arguments": {"x": 1,}}</tool_call>')[1][0].startswith("invalid JSON")
+
+
+def test_fed_one_character_at_a_time():
+    text = (
+        "<think>{skip}</think>Sure. "
+        '<|python_tag|>{"name": "a", "parameters": {"s": "<tool_call>"}}'
+        '<tool_call>{"name": "b", "arguments": {}}</tool_call>'
+        "<function=c><parameter=x>1</parameter></function>"
+    )
+    parser = StreamingToolCallParser()
+    emitted = []
+    for ch in text:
+        emitted += [c.name for c in parser.feed(ch)]
+    emitted += [c.name for c in parser.close()]
+    assert emitted == ["a", "b", "c"]
+    assert parser.errors == []
+    assert [(c.name, c.args) for c in parser.calls] == [
+        (name, args) for name, args, _ in _calls(text)[0]
+    ]
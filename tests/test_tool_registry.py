@@ -0,0 +1,40 @@
+from utils.tool_registry import ToolRegistry
+
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "a": {"type": "integer"},
+        "unit": {"type": "string", "enum": ["c", "f"]},
+        "values": {"type": "array", "items": {"type": "number"}},
+    },
+    "required": ["a"],
+}
+
+REGISTRY = ToolRegistry([
+    {"type": "function", "function": {"name": "custom__calc", "description": "", "parameters": SCHEMA}},
+])
+
+
+def test_coerced_arguments_pass_validation():
+    entry = REGISTRY.resolve("custom__calc")
+    args = entry.coerce({"a": "3", "unit": "c", "values": "[1, 2.5]"})
+    assert args == {"a": 3, "unit": "c", "values": [1, 2.5]}
+    assert entry.validate(args) == []
+
+
+def test_validation_reports_schema_violations():
+    entry = REGISTRY.resolve("custom__calc")
+    problems = entry.validate(entry.coerce({"a": "x", "unit": "k", "values": [1, "z"]}))
+    assert problems == [
+        "arguments.a: expected integer, got str",
+        "arguments.unit: 'k' is not one of ['c', 'f']",
+        "arguments.values[1]: expected number, got str",
+    ]
+    assert entry.validate({}) == ["arguments: missing required property 'a'"]
+
+
+def test_unknown_tool_is_routed_by_prefix_unchecked():
+    entry = REGISTRY.resolve("search__made_up")
+    assert (entry.server, entry.tool) == ("search", "made_up")
+    assert entry.validate({"anything": 1}) == []
@@ -0,0 +1,38 @@
+from utils.backend import ToolCall
+from utils.router_backend import RouterBackend
+from utils.tool_selection import ToolSelector, called_tool_names
+
+
+def _tool(name, description):
+    return {
+        "type": "function",
+        "function": {"name": name, "description": description, "parameters": {"type": "object", "properties": {}}},
+    }
+
+
+TOOLS = [
+    _tool("custom__add", "Add two given integers"),
+    _tool("custom__get_weather", "Return current weather"),
+    _tool("search__web_search", "Search the web for pages"),
+]
+
+
+def test_called_tool_names_reads_router_items():
+    router = RouterBackend([], [])
+    tc = ToolCall(id="call_0", name="custom__get_weather", args={})
+    messages = [router.build_tool_call_message(tc), router.build_tool_result_message(tc, "Sunny")]
+    assert called_tool_names(messages) == {"custom__get_weather"}
+    router.close()
+
+
+def test_called_tool_stays_offered_under_router():
+    router = RouterBackend([], [])
+    selector = ToolSelector(TOOLS, top_k=1)
+    messages = [{"role": "user", "content": "please add two integers"}]
+    assert [t["function"]["name"] for t in selector.select(messages)] == ["custom__add"]
+
+    tc = ToolCall(id="call_0", name="search__web_search", args={})
+    messages += [router.build_tool_call_message(tc), router.build_tool_result_message(tc, "...")]
+    names = [t["function"]["name"] for t in selector.select(messages)]
+    assert names == ["custom__add", "search__web_search"]
+    router.close()
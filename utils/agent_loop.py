@@ -1,8 +1,13 @@
-import json
-from typing import Any, Dict, List
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
 
 from utils.prompting import build_initial_messages
-from utils.misc import split_prefixed, extract_tool_result_text, preprocess_by_schema
+from utils.logger import log_event
+from utils.misc import extract_tool_result_text, invalid_arguments_text
+from utils.tool_registry import ToolRegistry
+from utils.tool_selection import ToolSelector
+from utils.tracing import NULL_TRACER
 
 
 async def run_agent(
@@ -17,46 +22,90 @@ async def run_agent(
     max_tool_rounds: int,
     seed: int = 0,
     logger: Any = None,
+    registry: Optional[ToolRegistry] = None,
+    tool_selector: Optional[ToolSelector] = None,
+    tracer: Any = None,
 ) -> str:
-    messages = build_initial_messages(
-        system_message=system_message,
-        user_message=user_message,
-    )
-
-    for round_num in range(1, max_tool_rounds + 1):
-        logger.info(f"[ROUND {round_num}] START\n")
-        logger.info(f"[ROUND {round_num}] LLM Input:\n{json.dumps(messages, indent=2, ensure_ascii=False)}\n")
-
-        response = backend.complete(
-            messages,
-            llm_tools,
-            max_new_tokens=max_new_tokens,
-            temperature=temperature,
-            seed=seed,
-            logger=logger,
+    if registry is None:
+        registry = ToolRegistry(llm_tools)
+    if tracer is None:
+        tracer = NULL_TRACER
+
+    with tracer.span("run", model=getattr(backend, "model", type(backend).__name__)) as run_span:
+        messages = build_initial_messages(
+            system_message=system_message,
+            user_message=user_message,
         )
+        logged = 0  # messages[:logged] are already in the log
 
-        if response.tool_call is None:
-            return response.content or ""
+        for round_num in range(1, max_tool_rounds + 1):
+            with tracer.span("round", round=round_num):
+                logger.info(f"[ROUND {round_num}] START\n")
+                # Only the messages appended since the last round, so the log
+                # grows linearly with the conversation instead of quadratically.
+                log_event(
+                    logger, logging.INFO, f"[ROUND {round_num}] LLM Input (+{len(messages) - logged} messages):",
+                    data=messages[logged:], round=round_num, total_messages=len(messages),
+                )
+                logged = len(messages)
 
-        tc = response.tool_call
-        server, raw_tool = split_prefixed(tc.name)
+                round_tools = llm_tools
+                if tool_selector is not None:
+                    with tracer.span("tool_selection") as span:
+                        round_tools = tool_selector.select(messages)
+                        span.set(offered=len(round_tools), total=len(llm_tools))
+                    if logger.isEnabledFor(logging.INFO):
+                        logger.info(
+                            f"[ROUND {round_num}] Tools offered ({len(round_tools)}/{len(llm_tools)}): "
+                            f"{[t['function']['name'] for t in round_tools]}"
+                        )
 
-        tool_schema = next(
-            (t["function"]["parameters"] for t in llm_tools if t["function"]["name"] == tc.name),
-            None,
-        )
-        tool_args = preprocess_by_schema(tc.args, tool_schema) if tool_schema else tc.args
+                # Run the (blocking) backend call in a worker thread so concurrent
+                # run_agent sessions in one event loop overlap -- e.g. an HFBackend
+                # with a GenerationScheduler batches their rounds together.
+                with tracer.span("backend.complete", messages=len(messages), tools=len(round_tools)) as span:
+                    response = await asyncio.to_thread(
+                        backend.complete,
+                        messages,
+                        round_tools,
+                        max_new_tokens=max_new_tokens,
+                        temperature=temperature,
+                        seed=seed,
+                        logger=logger,
+                    )
+                    span.set(kind="answer" if response.tool_call is None else "tool_call")
+                    if response.usage:
+                        span.set(usage=dict(response.usage))
+
+                if response.tool_call is None:
+                    run_span.set(rounds=round_num)
+                    return response.content or ""
+
+                tc = response.tool_call
+                with tracer.span("coerce_args", tool=tc.name):
+                    entry = registry.resolve(tc.name)
+                    tool_args = entry.coerce(tc.args)
+                    problems = entry.validate(tool_args)
 
-        logger.info(f"[ROUND {round_num}] TOOL: {tc.name}")
-        logger.info(f"[ROUND {round_num}] ARGS: {json.dumps(tool_args, ensure_ascii=False)}")
+                logger.info(f"[ROUND {round_num}] TOOL: {tc.name}")
+                log_event(logger, logging.INFO, f"[ROUND {round_num}] ARGS:", data=tool_args, round=round_num, tool=tc.name)
 
-        result = await mcp.call_tool(server, raw_tool, tool_args)
-        result_text = extract_tool_result_text(result.model_dump())
+                if problems:
+                    # Hand the schema violations back to the model instead
+                    # of spending an MCP round trip on a call that will fail.
+                    result_text = invalid_arguments_text(tc.name, problems)
+                else:
+                    with tracer.span("mcp.call_tool", server=entry.server, tool=entry.tool):
+                        result = await mcp.call_tool(entry.server, entry.tool, tool_args)
+                    with tracer.span("extract_result") as span:
+                        result_text = extract_tool_result_text(result)
+                        span.set(chars=len(result_text))
 
-        logger.info(f"[ROUND {round_num}] RESULT:\n{result_text}\n")
+                log_event(logger, logging.INFO, f"[ROUND {round_num}] RESULT:", data=result_text, round=round_num, tool=tc.name)
 
-        messages.append(backend.build_tool_call_message(tc))
-        messages.append(backend.build_tool_result_message(tc, result_text))
+                with tracer.span("build_messages"):
+                    messages.append(backend.build_tool_call_message(tc))
+                    messages.append(backend.build_tool_result_message(tc, result_text))
 
-    raise RuntimeError("Tool calling rounds exceeded.")
+        run_span.set(rounds=max_tool_rounds)
+        raise RuntimeError("Tool calling rounds exceeded.")
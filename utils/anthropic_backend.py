@@ -4,14 +4,46 @@ from typing import Any, Dict, List, Optional
 import anthropic
 
 from utils.backend import ToolCall, ChatResponse
+from utils.clients import get_anthropic_client
+from utils.rate_control import limited_create
+
+
+_EPHEMERAL = {"type": "ephemeral"}
+
+
+def _with_cache_breakpoint(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of `message` with cache_control on its last content block."""
+    content = message["content"]
+    if isinstance(content, str):
+        blocks = [{"type": "text", "text": content}]
+    else:
+        blocks = list(content)
+    if not blocks:
+        return message
+    blocks[-1] = {**blocks[-1], "cache_control": _EPHEMERAL}
+    return {**message, "content": blocks}
 
 
 @dataclass
 class AnthropicBackend:
+    """
+    Anthropic Messages API backend.
+
+    With `prompt_caching` (default), cache breakpoints are set on the tool
+    list, the system prompt and the latest message. Each round then reads
+    the previous round's prefix from the cache, and only the newly appended
+    tool call / result is billed and prefilled in full. Prefixes shorter
+    than the model's minimum cacheable length are simply not cached.
+    """
+
     model: str
+    prompt_caching: bool = True
     _client: anthropic.Anthropic = field(
-        default_factory=anthropic.Anthropic, init=False, repr=False
+        default_factory=get_anthropic_client, init=False, repr=False
     )
+    # Converted tool list, reused while the caller passes the same list.
+    _tools_src: Optional[List[Dict[str, Any]]] = field(default=None, init=False, repr=False)
+    _tools: List[Dict[str, Any]] = field(default_factory=list, init=False, repr=False)
 
     def complete(
         self,
@@ -23,19 +55,34 @@ class AnthropicBackend:
         seed: int,  # not supported by Anthropic; ignored
         logger: Any,
     ) -> ChatResponse:
+        kwargs = self.build_request(
+            messages, tools, max_new_tokens=max_new_tokens, temperature=temperature, seed=seed
+        )
+        resp = limited_create(self._client.messages, provider="anthropic", model=self.model, logger=logger, **kwargs)
+        return self.parse_response(resp, logger)
+
+    def build_request(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: Optional[List[Dict[str, Any]]],
+        *,
+        max_new_tokens: int,
+        temperature: float,
+        seed: int = 0,  # not supported by Anthropic; ignored
+    ) -> Dict[str, Any]:
+        """Messages API request body (also used as batch `params`)."""
         system = next(
             (m["content"] for m in messages if m["role"] == "system"), ""
         )
         non_system = [m for m in messages if m["role"] != "system"]
 
-        anthropic_tools = [
-            {
-                "name": t["function"]["name"],
-                "description": t["function"]["description"],
-                "input_schema": t["function"]["parameters"],
-            }
-            for t in (tools or [])
-        ]
+        anthropic_tools = self._convert_tools(tools)
+
+        if self.prompt_caching:
+            if system:
+                system = [{"type": "text", "text": system, "cache_control": _EPHEMERAL}]
+            if non_system:
+                non_system = non_system[:-1] + [_with_cache_breakpoint(non_system[-1])]
 
         kwargs: Dict[str, Any] = dict(
             model=self.model,
@@ -46,21 +93,54 @@ class AnthropicBackend:
         )
         if anthropic_tools:
             kwargs["tools"] = anthropic_tools
+        return kwargs
 
-        resp = self._client.messages.create(**kwargs)
-        logger.info(f"Raw API Response:\n{resp.content}\n")
+    def parse_response(self, resp: Any, logger: Any) -> ChatResponse:
+        """`resp` is an anthropic Message, or its JSON body (batch results)."""
+        if isinstance(resp, dict):
+            resp = anthropic.types.Message.model_validate(resp)
+        logger.debug("Raw API Response:\n%s\n", resp.content)
+
+        usage = {
+            "input_tokens": resp.usage.input_tokens,
+            "output_tokens": resp.usage.output_tokens,
+            "cache_creation_input_tokens": getattr(resp.usage, "cache_creation_input_tokens", None) or 0,
+            "cache_read_input_tokens": getattr(resp.usage, "cache_read_input_tokens", None) or 0,
+        }
+        logger.info(
+            f"Usage: input={usage['input_tokens']} output={usage['output_tokens']} "
+            f"cache_write={usage['cache_creation_input_tokens']} "
+            f"cache_read={usage['cache_read_input_tokens']}"
+        )
 
         for block in resp.content:
             if block.type == "tool_use":
                 return ChatResponse(
                     content=None,
                     tool_call=ToolCall(id=block.id, name=block.name, args=block.input),
+                    usage=usage,
                 )
 
         text = next(
             (block.text for block in resp.content if block.type == "text"), ""
         )
-        return ChatResponse(content=text.strip(), tool_call=None)
+        return ChatResponse(content=text.strip(), tool_call=None, usage=usage)
+
+    def _convert_tools(self, tools: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        if tools is not self._tools_src:
+            self._tools_src = tools
+            self._tools = [
+                {
+                    "name": t["function"]["name"],
+                    "description": t["function"]["description"],
+                    "input_schema": t["function"]["parameters"],
+                }
+                for t in (tools or [])
+            ]
+            if self.prompt_caching and self._tools:
+                # Tools come first in the prompt; one breakpoint covers them all.
+                self._tools[-1] = {**self._tools[-1], "cache_control": _EPHEMERAL}
+        return self._tools
 
     def build_tool_call_message(self, tc: ToolCall) -> Dict[str, Any]:
         return {
@@ -16,6 +16,9 @@ class ToolCall:
 class ChatResponse:
     content: Optional[str]
     tool_call: Optional[ToolCall]
+    # Token counts of this call: input_tokens / output_tokens, plus
+    # provider-specific extras (e.g. cache_read_input_tokens).
+    usage: Optional[Dict[str, Any]] = None
 
 
 def _is_openai_model(name: str) -> bool:
@@ -39,11 +42,23 @@ def create_backend(
     mcp_url: Optional[str] = None,
     mcp_label: str = "custom",
     mcp_allowed_tools: Optional[List[str]] = None,
+    reuse_kv_cache: bool = True,
+    early_stop_tool_calls: bool = True,
+    hf_batch_size: int = 1,
+    constrained_decoding: bool = False,
+    draft_model: Optional[str] = None,
+    quantize: str = "none",
+    num_threads: Optional[int] = None,
+    num_interop_threads: Optional[int] = None,
+    hf_daemon_socket: Optional[str] = None,
+    prompt_caching: bool = True,
+    responses_stateful: bool = False,
+    stream: bool = False,
 ) -> Any:
     if _is_openai_model(model_name):
         if openai_api == "responses":
             from utils.openai_responses_backend import OpenAIResponsesBackend
-            return OpenAIResponsesBackend(model_name)
+            return OpenAIResponsesBackend(model_name, stateful=responses_stateful)
         if openai_api == "responses_url":
             if not mcp_url:
                 raise ValueError("--mcp_url is required when --openai_api=responses_url")
@@ -53,18 +68,51 @@ def create_backend(
                 mcp_url=mcp_url,
                 mcp_label=mcp_label,
                 allowed_tools=mcp_allowed_tools,
+                stream=stream,
             )
         from utils.openai_backend import OpenAIBackend
         return OpenAIBackend(model_name)
 
     if _is_anthropic_model(model_name):
         from utils.anthropic_backend import AnthropicBackend
-        return AnthropicBackend(model_name)
+        return AnthropicBackend(model_name, prompt_caching=prompt_caching)
+
+    # HuggingFace local model: with --hf_daemon_socket, prefer a running
+    # daemon that already holds it.
+    if hf_daemon_socket:
+        from utils.hf_daemon import DaemonBackend, daemon_available
+        if daemon_available(hf_daemon_socket, model_name):
+            if logger:
+                logger.info(
+                    f"Using HF daemon at {hf_daemon_socket} for {model_name}; "
+                    "HF generation options are the daemon's, this run's are ignored\n"
+                )
+            return DaemonBackend(socket_path=hf_daemon_socket, model=model_name)
 
-    # HuggingFace local model
     if logger:
         logger.info("Loading LLM...\n")
     from utils.hf_model import load_hf_model
     from utils.hf_backend import HFBackend
-    hf = load_hf_model(model_dir / model_name, dtype=dtype, device=device)
-    return HFBackend(hf, writing_mode=writing_mode, enable_thinking=enable_thinking)
+    hf = load_hf_model(
+        model_dir / model_name,
+        dtype=dtype,
+        device=device,
+        draft_model_id=model_dir / draft_model if draft_model else None,
+        quantize=quantize,
+        num_threads=num_threads,
+        num_interop_threads=num_interop_threads,
+        logger=logger,
+    )
+    scheduler = None
+    if hf_batch_size > 1:
+        from utils.hf_batching import GenerationScheduler
+        scheduler = GenerationScheduler(hf, max_batch_size=hf_batch_size)
+    return HFBackend(
+        hf,
+        writing_mode=writing_mode,
+        enable_thinking=enable_thinking,
+        reuse_kv_cache=reuse_kv_cache,
+        early_stop_tool_calls=early_stop_tool_calls,
+        scheduler=scheduler,
+        constrained_decoding=constrained_decoding,
+    )
@@ -0,0 +1,294 @@
+"""
+Batch-API execution of many agent conversations (run_batch.py).
+
+Instead of one synchronous API call per round per conversation,
+`BatchEngine` advances all conversations in lockstep:
+
+  1. every active conversation contributes its next request -- built by the
+     backend's own `build_request`, so it is exactly what `complete()`
+     would have sent -- and they go out as one provider batch;
+  2. the batch is polled until it ends; each result is parsed with the
+     backend's `parse_response`;
+  3. conversations that answered are done; the tool calls of the others
+     run concurrently through MultiMcp, their results are appended (a
+     failed call appends its error instead), and the loop repeats.
+
+State is checkpointed (JSON, written atomically) after every submit and
+every step, so an interrupted run resumes where it stopped -- including
+waiting on a batch that was already submitted instead of paying for it
+twice.
+
+Transports wrap the OpenAI Batch API (/v1/chat/completions lines) and the
+Anthropic Message Batches API. Both honor OPENAI_BASE_URL /
+ANTHROPIC_BASE_URL, so stubs/batch_api.py can stand in for them.
+"""
+
+import asyncio
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.clients import get_anthropic_client, get_openai_client
+from utils.misc import dumps_json, extract_tool_result_text, invalid_arguments_text
+from utils.prompting import build_initial_messages
+from utils.tool_registry import ToolRegistry
+
+# custom_id -> (response body or SDK object, error message)
+BatchResults = Dict[str, Tuple[Any, Optional[str]]]
+
+
+class OpenAIBatchTransport:
+    endpoint = "/v1/chat/completions"
+
+    def __init__(self, client: Any = None):
+        self.client = client or get_openai_client()
+
+    def submit(self, requests: Dict[str, Dict[str, Any]]) -> str:
+        lines = [
+            dumps_json({"custom_id": cid, "method": "POST", "url": self.endpoint, "body": body})
+            for cid, body in requests.items()
+        ]
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        f = self.client.files.create(file=("batch.jsonl", data), purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=f.id, endpoint=self.endpoint, completion_window="24h"
+        )
+        return batch.id
+
+    def poll(self, batch_id: str) -> Optional[BatchResults]:
+        """None while the batch is still running."""
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status in ("validating", "in_progress", "finalizing", "cancelling"):
+            return None
+
+        out: BatchResults = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                resp = item.get("response") or {}
+                if item.get("error") or resp.get("status_code", 200) >= 400:
+                    out[item["custom_id"]] = (None, str(item.get("error") or resp.get("body")))
+                else:
+                    out[item["custom_id"]] = (resp["body"], None)
+        return out
+
+
+class AnthropicBatchTransport:
+    def __init__(self, client: Any = None):
+        self.client = client or get_anthropic_client()
+
+    def submit(self, requests: Dict[str, Dict[str, Any]]) -> str:
+        batch = self.client.messages.batches.create(
+            requests=[{"custom_id": cid, "params": body} for cid, body in requests.items()]
+        )
+        return batch.id
+
+    def poll(self, batch_id: str) -> Optional[BatchResults]:
+        batch = self.client.messages.batches.retrieve(batch_id)
+        if batch.processing_status != "ended":
+            return None
+
+        out: BatchResults = {}
+        for item in self.client.messages.batches.results(batch_id):
+            result = item.result
+            if result.type == "succeeded":
+                out[item.custom_id] = (result.message, None)
+            else:
+                error = getattr(result, "error", None)
+                out[item.custom_id] = (None, f"{result.type}: {error}" if error else result.type)
+        return out
+
+
+def _batch_provider(model_name: str) -> str:
+    from utils.backend import _is_anthropic_model, _is_openai_model
+
+    if _is_openai_model(model_name):
+        return "openai"
+    if _is_anthropic_model(model_name):
+        return "anthropic"
+    raise ValueError(f"No batch API for model {model_name!r} (OpenAI and Anthropic models only).")
+
+
+def create_transport(model_name: str) -> Any:
+    if _batch_provider(model_name) == "openai":
+        return OpenAIBatchTransport()
+    return AnthropicBatchTransport()
+
+
+def create_batch_backend(model_name: str) -> Any:
+    """The API backend whose `build_request` / `parse_response` the engine uses."""
+    if _batch_provider(model_name) == "openai":
+        from utils.openai_backend import OpenAIBackend
+        return OpenAIBackend(model_name)
+    from utils.anthropic_backend import AnthropicBackend
+    return AnthropicBackend(model_name)
+
+
+@dataclass
+class Conversation:
+    id: str
+    messages: List[Dict[str, Any]]
+    status: str = "active"  # active | done | failed
+    rounds: int = 0  # completions received
+    attempts: int = 0  # failed attempts at the current round
+    answer: Optional[str] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class BatchEngine:
+    backend: Any  # OpenAIBackend / AnthropicBackend (needs build_request / parse_response)
+    transport: Any
+    mcp: Any
+    llm_tools: List[Dict[str, Any]]
+    checkpoint_path: Path
+    logger: Any
+    max_tool_rounds: int = 6
+    max_new_tokens: int = 256
+    temperature: float = 0.0
+    seed: int = 0
+    poll_interval: float = 30.0
+    tool_concurrency: int = 16
+    max_attempts: int = 3
+    conversations: List[Conversation] = field(default_factory=list)
+    # Submitted batch not yet applied: {"batch_id": ..., "custom_ids": {custom_id: index}}
+    pending: Optional[Dict[str, Any]] = None
+    step: int = 0
+    _registry: ToolRegistry = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self._registry = ToolRegistry(self.llm_tools)
+
+    # ---- state ----------------------------------------------------------------
+
+    def add(self, conv_id: str, user_message: str, system_message: str = "") -> None:
+        self.conversations.append(Conversation(
+            id=conv_id,
+            messages=build_initial_messages(system_message=system_message, user_message=user_message),
+        ))
+
+    def save(self) -> None:
+        state = {
+            "model": self.backend.model,
+            "step": self.step,
+            "pending": self.pending,
+            "conversations": [asdict(c) for c in self.conversations],
+        }
+        tmp = self.checkpoint_path.with_name(self.checkpoint_path.name + ".tmp")
+        tmp.write_text(dumps_json(state), encoding="utf-8")
+        os.replace(tmp, self.checkpoint_path)
+
+    def load(self) -> None:
+        state = json.loads(self.checkpoint_path.read_text(encoding="utf-8"))
+        if state["model"] != self.backend.model:
+            raise ValueError(f"Checkpoint is for {state['model']}, not {self.backend.model}.")
+        self.step = state["step"]
+        self.pending = state["pending"]
+        self.conversations = [Conversation(**c) for c in state["conversations"]]
+
+    # ---- loop -------------------------------------------------------------------
+
+    async def run(self) -> List[Conversation]:
+        while True:
+            if self.pending is None:
+                active = [i for i, c in enumerate(self.conversations) if c.status == "active"]
+                if not active:
+                    break
+                await self._submit(active)
+                self.save()
+
+            results = await self._wait(self.pending["batch_id"])
+            calls = self._apply(results)
+            self.pending = None
+            await self._run_tools(calls)
+            self.step += 1
+            self.save()
+
+            counts = {s: sum(c.status == s for c in self.conversations) for s in ("active", "done", "failed")}
+            self.logger.info(f"[batch] step {self.step} finished: {counts}")
+
+        return self.conversations
+
+    async def _submit(self, active: List[int]) -> None:
+        requests, custom_ids = {}, {}
+        for i in active:
+            c = self.conversations[i]
+            # Provider custom_id rules: [a-zA-Z0-9_-]{1,64}, unique per batch.
+            cid = f"c{i}-r{c.rounds}-a{c.attempts}"
+            requests[cid] = self.backend.build_request(
+                c.messages,
+                self.llm_tools,
+                max_new_tokens=self.max_new_tokens,
+                temperature=self.temperature,
+                seed=self.seed,
+            )
+            custom_ids[cid] = i
+
+        batch_id = await asyncio.to_thread(self.transport.submit, requests)
+        self.pending = {"batch_id": batch_id, "custom_ids": custom_ids}
+        self.logger.info(f"[batch] step {self.step}: submitted {len(requests)} request(s) as {batch_id}")
+
+    async def _wait(self, batch_id: str) -> BatchResults:
+        while True:
+            results = await asyncio.to_thread(self.transport.poll, batch_id)
+            if results is not None:
+                return results
+            await asyncio.sleep(self.poll_interval)
+
+    def _apply(self, results: BatchResults) -> List[Tuple[Conversation, Any]]:
+        calls = []
+        for cid, i in self.pending["custom_ids"].items():
+            c = self.conversations[i]
+            body, error = results.get(cid, (None, "no result returned for this request"))
+            if error is None:
+                try:
+                    response = self.backend.parse_response(body, self.logger)
+                except Exception as e:
+                    error = f"unparseable response: {e!r}"
+            if error is not None:
+                c.attempts += 1
+                self.logger.info(f"[batch] {c.id}: {error} (attempt {c.attempts}/{self.max_attempts})")
+                if c.attempts >= self.max_attempts:
+                    c.status, c.error = "failed", error
+                continue
+
+            c.attempts = 0
+            c.rounds += 1
+            if response.tool_call is None:
+                c.status, c.answer = "done", response.content or ""
+            else:
+                calls.append((c, response.tool_call))
+        return calls
+
+    async def _run_tools(self, calls: List[Tuple[Conversation, Any]]) -> None:
+        sem = asyncio.Semaphore(self.tool_concurrency)
+
+        async def run_one(c: Conversation, tc: Any) -> None:
+            entry = self._registry.resolve(tc.name)
+            tool_args = entry.coerce(tc.args)
+            problems = entry.validate(tool_args)
+            if problems:
+                result_text = invalid_arguments_text(tc.name, problems)
+            else:
+                async with sem:
+                    try:
+                        result = await self.mcp.call_tool(entry.server, entry.tool, tool_args)
+                        result_text = extract_tool_result_text(result)
+                    except Exception as e:
+                        # One failed call should not cost the whole
+                        # conversation: the model sees the error, as it does
+                        # an isError result, and can retry or answer anyway.
+                        self.logger.info(f"[batch] {c.id}: tool {tc.name} failed: {e!r}")
+                        result_text = f"Error: tool {tc.name} failed: {e!r}"
+            c.messages.append(self.backend.build_tool_call_message(tc))
+            c.messages.append(self.backend.build_tool_result_message(tc, result_text))
+            if c.rounds >= self.max_tool_rounds:
+                c.status, c.error = "failed", "Tool calling rounds exceeded."
+
+        await asyncio.gather(*(run_one(c, tc) for c, tc in calls))
@@ -0,0 +1,123 @@
+"""
+Process-wide API clients.
+
+Every OpenAI / Anthropic backend gets its SDK client from here instead of
+building its own, so all backends in a process (several sessions, a router,
+the batch runner) share one HTTP connection pool: TLS handshakes and
+keep-alive connections are paid once per host, not once per backend.
+
+Call `configure_clients` before the first backend is created to change the
+pool limits, timeouts or retry policy (mcp_client.py does this from its
+--api_* flags): backends keep the client they were built with, so later
+settings only reach backends created afterwards. The defaults match the
+previous hard-coded clients (3 retries for OpenAI, the SDK's own default
+for Anthropic).
+"""
+
+import threading
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Optional
+
+import httpx
+
+
+@dataclass(frozen=True)
+class ClientSettings:
+    timeout: Optional[float] = None  # overall request timeout; None = per-backend default
+    connect_timeout: float = 10.0
+    max_retries: Optional[int] = None  # None = per-provider default (see below)
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 60.0  # seconds an idle connection is kept open
+    http2: bool = False
+
+
+OPENAI_MAX_RETRIES = 3  # what the OpenAI backends always used; Anthropic keeps the SDK default
+
+_lock = threading.Lock()
+_settings = ClientSettings()
+_http: Optional[httpx.Client] = None
+_clients: Dict[Any, Any] = {}
+
+
+def configure_clients(logger: Any = None, **overrides: Any) -> ClientSettings:
+    """
+    Update the shared settings (keyword names as in ClientSettings).
+    Later get_*_client calls build new clients on a new connection pool.
+    The old pool is left open, since backends created earlier still hold
+    clients that use it.
+    """
+    global _settings, _http
+    settings = replace(_settings, **overrides)
+    if settings.http2:
+        try:
+            import h2  # noqa: F401  (httpx needs it for HTTP/2)
+        except ImportError:
+            if logger:
+                logger.info("HTTP/2 requested but the 'h2' package is not installed; using HTTP/1.1.")
+            settings = replace(settings, http2=False)
+
+    with _lock:
+        _settings = settings
+        _clients.clear()
+        _http = None
+    return settings
+
+
+def get_settings() -> ClientSettings:
+    return _settings
+
+
+def _http_client() -> httpx.Client:
+    # Caller holds _lock.
+    global _http
+    if _http is None:
+        s = _settings
+        _http = httpx.Client(
+            http2=s.http2,
+            limits=httpx.Limits(
+                max_connections=s.max_connections,
+                max_keepalive_connections=s.max_keepalive_connections,
+                keepalive_expiry=s.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(s.timeout or 60.0, connect=s.connect_timeout),
+        )
+    return _http
+
+
+def _timeout(default: float) -> httpx.Timeout:
+    return httpx.Timeout(_settings.timeout or default, connect=_settings.connect_timeout)
+
+
+def get_openai_client(timeout: float = 60.0):
+    """Shared OpenAI client; `timeout` is the default unless --api_timeout is set."""
+    from openai import OpenAI
+
+    key = ("openai", timeout)
+    with _lock:
+        if key not in _clients:
+            max_retries = _settings.max_retries
+            _clients[key] = OpenAI(
+                max_retries=OPENAI_MAX_RETRIES if max_retries is None else max_retries,
+                timeout=_timeout(timeout),
+                http_client=_http_client(),
+            )
+        return _clients[key]
+
+
+def get_anthropic_client(timeout: float = 600.0):
+    """Shared Anthropic client; `timeout` is the default unless --api_timeout is set."""
+    import anthropic
+
+    key = ("anthropic", timeout)
+    with _lock:
+        if key not in _clients:
+            kwargs: Dict[str, Any] = {}
+            if _settings.max_retries is not None:
+                kwargs["max_retries"] = _settings.max_retries
+            _clients[key] = anthropic.Anthropic(
+                timeout=_timeout(timeout),
+                http_client=_http_client(),
+                **kwargs,
+            )
+        return _clients[key]
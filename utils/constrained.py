@@ -0,0 +1,509 @@
+"""
+Grammar-constrained decoding of tool calls for the HF backend.
+
+Decoding is free until the model opens a tool call in one of the formats
+utils/tool_parser.py recognizes. From then on every step keeps only the tokens
+that leave the call a valid *prefix* of
+
+  <tool_call> {"name": <tool>, "arguments": <args>} </tool_call>       (Hermes / Qwen2.5 / 3)
+  <tool_call> <function=<tool>> <parameter=k>v</parameter>... </function> </tool_call>  (Qwen3.5)
+  <|python_tag|> {"name": <tool>, "parameters": <args>}               (Llama 3.1)
+
+where <tool> is one of the offered tool names and <args> follows that
+tool's input schema (property names, required keys, types, enums, simple
+numeric / length bounds). Once the call is complete decoding is free again.
+
+Validity is decided by re-parsing the (short) call body with a small
+recursive-descent JSON-schema parser that distinguishes "invalid" from
+"ran out of input in a valid state". Candidate tokens are tried in logit
+order, so only a handful of parses run per constrained step; the whole
+vocabulary is only scanned when none of the top candidates fits.
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+import torch
+from transformers import LogitsProcessor
+
+
+INVALID = "invalid"
+PARTIAL = "partial"
+COMPLETE = "complete"
+
+
+class _Incomplete(Exception):
+    """Input ended while the parse was still valid."""
+
+
+class _Invalid(Exception):
+    pass
+
+
+class _Cursor:
+    def __init__(self, text: str):
+        self.s = text
+        self.i = 0
+
+    def peek(self) -> str:
+        if self.i >= len(self.s):
+            raise _Incomplete
+        return self.s[self.i]
+
+    def ws(self) -> None:
+        while self.i < len(self.s) and self.s[self.i] in " \t\n\r":
+            self.i += 1
+
+    def literal(self, lit: str) -> None:
+        for ch in lit:
+            if self.peek() != ch:
+                raise _Invalid
+            self.i += 1
+
+    def at_end(self) -> bool:
+        return self.i >= len(self.s)
+
+
+# ---- JSON values constrained by a JSON schema -----------------------------
+
+def _value(c: _Cursor, schema: Any) -> Any:
+    c.ws()
+    schema = schema if isinstance(schema, dict) else {}
+
+    if "const" in schema:
+        return _enum(c, [schema["const"]])
+    if "enum" in schema:
+        return _enum(c, schema["enum"])
+
+    alts = schema.get("anyOf") or schema.get("oneOf")
+    if alts:
+        return _any_of(c, alts)
+
+    sch_type = schema.get("type")
+    if isinstance(sch_type, list):
+        return _any_of(c, [{**schema, "type": t} for t in sch_type])
+    if sch_type == "object":
+        return _object(c, schema)
+    if sch_type == "array":
+        return _array(c, schema)
+    if sch_type == "string":
+        value = _string(c)
+        max_len = schema.get("maxLength")
+        if max_len is not None and len(value) > max_len:
+            raise _Invalid
+        return value
+    if sch_type in ("integer", "number"):
+        value = _number(c, integer=(sch_type == "integer"))
+        if "minimum" in schema and value < schema["minimum"]:
+            raise _Invalid
+        if "maximum" in schema and value > schema["maximum"]:
+            raise _Invalid
+        return value
+    if sch_type == "boolean":
+        return _keyword(c, ("true", "false"))
+    if sch_type == "null":
+        return _keyword(c, ("null",))
+    return _any(c)
+
+
+def _any(c: _Cursor) -> Any:
+    ch = c.peek()
+    if ch == "{":
+        return _object(c, {})
+    if ch == "[":
+        return _array(c, {})
+    if ch == '"':
+        return _string(c)
+    if ch in "tfn":
+        return _keyword(c, ("true", "false", "null"))
+    if ch == "-" or ch.isdigit():
+        return _number(c, integer=False)
+    raise _Invalid
+
+
+def _any_of(c: _Cursor, alts: List[Any]) -> Any:
+    start = c.i
+    incomplete = False
+    for alt in alts:
+        c.i = start
+        try:
+            return _value(c, alt)
+        except _Incomplete:
+            incomplete = True
+        except _Invalid:
+            pass
+    if incomplete:
+        raise _Incomplete
+    raise _Invalid
+
+
+def _enum(c: _Cursor, values: List[Any]) -> Any:
+    c.ws()
+    start = c.i
+    try:
+        _any(c)
+    except _Incomplete:
+        partial = c.s[start:]
+        if any(json.dumps(v, ensure_ascii=False).startswith(partial) for v in values):
+            raise
+        raise _Invalid
+    value = json.loads(c.s[start:c.i])
+    if value not in values:
+        raise _Invalid
+    return value
+
+
+def _keyword(c: _Cursor, words: Tuple[str, ...]) -> Any:
+    rest = c.s[c.i:]
+    for w in words:
+        if rest.startswith(w):
+            c.i += len(w)
+            return json.loads(w)
+    if any(w.startswith(rest) for w in words):
+        raise _Incomplete
+    raise _Invalid
+
+
+def _digits(c: _Cursor) -> None:
+    if not c.peek().isdigit():
+        raise _Invalid
+    while not c.at_end() and c.s[c.i].isdigit():
+        c.i += 1
+
+
+def _number(c: _Cursor, integer: bool) -> Any:
+    start = c.i
+    if c.peek() == "-":
+        c.i += 1
+    if c.peek() == "0":
+        c.i += 1
+    else:
+        _digits(c)
+    if not integer:
+        if not c.at_end() and c.s[c.i] == ".":
+            c.i += 1
+            _digits(c)
+        if not c.at_end() and c.s[c.i] in "eE":
+            c.i += 1
+            if c.peek() in "+-":
+                c.i += 1
+            _digits(c)
+    # A number can always grow while it touches the end of the input.
+    if c.at_end():
+        raise _Incomplete
+    return json.loads(c.s[start:c.i])
+
+
+def _string(c: _Cursor) -> str:
+    start = c.i
+    c.literal('"')
+    while True:
+        ch = c.peek()
+        c.i += 1
+        if ch == '"':
+            return json.loads(c.s[start:c.i])
+        if ch == "\\":
+            esc = c.peek()
+            if esc not in '"\\/bfnrtu':
+                raise _Invalid
+            c.i += 1
+            if esc == "u":
+                for _ in range(4):
+                    if c.peek() not in "0123456789abcdefABCDEF":
+                        raise _Invalid
+                    c.i += 1
+        elif ord(ch) < 0x20:
+            raise _Invalid
+
+
+def _object(c: _Cursor, schema: Dict[str, Any]) -> Dict[str, Any]:
+    props = schema.get("properties")
+    # Offered schemas list their properties; unknown keys are not allowed.
+    strict = props is not None and schema.get("additionalProperties") in (None, False)
+    required = set(schema.get("required", []))
+    seen: Dict[str, Any] = {}
+
+    c.literal("{")
+    c.ws()
+    if c.peek() == "}":
+        c.i += 1
+        if not required <= seen.keys():
+            raise _Invalid
+        return seen
+
+    while True:
+        c.ws()
+        if strict and not (set(props) - seen.keys()):
+            raise _Invalid
+        key_start = c.i
+        try:
+            key = _string(c)
+        except _Incomplete:
+            if strict:
+                partial = c.s[key_start:]
+                if not any(
+                    json.dumps(k, ensure_ascii=False).startswith(partial)
+                    for k in props if k not in seen
+                ):
+                    raise _Invalid
+            raise
+        if key in seen or (strict and key not in props):
+            raise _Invalid
+
+        c.ws()
+        c.literal(":")
+        seen[key] = _value(c, (props or {}).get(key, {}))
+        c.ws()
+
+        ch = c.peek()
+        c.i += 1
+        if ch == ",":
+            continue
+        if ch == "}":
+            if not required <= seen.keys():
+                raise _Invalid
+            return seen
+        raise _Invalid
+
+
+def _array(c: _Cursor, schema: Dict[str, Any]) -> List[Any]:
+    items = schema.get("items", {})
+    out: List[Any] = []
+    c.literal("[")
+    c.ws()
+    if c.peek() == "]":
+        c.i += 1
+        return out
+    while True:
+        out.append(_value(c, items))
+        c.ws()
+        ch = c.peek()
+        c.i += 1
+        if ch == ",":
+            continue
+        if ch == "]":
+            return out
+        raise _Invalid
+
+
+def check_json(text: str, schema: Any) -> str:
+    """INVALID / PARTIAL / COMPLETE for `text` as a single JSON value under `schema`."""
+    c = _Cursor(text)
+    try:
+        _value(c, schema)
+        c.ws()
+    except _Incomplete:
+        return PARTIAL
+    except _Invalid:
+        return INVALID
+    return COMPLETE if c.at_end() else INVALID
+
+
+# ---- Qwen3.5 XML calls ----------------------------------------------------
+
+_PARAM_OPEN = "<parameter="
+_PARAM_CLOSE = "</parameter>"
+_FN_OPEN = "<function="
+_FN_CLOSE = "</function>"
+
+
+def _tag_name(c: _Cursor, allowed: Optional[List[str]]) -> str:
+    end = c.s.find(">", c.i)
+    if end == -1:
+        partial = c.s[c.i:]
+        if allowed is None or any(n.startswith(partial) for n in allowed):
+            raise _Incomplete
+        raise _Invalid
+    name = c.s[c.i:end]
+    if not name or (allowed is not None and name not in allowed):
+        raise _Invalid
+    c.i = end + 1
+    return name
+
+
+def _accepts_text(schema: Dict[str, Any]) -> bool:
+    if schema.get("type") in ("string", None) and not schema.get("enum"):
+        alts = schema.get("anyOf") or schema.get("oneOf")
+        if not alts:
+            return True
+        return any(isinstance(a, dict) and a.get("type") == "string" for a in alts)
+    return False
+
+
+def _xml_value_ok(value: str, schema: Dict[str, Any], partial: bool) -> bool:
+    value = value.strip()
+    enum = schema.get("enum")
+    if enum and all(isinstance(e, str) for e in enum):
+        return any(e.startswith(value) for e in enum) if partial else value in enum
+    if _accepts_text(schema):
+        return True
+    if partial and not value:
+        return True
+    # Non-string values are written as JSON text; a trailing space marks the
+    # value as finished so e.g. numbers count as complete.
+    status = check_json(value if partial else value + " ", schema)
+    return status != INVALID if partial else status == COMPLETE
+
+
+def _xml_call(c: _Cursor, tools: Dict[str, Any]) -> None:
+    c.literal(_FN_OPEN)
+    name = _tag_name(c, list(tools))
+    schema = tools[name] if isinstance(tools[name], dict) else {}
+    props = schema.get("properties") or {}
+    required = set(schema.get("required", []))
+    seen = set()
+
+    while True:
+        c.ws()
+        rest = c.s[c.i:]
+        if rest.startswith(_PARAM_OPEN):
+            c.i += len(_PARAM_OPEN)
+        elif rest.startswith(_FN_CLOSE):
+            if not required <= seen:
+                raise _Invalid
+            c.i += len(_FN_CLOSE)
+            return
+        elif _PARAM_OPEN.startswith(rest) or (_FN_CLOSE.startswith(rest) and required <= seen):
+            raise _Incomplete
+        else:
+            raise _Invalid
+
+        key = _tag_name(c, [k for k in props if k not in seen] if props else None)
+        seen.add(key)
+        value_schema = props.get(key, {})
+
+        end = c.s.find(_PARAM_CLOSE, c.i)
+        if end == -1:
+            value = c.s[c.i:]
+            # Drop a half-written closing tag before validating the value.
+            for k in range(min(len(_PARAM_CLOSE), len(value)), 0, -1):
+                if _PARAM_CLOSE.startswith(value[-k:]):
+                    value = value[:-k]
+                    break
+            if not _xml_value_ok(value, value_schema, partial=True):
+                raise _Invalid
+            raise _Incomplete
+        if not _xml_value_ok(c.s[c.i:end], value_schema, partial=False):
+            raise _Invalid
+        c.i = end + len(_PARAM_CLOSE)
+
+
+# ---- tool-call grammar ----------------------------------------------------
+
+class ToolCallGrammar:
+    """Valid tool calls for a given `llm_tools` list (see to_llm_tools)."""
+
+    TRIGGERS = ("<tool_call>", "<|python_tag|>", _FN_OPEN)
+
+    def __init__(self, llm_tools: List[Dict[str, Any]]):
+        self.tools = {t["function"]["name"]: t["function"]["parameters"] for t in llm_tools}
+        self._wrappers = {key: self._wrapper(key) for key in ("arguments", "parameters")}
+
+    def _wrapper(self, args_key: str) -> Dict[str, Any]:
+        return {"anyOf": [
+            {
+                "type": "object",
+                "properties": {"name": {"const": name}, args_key: schema},
+                "required": ["name", args_key],
+            }
+            for name, schema in self.tools.items()
+        ]}
+
+    def check(self, mode: str, body: str) -> str:
+        """INVALID / PARTIAL / COMPLETE for the text following trigger `mode`."""
+        c = _Cursor(body)
+        try:
+            if mode == "<tool_call>":
+                c.ws()
+                if c.peek() == "<":
+                    _xml_call(c, self.tools)
+                else:
+                    _value(c, self._wrappers["arguments"])
+                c.ws()
+                c.literal("</tool_call>")
+            elif mode == "<|python_tag|>":
+                _value(c, self._wrappers["parameters"])
+            else:
+                _xml_call(c, self.tools)
+            c.ws()
+        except _Incomplete:
+            return PARTIAL
+        except _Invalid:
+            return INVALID
+        return COMPLETE if c.at_end() else INVALID
+
+    def locate(self, text: str) -> Optional[Tuple[str, str]]:
+        """(mode, body) of the tool call currently being written, or None."""
+        base = 0
+        if "<think>" in text:
+            if "</think>" not in text:
+                return None
+            base = text.rindex("</think>") + len("</think>")
+
+        positions = {t: text.rfind(t, base) for t in self.TRIGGERS}
+        # <function= inside an open <tool_call> belongs to that call.
+        tc = positions["<tool_call>"]
+        if tc != -1 and positions[_FN_OPEN] > tc:
+            positions[_FN_OPEN] = -1
+        mode = max(positions, key=positions.get)
+        pos = positions[mode]
+        if pos == -1:
+            return None
+        body = text[pos:] if mode == _FN_OPEN else text[pos + len(mode):]
+        if self.check(mode, body) == COMPLETE:
+            return None
+        return mode, body
+
+
+class ToolCallLogitsProcessor(LogitsProcessor):
+    """Masks every token that would make the open tool call invalid."""
+
+    def __init__(self, tokenizer, grammar: ToolCallGrammar, prompt_len: int = 0,
+                 top_candidates: int = 32, max_scan: int = 8192):
+        self.tokenizer = tokenizer
+        self.grammar = grammar
+        self.prompt_len = prompt_len
+        self.top_candidates = top_candidates
+        self.max_scan = max_scan
+        self.masked_steps = 0
+
+    def _piece(self, window: List[int], base: str, token_id: int) -> str:
+        # Decode with a little left context so sentencepiece word-boundary
+        # spaces come out right.
+        text = self.tokenizer.decode(window + [token_id], skip_special_tokens=False)
+        if text.startswith(base):
+            return text[len(base):]
+        return self.tokenizer.decode([token_id], skip_special_tokens=False)
+
+    def __call__(self, input_ids, scores):
+        for row in range(input_ids.shape[0]):
+            gen = input_ids[row, self.prompt_len:].tolist()
+            located = self.grammar.locate(self.tokenizer.decode(gen, skip_special_tokens=False))
+            if located is None:
+                continue
+            mode, body = located
+
+            window = gen[-8:]
+            base = self.tokenizer.decode(window, skip_special_tokens=False)
+            order = torch.argsort(scores[row], descending=True).tolist()
+
+            allowed: List[int] = []
+            for rank, token_id in enumerate(order[: self.max_scan]):
+                if scores[row, token_id] == float("-inf"):
+                    break
+                if allowed and rank >= self.top_candidates:
+                    break
+                piece = self._piece(window, base, token_id)
+                if piece and self.grammar.check(mode, body + piece) != INVALID:
+                    allowed.append(token_id)
+
+            if not allowed:
+                # Nothing fits within the scan budget; leave the step free
+                # rather than forcing an arbitrary token.
+                continue
+
+            keep = torch.full_like(scores[row], float("-inf"))
+            keep[allowed] = scores[row, allowed]
+            scores[row] = keep
+            self.masked_steps += 1
+        return scores
@@ -1,8 +1,10 @@
-from dataclasses import dataclass
+import threading
+from contextlib import nullcontext
+from dataclasses import dataclass, field
 from typing import Any, Dict, List, Optional
 
-from utils.hf_model import HFModel, generate_from_messages
-from utils.misc import parse_output
+from utils.hf_model import HFModel, PrefixKVCache, PromptCache, generate_from_messages
+from utils.tool_parser import parse_tool_calls
 from utils.backend import ToolCall, ChatResponse
 
 
@@ -11,6 +13,22 @@ class HFBackend:
     hf: HFModel
     writing_mode: bool = False
     enable_thinking: bool = False
+    # Keep past key/values between rounds and prefill only the new suffix.
+    reuse_kv_cache: bool = True
+    # Stop decoding once a complete tool call has been emitted.
+    early_stop_tool_calls: bool = True
+    # Mask logits so tool calls always parse and match the tool schemas.
+    constrained_decoding: bool = False
+    # Shared GenerationScheduler (utils/hf_batching.py). When set, rounds
+    # from concurrent conversations are batched together on one model.
+    scheduler: Any = None
+    # Tokenize only the part of the prompt that changed since last round.
+    incremental_tokenization: bool = True
+    _kv_cache: PrefixKVCache = field(default_factory=PrefixKVCache, init=False, repr=False)
+    _prompt_cache: PromptCache = field(default_factory=PromptCache, init=False, repr=False)
+    # run_agent calls complete() from worker threads. Without a scheduler,
+    # calls are serialised: generate() and the KV cache are not thread-safe.
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
 
     def complete(
         self,
@@ -22,27 +40,40 @@ class HFBackend:
         seed: int,
         logger: Any,
     ) -> ChatResponse:
-        raw = generate_from_messages(
-            self.hf,
-            messages,
-            tools=tools,
-            max_new_tokens=max_new_tokens,
-            temperature=temperature,
-            seed=seed,
-            logger=logger,
-            writing_mode=self.writing_mode,
-            enable_thinking=self.enable_thinking,
-        )
+        usage: Dict[str, int] = {}
+        with self._lock if self.scheduler is None else nullcontext():
+            raw = generate_from_messages(
+                self.hf,
+                messages,
+                tools=tools,
+                max_new_tokens=max_new_tokens,
+                temperature=temperature,
+                seed=seed,
+                logger=logger,
+                writing_mode=self.writing_mode,
+                enable_thinking=self.enable_thinking,
+                kv_cache=self._kv_cache if self.reuse_kv_cache else None,
+                scheduler=self.scheduler,
+                stop_on_tool_call=self.early_stop_tool_calls,
+                constrain_tool_calls=self.constrained_decoding,
+                prompt_cache=self._prompt_cache if self.incremental_tokenization else None,
+                usage=usage,
+            )
         if not self.writing_mode:
-            logger.info(f"Raw LLM Output:\n{raw}\n")
+            logger.debug(f"Raw LLM Output:\n{raw}\n")
 
-        response_type, tool_name, tool_args = parse_output(raw)
-        if response_type == "final":
-            return ChatResponse(content=(tool_name or "").strip(), tool_call=None)
+        calls, errors = parse_tool_calls(raw)
+        for err in errors:
+            logger.info(f"Tool call parse error: {err}")
+        if not calls:
+            return ChatResponse(content=raw.strip(), tool_call=None, usage=usage)
 
+        if len(calls) > 1:
+            logger.info(f"{len(calls)} tool calls emitted; running the first ({calls[0].name}).")
         return ChatResponse(
             content=None,
-            tool_call=ToolCall(id="call_0", name=tool_name, args=tool_args),
+            tool_call=ToolCall(id="call_0", name=calls[0].name, args=calls[0].args),
+            usage=usage,
         )
 
     def build_tool_call_message(self, tc: ToolCall) -> Dict[str, Any]:
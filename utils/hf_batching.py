@@ -0,0 +1,234 @@
+"""
+Continuous batching for a single loaded HF model.
+
+`GenerationScheduler` owns the model on a background thread. Callers (one
+per conversation, typically `HFBackend.complete` running in a worker
+thread) submit a tokenized prompt and block on a Future. The loop:
+
+  1. admits pending requests while the batch has room, prefilling each one
+     on its own (prompts have very different lengths, so there is little to
+     gain from padding them together);
+  2. runs one decode step for every active sequence at once: per-sequence
+     caches are left-padded to the longest one and stacked, with an
+     attention mask hiding the padding and explicit position ids;
+  3. retires sequences that hit EOS, their own max_new_tokens or their stop
+     condition, and resolves their Futures -- freed slots are refilled on
+     the next iteration without waiting for the rest of the batch.
+
+Caches are kept per sequence in the legacy (key, value) tuple layout and
+re-stacked every step. That costs a copy of the active caches per step but
+keeps admission/retirement trivial and works with any model whose cache is
+a plain DynamicCache. Models with hybrid / linear-attention caches are not
+supported here; leave batching off for them.
+"""
+
+import queue
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional
+
+import torch
+import torch.nn.functional as F
+from transformers import DynamicCache
+
+
+@dataclass
+class _Request:
+    input_ids: Any  # 1-D LongTensor on the model device
+    max_new_tokens: int
+    temperature: float
+    seed: int
+    stop: Optional[Callable[[List[int]], bool]]
+    logits_processor: Optional[Callable[[Any, Any], Any]]
+    future: Future
+    generated: List[int] = field(default_factory=list)
+    past: Any = None  # per-layer (key, value), batch dim 1
+    length: int = 0  # positions covered by `past`
+    generator: Any = None
+
+
+class GenerationScheduler:
+    def __init__(self, hf, max_batch_size: int = 8):
+        self.hf = hf
+        self.max_batch_size = max_batch_size
+
+        eos = hf.model.generation_config.eos_token_id
+        eos = eos if isinstance(eos, (list, tuple)) else [eos]
+        self.eos_ids = {int(e) for e in eos if e is not None}
+        if hf.tokenizer.eos_token_id is not None:
+            self.eos_ids.add(int(hf.tokenizer.eos_token_id))
+
+        self._pending: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="hf-scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(
+        self,
+        input_ids,
+        *,
+        max_new_tokens: int,
+        temperature: float,
+        seed: int = 0,
+        stop: Optional[Callable[[List[int]], bool]] = None,
+        logits_processor: Optional[Callable[[Any, Any], Any]] = None,
+    ) -> Future:
+        """
+        Queue a prompt (1-D token ids). The Future resolves to the generated
+        token ids. `stop` sees the generated ids after every step;
+        `logits_processor` has the transformers LogitsProcessor signature
+        and sees the full sequence (prompt + generated) with batch size 1.
+        """
+        fut: Future = Future()
+        self._pending.put(_Request(
+            input_ids=input_ids.to(self.hf.model.device),
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            seed=seed,
+            stop=stop,
+            logits_processor=logits_processor,
+            future=fut,
+        ))
+        return fut
+
+    def generate(self, input_ids, **kwargs) -> List[int]:
+        return self.submit(input_ids, **kwargs).result()
+
+    def close(self) -> None:
+        self._pending.put(None)
+        self._thread.join()
+
+    # ---- scheduler thread -------------------------------------------------
+
+    def _loop(self) -> None:
+        active: List[_Request] = []
+        closing = False
+
+        while not (closing and not active):
+            admitted: List[_Request] = []
+            if not active and not closing:
+                req = self._pending.get()  # idle: block until work arrives
+                if req is None:
+                    closing = True
+                else:
+                    admitted.append(req)
+            while not closing and len(active) + len(admitted) < self.max_batch_size:
+                try:
+                    req = self._pending.get_nowait()
+                except queue.Empty:
+                    break
+                if req is None:
+                    closing = True
+                    break
+                admitted.append(req)
+
+            with torch.inference_mode():
+                prefilled = []
+                for req in admitted:
+                    try:
+                        self._prefill(req)
+                    except Exception as e:
+                        req.future.set_exception(e)
+                        continue
+                    prefilled.append(req)
+                # Each token is checked once: the prefill's first token here,
+                # every later one right after the decode step that made it.
+                active += self._retire(prefilled)
+
+                if active:
+                    try:
+                        self._decode_step(active)
+                    except Exception as e:
+                        for req in active:
+                            req.future.set_exception(e)
+                        active = []
+                    active = self._retire(active)
+
+    def _retire(self, active: List[_Request]) -> List[_Request]:
+        remaining = []
+        for req in active:
+            last = req.generated[-1]
+            try:
+                done = (
+                    last in self.eos_ids
+                    or len(req.generated) >= req.max_new_tokens
+                    or (req.stop is not None and req.stop(req.generated))
+                )
+            except Exception as e:
+                # A failing stop callback fails its own request, not the
+                # scheduler thread (which would leave every Future hanging).
+                req.past = None
+                req.future.set_exception(e)
+                continue
+            if done:
+                req.past = None
+                req.future.set_result(list(req.generated))
+            else:
+                remaining.append(req)
+        return remaining
+
+    def _sample(self, req: _Request, logits) -> int:
+        if req.logits_processor is not None:
+            seq = torch.cat([
+                req.input_ids,
+                torch.tensor(req.generated, dtype=req.input_ids.dtype, device=req.input_ids.device),
+            ])
+            logits = req.logits_processor(seq[None, :], logits[None, :].clone())[0]
+        if req.temperature <= 0:
+            return int(torch.argmax(logits, dim=-1))
+        if req.generator is None:
+            req.generator = torch.Generator(device=logits.device)
+            req.generator.manual_seed(req.seed)
+        probs = torch.softmax(logits.float() / req.temperature, dim=-1)
+        return int(torch.multinomial(probs, 1, generator=req.generator))
+
+    def _prefill(self, req: _Request) -> None:
+        out = self.hf.model(input_ids=req.input_ids[None, :], use_cache=True)
+        req.past = _to_legacy(out.past_key_values)
+        req.length = req.input_ids.shape[0]
+        req.generated.append(self._sample(req, out.logits[0, -1]))
+
+    def _decode_step(self, active: List[_Request]) -> None:
+        device = self.hf.model.device
+        max_len = max(r.length for r in active)
+
+        stacked = []
+        for layer in range(len(active[0].past)):
+            keys, values = [], []
+            for r in active:
+                k, v = r.past[layer]
+                pad = max_len - r.length
+                keys.append(F.pad(k, (0, 0, pad, 0)))
+                values.append(F.pad(v, (0, 0, pad, 0)))
+            stacked.append((torch.cat(keys, dim=0), torch.cat(values, dim=0)))
+
+        attention_mask = torch.zeros((len(active), max_len + 1), dtype=torch.long, device=device)
+        for i, r in enumerate(active):
+            attention_mask[i, max_len - r.length:] = 1
+
+        input_ids = torch.tensor([[r.generated[-1]] for r in active], device=device)
+        position_ids = torch.tensor([[r.length] for r in active], device=device)
+
+        out = self.hf.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=DynamicCache.from_legacy_cache(tuple(stacked)),
+            use_cache=True,
+        )
+
+        new_past = _to_legacy(out.past_key_values)
+        for i, r in enumerate(active):
+            start = max_len - r.length
+            r.past = tuple(
+                (k[i:i + 1, :, start:, :], v[i:i + 1, :, start:, :])
+                for k, v in new_past
+            )
+            r.length += 1
+            r.generated.append(self._sample(r, out.logits[i, -1]))
+
+
+def _to_legacy(past_key_values):
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return past_key_values.to_legacy_cache()
+    return past_key_values
@@ -0,0 +1,196 @@
+"""
+Local generation daemon: keeps HF weights resident across client runs.
+
+`run_hf_daemon.py` loads the model once and serves the `HFBackend.complete`
+contract over a Unix socket. When the client is given a socket
+(--hf_daemon_socket), `create_backend` probes it first and, if a daemon with
+the requested model answers, returns a `DaemonBackend` instead of loading
+the weights itself. Generation options are then the daemon's.
+
+Wire protocol: one JSON object per line, one request per connection.
+
+    -> {"op": "info"}
+    <- {"model": "...", "pid": 123}
+
+    -> {"op": "complete", "messages": [...], "tools": [...],
+        "max_new_tokens": 256, "temperature": 0.0, "seed": 0}
+    <- {"content": "...", "tool_call": {"id", "name", "args"} | null,
+        "usage": {"input_tokens", "output_tokens"} | null}
+    <- {"error": "..."}                       on failure
+
+This module is imported by the client, so it must stay free of torch /
+transformers imports.
+"""
+
+import json
+import os
+import socket
+import socketserver
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from utils.backend import ToolCall, ChatResponse
+
+DEFAULT_SOCKET = os.environ.get("HF_DAEMON_SOCKET", "/tmp/simplemcp_hf.sock")
+
+
+def _request(socket_path: str, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError(f"HF daemon at {socket_path} closed the connection.")
+    return json.loads(line)
+
+
+def daemon_available(socket_path: Optional[str], model: str) -> bool:
+    """True if a daemon serving `model` answers on `socket_path`."""
+    if not socket_path or not os.path.exists(socket_path):
+        return False
+    try:
+        info = _request(socket_path, {"op": "info"}, timeout=0.5)
+    except (OSError, ValueError):
+        return False
+    return info.get("model") == model
+
+
+@dataclass
+class DaemonBackend:
+    """Client side of the daemon. Same message format as HFBackend."""
+
+    socket_path: str
+    model: str
+
+    def complete(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: Optional[List[Dict[str, Any]]],
+        *,
+        max_new_tokens: int,
+        temperature: float,
+        seed: int,
+        logger: Any,
+    ) -> ChatResponse:
+        resp = _request(self.socket_path, {
+            "op": "complete",
+            "messages": messages,
+            "tools": tools,
+            "max_new_tokens": max_new_tokens,
+            "temperature": temperature,
+            "seed": seed,
+        })
+        if "error" in resp:
+            raise RuntimeError(f"HF daemon error: {resp['error']}")
+
+        logger.debug("Raw Daemon Response:\n%s\n", resp)
+
+        tc = resp.get("tool_call")
+        if tc is None:
+            return ChatResponse(content=resp.get("content") or "", tool_call=None, usage=resp.get("usage"))
+        return ChatResponse(
+            content=None,
+            tool_call=ToolCall(id=tc["id"], name=tc["name"], args=tc["args"]),
+            usage=resp.get("usage"),
+        )
+
+    def build_tool_call_message(self, tc: ToolCall) -> Dict[str, Any]:
+        return {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{
+                "id": tc.id,
+                "type": "function",
+                "function": {
+                    "name": tc.name,
+                    "arguments": tc.args,  # dict; the chat template encodes it
+                },
+            }],
+        }
+
+    def build_tool_result_message(self, tc: ToolCall, result: str) -> Dict[str, Any]:
+        return {"role": "tool", "tool_call_id": tc.id, "content": result}
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, backend: Any, model: str, logger: Any):
+        self.backend = backend
+        self.model = model
+        self.logger = logger
+        # Without a GenerationScheduler the backend (and its KV cache) is
+        # single-tenant; with one, requests batch together.
+        self.lock = threading.Lock() if getattr(backend, "scheduler", None) is None else None
+        super().__init__(socket_path, _Handler)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: _Server
+
+    def handle(self) -> None:
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            resp = self._dispatch(json.loads(line))
+        except Exception as e:
+            self.server.logger.info(f"[daemon] request failed: {e!r}")
+            resp = {"error": repr(e)}
+        self.wfile.write(json.dumps(resp, ensure_ascii=False).encode("utf-8") + b"\n")
+
+    def _dispatch(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        op = req.get("op")
+        if op == "info":
+            return {"model": self.server.model, "pid": os.getpid()}
+        if op != "complete":
+            raise ValueError(f"Unknown op: {op}")
+
+        kwargs = dict(
+            max_new_tokens=req["max_new_tokens"],
+            temperature=req["temperature"],
+            seed=req.get("seed", 0),
+            logger=self.server.logger,
+        )
+        if self.server.lock is not None:
+            with self.server.lock:
+                response = self.server.backend.complete(req["messages"], req.get("tools"), **kwargs)
+        else:
+            response = self.server.backend.complete(req["messages"], req.get("tools"), **kwargs)
+
+        tc = response.tool_call
+        return {
+            "content": response.content,
+            "tool_call": None if tc is None else {"id": tc.id, "name": tc.name, "args": tc.args},
+            "usage": response.usage,
+        }
+
+
+def serve(backend: Any, model: str, socket_path: str = DEFAULT_SOCKET, logger: Any = None) -> None:
+    if os.path.exists(socket_path):
+        if _alive(socket_path):
+            raise RuntimeError(f"Another HF daemon is already listening on {socket_path}.")
+        os.unlink(socket_path)  # stale socket from a crashed daemon
+
+    server = _Server(socket_path, backend, model, logger)
+    os.chmod(socket_path, 0o600)
+    logger.info(f"[daemon] serving {model} on {socket_path} (pid {os.getpid()})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def _alive(socket_path: str) -> bool:
+    try:
+        _request(socket_path, {"op": "info"}, timeout=0.5)
+    except (OSError, ValueError):
+        return False
+    return True
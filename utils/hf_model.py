@@ -1,17 +1,275 @@
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+import bisect
+import os
+import resource
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import (
+    AutoTokenizer,
+    AutoModelForCausalLM,
+    LogitsProcessorList,
+    StoppingCriteria,
+    StoppingCriteriaList,
+)
+
+from utils.tool_parser import StreamingToolCallParser
 
 
 @dataclass
 class HFModel:
     tokenizer: Any
     model: Any
+    # Small same-tokenizer model for assisted (speculative) decoding.
+    draft_model: Any = None
+
+
+@dataclass
+class PrefixKVCache:
+    """
+    Past key/values kept between agent rounds.
+
+    `ids` are the token ids the cache currently covers (prompt + generated
+    tokens of the previous round). Next round only the tokens after the
+    longest common prefix with the new prompt are prefilled. If the chat
+    template rewrote earlier tokens (e.g. re-rendered the assistant tool
+    call), the cache is cropped back to the divergence point; if the cache
+    type cannot be cropped, it is dropped and a full prefill runs.
+    """
+    ids: Any = None
+    past_key_values: Any = None
+
+    def reset(self) -> None:
+        self.ids = None
+        self.past_key_values = None
+
+    def prepare(self, input_ids, logger: Any = None):
+        """Return a cache usable for `input_ids` (1-D), or None for a full prefill."""
+        if self.past_key_values is None or self.ids is None:
+            return None
+
+        # Always leave at least one prompt token to prefill so generate()
+        # has logits to start from.
+        n = min(len(self.ids), len(input_ids) - 1)
+        mismatch = (self.ids[:n] != input_ids[:n]).nonzero()
+        common = int(mismatch[0]) if len(mismatch) else n
+
+        if common == 0:
+            self.reset()
+            return None
+
+        if common < self.past_key_values.get_seq_length():
+            try:
+                self.past_key_values.crop(common)
+            except Exception as e:
+                if logger:
+                    logger.info(f"KV cache: cannot crop ({e}); running full prefill.")
+                self.reset()
+                return None
+
+        if logger:
+            logger.info(
+                f"KV cache: reusing {common}/{len(input_ids)} prompt tokens, "
+                f"prefilling {len(input_ids) - common}."
+            )
+        return self.past_key_values
+
+    def store(self, sequence, past_key_values) -> None:
+        self.past_key_values = past_key_values
+        # The last generated token has no key/value yet.
+        self.ids = sequence[: past_key_values.get_seq_length()]
+
+
+def _common_prefix_len(a: str, b: str) -> int:
+    # Binary search over C-level slice comparisons; prompts are long.
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+@dataclass
+class PromptCache:
+    """
+    Rendered prompt and its token ids from the previous round.
+
+    The chat template is still rendered in full (Jinja cannot render a
+    suffix on its own), but only the text after the part shared with the
+    previous prompt -- system, tool schemas, prior turns -- is tokenized.
+    A couple of tokens before the divergence point are re-tokenized too, so
+    merges across the boundary come out the same as a full encode.
+
+    The first incremental encode of every cache is checked against a full
+    tokenization; if they ever differ (tokenizers that add a prefix space
+    to fragments, for example) the cache falls back to full encodes for
+    good. `verify=True` checks every round. Encodes are serialised: with a
+    GenerationScheduler several conversations share one backend and cache.
+    """
+    verify: bool = False
+    text: Optional[str] = None
+    ids: Optional[List[int]] = None
+    offsets: Optional[List[Tuple[int, int]]] = None
+    _verified: bool = False
+    _disabled: bool = False
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    # Tokens before the divergence point that are always re-tokenized.
+    MARGIN = 2
+
+    def _full(self, tokenizer, text: str) -> Tuple[List[int], List[Tuple[int, int]]]:
+        enc = tokenizer(text, return_offsets_mapping=True)
+        return list(enc["input_ids"]), [tuple(o) for o in enc["offset_mapping"]]
+
+    def encode(self, tokenizer, text: str, logger: Any = None) -> List[int]:
+        with self._lock:
+            return self._encode(tokenizer, text, logger)
+
+    def _encode(self, tokenizer, text: str, logger: Any = None) -> List[int]:
+        if self._disabled or self.text is None:
+            ids, offsets = self._full(tokenizer, text)
+            self.text, self.ids, self.offsets = text, ids, offsets
+            return ids
+
+        common = _common_prefix_len(self.text, text)
+        # Tokens that end inside the shared prefix, by bisection on the end
+        # offsets. They are sorted apart from special tokens the tokenizer
+        # appends, mapped to (0, 0); those are left out of the search.
+        hi = len(self.offsets)
+        while hi > 1 and self.offsets[hi - 1] == (0, 0):
+            hi -= 1
+        keep = bisect.bisect_right(self.offsets, common, hi=hi, key=lambda o: o[1])
+        keep = max(0, keep - self.MARGIN)
+        cut = self.offsets[keep - 1][1] if keep else 0
+
+        if keep == 0:
+            ids, offsets = self._full(tokenizer, text)
+        else:
+            enc = tokenizer(text[cut:], add_special_tokens=False, return_offsets_mapping=True)
+            ids = self.ids[:keep] + list(enc["input_ids"])
+            offsets = self.offsets[:keep] + [(a + cut, b + cut) for a, b in enc["offset_mapping"]]
+
+            if self.verify or not self._verified:
+                full_ids, full_offsets = self._full(tokenizer, text)
+                self._verified = True
+                if full_ids != ids:
+                    if logger:
+                        logger.info("Prompt cache: incremental tokenization differs from full; disabling it.")
+                    self._disabled = True
+                    ids, offsets = full_ids, full_offsets
+
+            if logger and not self._disabled:
+                logger.info(f"Prompt cache: reused {keep} tokens, tokenized {len(ids) - keep} new.")
+
+        self.text, self.ids, self.offsets = text, ids, offsets
+        return ids
+
+
+class ToolCallStop(StoppingCriteria):
+    """
+    Stop decoding as soon as a complete tool call has been emitted.
+
+    The decoded output is fed to a StreamingToolCallParser, which reports a
+    call the moment it closes; the backend only runs the first call
+    anyway. Works both as a transformers StoppingCriteria (batch size
+    1) and, via `matches`, as the `stop` callback of GenerationScheduler.
+    """
 
+    def __init__(self, tokenizer, prompt_len: int = 0):
+        self.tokenizer = tokenizer
+        self.prompt_len = prompt_len
+        self.stopped_at: Optional[int] = None
+        self._parser = StreamingToolCallParser()
+        self._fed = ""
+
+    def matches(self, gen_ids) -> bool:
+        if len(gen_ids) == 0:
+            return False
+        # Only a closing tag or brace can complete a call; the parser catches
+        # up on the text in between lazily.
+        last = self.tokenizer.decode(gen_ids[-1:], skip_special_tokens=False)
+        if ">" not in last and "}" not in last:
+            return False
+
+        # A trailing U+FFFD is an incomplete multi-byte character.
+        text = self.tokenizer.decode(gen_ids, skip_special_tokens=False).rstrip("\ufffd")
+        if not text.startswith(self._fed):
+            self._parser, self._fed = StreamingToolCallParser(), ""
+        self._parser.feed(text[len(self._fed):])
+        self._fed = text
+
+        if self._parser.calls:
+            self.stopped_at = len(gen_ids)
+            return True
+        return False
+
+    def __call__(self, input_ids, scores, **kwargs):
+        done = self.matches(input_ids[0, self.prompt_len:])
+        return torch.full((input_ids.shape[0],), done, dtype=torch.bool, device=input_ids.device)
+
+
+class _ForwardCounter:
+    """Counts forward calls of the target and draft model during one generate()."""
+
+    def __init__(self, model, draft_model):
+        self.target = 0
+        self.draft = 0
+        self._handles = [
+            model.register_forward_hook(lambda *_: self._bump("target")),
+            draft_model.register_forward_hook(lambda *_: self._bump("draft")),
+        ]
+
+    def _bump(self, which: str) -> None:
+        setattr(self, which, getattr(self, which) + 1)
+
+    def close(self) -> None:
+        for h in self._handles:
+            h.remove()
+
+
+def _rss_mib() -> Tuple[float, float]:
+    """(current, peak) resident set size of this process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    peak_mib = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    try:
+        with open("/proc/self/statm") as f:
+            current_mib = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        current_mib = peak_mib
+    return current_mib, peak_mib
+
+
+def load_hf_model(
+    model_id: str,
+    dtype: str = "auto",
+    device: Any = None,
+    draft_model_id: Any = None,
+    quantize: str = "none",
+    num_threads: Optional[int] = None,
+    num_interop_threads: Optional[int] = None,
+    logger: Any = None,
+) -> HFModel:
+    t0 = time.perf_counter()
+
+    # Thread pools must be sized before torch runs any parallel work, so
+    # this comes first. Set per worker process when several share a node.
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError as e:
+            if logger:
+                logger.info(f"Could not set inter-op threads ({e}); keeping {torch.get_num_interop_threads()}.")
 
-def load_hf_model(model_id: str, dtype: str = "auto", device: Any = None) -> HFModel:
     tokenizer = AutoTokenizer.from_pretrained(model_id, use_fast=True)
 
     torch_dtype = None
@@ -20,15 +278,59 @@ def load_hf_model(model_id: str, dtype: str = "auto", device: Any = None) -> HFM
     elif dtype == "bf16":
         torch_dtype = torch.bfloat16
 
+    on_cpu = str(device) == "cpu"
     if not device:
-        device="auto",
-        
-    model = AutoModelForCausalLM.from_pretrained(
-        model_id,
-        device_map=device,
+        device = "auto"
+
+    load_kwargs: Dict[str, Any] = dict(
+        # CPU: plain load, no accelerate dispatch.
+        device_map=None if on_cpu else device,
         torch_dtype=torch_dtype,
+        # Weights are read from memory-mapped safetensors shards straight
+        # into their final tensors instead of materializing a random init.
+        low_cpu_mem_usage=True,
     )
-    return HFModel(tokenizer=tokenizer, model=model)
+    if any(Path(model_id).glob("*.safetensors")):
+        load_kwargs["use_safetensors"] = True
+
+    if quantize == "int8":
+        if not on_cpu:
+            raise ValueError("--quantize int8 (dynamic quantization) is CPU only; use --device cpu.")
+        # Dynamic int8 quantization converts fp32 Linear layers.
+        load_kwargs["torch_dtype"] = torch.float32
+    elif quantize == "int4":
+        from transformers import QuantoConfig
+        load_kwargs["quantization_config"] = QuantoConfig(weights="int4")
+    elif quantize != "none":
+        raise ValueError(f"Unknown quantization mode: {quantize}")
+
+    def _load(path):
+        m = AutoModelForCausalLM.from_pretrained(path, **load_kwargs)
+        if quantize == "int8":
+            m = torch.ao.quantization.quantize_dynamic(m, {torch.nn.Linear}, dtype=torch.qint8)
+        return m.eval()
+
+    model = _load(model_id)
+
+    draft_model = None
+    if draft_model_id:
+        draft_tokenizer = AutoTokenizer.from_pretrained(draft_model_id, use_fast=True)
+        if draft_tokenizer.get_vocab() != tokenizer.get_vocab():
+            raise ValueError(
+                f"Draft model {draft_model_id} does not share the tokenizer of {model_id}."
+            )
+        draft_model = _load(draft_model_id)
+
+    if logger:
+        rss, peak = _rss_mib()
+        logger.info(
+            f"Loaded {model_id} in {time.perf_counter() - t0:.1f}s | "
+            f"device={'cpu' if on_cpu else device} dtype={next(model.parameters()).dtype} "
+            f"quantize={quantize} threads={torch.get_num_threads()}/{torch.get_num_interop_threads()} | "
+            f"RSS {rss:.0f} MiB (peak {peak:.0f} MiB)\n"
+        )
+
+    return HFModel(tokenizer=tokenizer, model=model, draft_model=draft_model)
 
 
 def generate_from_messages(
@@ -42,6 +344,12 @@ def generate_from_messages(
     logger: Any = None,
     writing_mode: bool = False,
     enable_thinking: bool = False,
+    kv_cache: Optional[PrefixKVCache] = None,
+    scheduler: Any = None,
+    stop_on_tool_call: bool = False,
+    constrain_tool_calls: bool = False,
+    prompt_cache: Optional[PromptCache] = None,
+    usage: Optional[Dict[str, int]] = None,
 ) -> str:
     if seed:
         torch.manual_seed(seed)
@@ -54,11 +362,15 @@ def generate_from_messages(
         enable_thinking=enable_thinking,
     )
     
-    logger.info("Actual Prompt")
-    logger.info(prompt)
+    logger.debug("Actual Prompt")
+    logger.debug(prompt)
 
-    inputs = hf.tokenizer(prompt, return_tensors="pt").to(hf.model.device)
-    input_len = inputs["input_ids"].shape[1]  
+    if prompt_cache is not None:
+        ids = torch.tensor([prompt_cache.encode(hf.tokenizer, prompt, logger)], device=hf.model.device)
+        inputs = {"input_ids": ids, "attention_mask": torch.ones_like(ids)}
+    else:
+        inputs = hf.tokenizer(prompt, return_tensors="pt").to(hf.model.device)
+    input_len = inputs["input_ids"].shape[1]
 
     do_sample = temperature > 0
     gen_kwargs = dict(
@@ -69,10 +381,72 @@ def generate_from_messages(
     if do_sample:
         gen_kwargs["temperature"] = temperature
 
-    with torch.inference_mode():
-        out = hf.model.generate(**inputs, **gen_kwargs)
+    stopper = ToolCallStop(hf.tokenizer, prompt_len=input_len) if stop_on_tool_call else None
+    if stopper is not None:
+        gen_kwargs["stopping_criteria"] = StoppingCriteriaList([stopper])
+
+    constraint = None
+    if constrain_tool_calls and tools:
+        from utils.constrained import ToolCallGrammar, ToolCallLogitsProcessor
+        constraint = ToolCallLogitsProcessor(hf.tokenizer, ToolCallGrammar(tools), prompt_len=input_len)
+        gen_kwargs["logits_processor"] = LogitsProcessorList([constraint])
+
+    counter = None
+    if hf.draft_model is not None and scheduler is None:
+        gen_kwargs["assistant_model"] = hf.draft_model
+        counter = _ForwardCounter(hf.model, hf.draft_model)
+        # Assisted generation manages its own caches for both models.
+        kv_cache = None
+
+    if scheduler is not None:
+        # Batched with other conversations; the scheduler keeps its own
+        # per-sequence caches, so kv_cache does not apply here.
+        gen_ids = scheduler.generate(
+            inputs["input_ids"][0],
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            seed=seed,
+            stop=stopper.matches if stopper is not None else None,
+            logits_processor=constraint,
+        )
+    else:
+        if kv_cache is not None:
+            past = kv_cache.prepare(inputs["input_ids"][0], logger)
+            if past is not None:
+                gen_kwargs["past_key_values"] = past
+            gen_kwargs["return_dict_in_generate"] = True
+
+        try:
+            with torch.inference_mode():
+                out = hf.model.generate(**inputs, **gen_kwargs)
+        finally:
+            if counter is not None:
+                counter.close()
+
+        if kv_cache is not None:
+            kv_cache.store(out.sequences[0], out.past_key_values)
+            out = out.sequences
+
+        gen_ids = out[0][input_len:]
+
+    if counter is not None and logger:
+        # Every target forward verifies a draft block and yields one token of
+        # its own on top of the accepted ones; every draft forward proposes one.
+        accepted = max(0, len(gen_ids) - counter.target)
+        rate = accepted / counter.draft if counter.draft else 0.0
+        logger.info(
+            f"Assisted decoding: {accepted}/{counter.draft} draft tokens accepted "
+            f"({rate:.0%}), {counter.target} target forwards for {len(gen_ids)} tokens."
+        )
+
+    if constraint is not None and constraint.masked_steps and logger:
+        logger.info(f"Constrained decoding: {constraint.masked_steps} tool-call tokens constrained.")
 
-    gen_ids = out[0][input_len:]
+    if stopper is not None and stopper.stopped_at is not None and logger:
+        logger.info(
+            f"Early stop: tool call closed after {stopper.stopped_at} tokens "
+            f"(saved up to {max_new_tokens - stopper.stopped_at} of {max_new_tokens})."
+        )
 
     # Decode the generated ids twice for different purposes:
     #   - skip_special_tokens=True  : returned for the agent. Control tokens
@@ -89,4 +463,6 @@ def generate_from_messages(
         logger.info("Raw output with special tokens (writing mode):")
         logger.info(raw_with_tokens)
 
+    if usage is not None:
+        usage.update(input_tokens=input_len, output_tokens=len(gen_ids))
     return text
\ No newline at end of file
@@ -1,12 +1,88 @@
+import atexit
 import logging
+import logging.handlers
+import queue
+from typing import Any
+
+from utils.misc import dumps_json
+
+# Attribute of a LogRecord holding structured fields (see log_event).
+_FIELDS = "fields"
+_DATA = "data"
+
+
+class TextFormatter(logging.Formatter):
+    """The message, followed by the event's data (a string as-is, anything else as indented JSON)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        data = getattr(record, _DATA, None)
+        if data is not None:
+            body = data if isinstance(data, str) else dumps_json(data, indent=True)
+            text = f"{text}\n{body}\n"
+        return text
+
+
+class JsonlFormatter(logging.Formatter):
+    """One compact JSON object per record."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, _FIELDS, None) or {})
+        data = getattr(record, _DATA, None)
+        if data is not None:
+            entry["data"] = data
+        return dumps_json(entry)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueues records unformatted. The stock prepare() renders `msg % args`
+    on the calling thread; here the listener's formatters do it on the
+    writer thread. Records only cross threads, never processes, so args
+    and exc_info can stay as they are.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def log_event(logger: Any, level: int, msg: str, data: Any = None, **fields: Any) -> None:
+    """
+    Log `msg` with structured `fields` and an optional JSON-able `data`
+    payload. Nothing is serialized here: the payload is rendered by the
+    handler's formatter (on the writer thread), and not at all when `level`
+    is disabled.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, msg, extra={_FIELDS: fields, _DATA: data})
+
 
 def create_logger(
     filename='cur.log',
+    log_format='text',
+    level='DEBUG',
 ):
+    """
+    log_format:
+      text  -- plain messages on the console and in `filename`
+      jsonl -- compact JSON lines in `filename` (console stays text)
+
+    Records are handed to a QueueHandler and written by a background
+    QueueListener, so the caller never blocks on console or file I/O, and
+    messages are only formatted on the listener's thread.
+    """
+    if log_format not in ("text", "jsonl"):
+        raise ValueError(f"Unknown log format: {log_format}")
+
     logger = logging.getLogger("my_logger")
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(level)
 
-    formatter = logging.Formatter(
+    formatter = TextFormatter(
         "%(message)s"
     )
 
@@ -14,9 +90,13 @@ def create_logger(
     console_handler.setFormatter(formatter)
 
     file_handler = logging.FileHandler(filename, mode="w", encoding="utf-8")
-    file_handler.setFormatter(formatter)
+    file_handler.setFormatter(JsonlFormatter() if log_format == "jsonl" else formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, console_handler, file_handler)
+    listener.start()
+    atexit.register(listener.stop)
 
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    logger.addHandler(_DeferredQueueHandler(log_queue))
 
-    return logger
\ No newline at end of file
+    return logger
@@ -0,0 +1,52 @@
+"""
+MCP servers known to the clients and the LLM tool list built from them.
+
+Shared by mcp_client.py, run_batch.py and bench/agent_overhead.py; kept out
+of mcp_client.py so importing it has no side effects (secrets loading,
+profiler start-up).
+"""
+
+from utils.config import McpConfig
+from utils.mcp_http import MultiMcp
+from utils.misc import apply_allowlist, to_llm_tools
+
+MCP_URLS = {
+    "custom": "http://localhost:8001/mcp",
+    "brave_search": "http://localhost:8002/mcp",
+    "perplexity_search": "http://localhost:8003/mcp",
+    "google_search": "http://localhost:8004/mcp",
+}
+
+TOOL_ALLOWLIST = {
+    "custom": {
+        "add"
+    },
+    "brave_search": {
+        "brave_web_search"
+    },
+    "perplexity_search": {
+        "perplexity_search"
+    },
+    "google_search": {
+        "google_search"
+    },
+}
+
+# Default servers to enable. Override at runtime with --enabled custom,brave_search,...
+ENABLED_SERVERS = ["custom"]
+
+
+async def build_tools(mcp: MultiMcp, mcp_cfg: McpConfig):
+    all_tools = []
+    for server in mcp_cfg.enabled:
+        tools_resp = await mcp.list_tools(server)
+        tools = tools_resp.tools
+
+        allow = None
+        if mcp_cfg.allowlist is not None:
+            allow = mcp_cfg.allowlist.get(server)
+
+        tools = apply_allowlist(tools, allow)
+        prefix = server if mcp_cfg.prefix_tools else None
+        all_tools.extend(to_llm_tools(tools, prefix=prefix))
+    return all_tools
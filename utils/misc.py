@@ -1,8 +1,12 @@
-from typing import Any, Dict, List, Tuple, Optional
-import re
+from typing import Any, Callable, Dict, List, Tuple, Optional
 import ast
 import json
 
+try:
+    import orjson  # optional: much faster dumps of large tool payloads
+except ImportError:
+    orjson = None
+
 def apply_allowlist(mcp_tools: List[Any], allow: Optional[set]) -> List[Any]:
     if allow is None:
         return mcp_tools
@@ -29,106 +33,46 @@ def split_prefixed(name: str) -> Tuple[str, str]:
     return tuple(name.split("__", 1))  # (server, tool)
 
 
-def extract_first_json(text: str):
-    decoder = json.JSONDecoder()
-    idx = text.find("{")
-    if idx == -1:
-        raise ValueError("No JSON found")
-
-    obj, end = decoder.raw_decode(text[idx:].lstrip())
-    return obj
-
-
-def extract_tool_result_text(result_dump: dict) -> str:
-    try:
-        contents = result_dump.get("content", [])
-        texts = []
-        for c in contents:
-            if isinstance(c, dict) and c.get("type") == "text":
-                t = c.get("text", "")
-                if t:
-                    texts.append(t)
-        if texts:
-            return "\n".join(texts)
-    except Exception:
-        pass
-    return json.dumps(result_dump, ensure_ascii=False)
-
-def parse_tool_call(obj: dict) -> tuple[str, dict] | None:
-    if "name" not in obj:
-        return None
-    # Llama 3.1 emits the args under "parameters"; Qwen2.5/3 / Hermes / OpenAI use "arguments".
-    if "parameters" in obj and isinstance(obj["parameters"], dict):
-        return obj["name"], obj["parameters"]
-    if "arguments" in obj and isinstance(obj["arguments"], dict):
-        return obj["name"], obj["arguments"]
-    return None
-
-
-def parse_xml_tool_call(text: str) -> tuple[str, dict] | None:
-    """
-    Parse Qwen3.5-style XML tool calls:
-        <function=tool_name>
-        <parameter=key1>
-        value1
-        </parameter>
-        <parameter=key2>
-        value2
-        </parameter>
-        </function>
-    Values are returned as strings; preprocess_by_schema later coerces them
-    to the types declared by the tool's input schema.
-    """
-    fn_match = re.search(r"<function=([^>]+)>(.*?)</function>", text, re.DOTALL)
-    if not fn_match:
-        return None
-    name = fn_match.group(1).strip()
-    body = fn_match.group(2)
-
-    args: Dict[str, Any] = {}
-    for m in re.finditer(r"<parameter=([^>]+)>(.*?)</parameter>", body, re.DOTALL):
-        args[m.group(1).strip()] = m.group(2).strip()
-    return name, args
+def dumps_json(obj: Any, indent: bool = False) -> str:
+    """json.dumps(obj, ensure_ascii=False), via orjson when it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode("utf-8")
+        except TypeError:
+            pass  # e.g. non-str keys; let json handle it
+    return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False)
 
 
-def parse_output(raw: str) -> tuple[str, str | None, dict | None]:
+def extract_tool_result_text(result: Any) -> str:
     """
-    Returns:
-      ("call", tool_name, tool_args)  if a tool call is found
-      ("final", answer_text, None)    otherwise
+    Text for the model from an MCP CallToolResult (or its model_dump()):
+    the text blocks, else the structured content, else the whole result.
+    Reads the pydantic object directly, so the usual all-text result is
+    never dumped.
     """
-    text = raw.strip()
-
-    # Llama 3.1 prepends the <|python_tag|> control token before the JSON tool call.
-    if text.startswith("<|python_tag|>"):
-        text = text[len("<|python_tag|>"):].strip()
-
-    # Qwen3.5 emits tool calls as XML tags (<function=...><parameter=...>...).
-    if "<function=" in text and "<parameter=" in text:
-        xml_tc = parse_xml_tool_call(text)
-        if xml_tc is not None:
-            name, args = xml_tc
-            return ("call", name, args)
-
-    # Qwen2.5 / 3 / Hermes wrap a JSON tool call with <tool_call> ... </tool_call>.
-    if "<tool_call>" in text:
-        start = text.index("<tool_call>") + len("<tool_call>")
-        end = text.find("</tool_call>", start)
-        text = text[start:end].strip() if end != -1 else text[start:].strip()
-
-    try:
-        obj = extract_first_json(text)
-        tc = parse_tool_call(obj)
-        if tc is not None:
-            name, params = tc
-            return ("call", name, params)
-    except Exception:
-        if "{" in text:
-            print("Isn't this JSON?")
-
-    return ("final", raw.strip(), None)
-
-
+    if isinstance(result, dict):
+        contents = result.get("content") or []
+        structured = result.get("structuredContent")
+    else:
+        contents = getattr(result, "content", None) or []
+        structured = getattr(result, "structuredContent", None)
+
+    texts = []
+    for c in contents:
+        if isinstance(c, dict):
+            ctype, text = c.get("type"), c.get("text")
+        else:
+            ctype, text = getattr(c, "type", None), getattr(c, "text", None)
+        if ctype == "text" and text:
+            texts.append(text)
+    if texts:
+        return "\n".join(texts)
+
+    if structured is not None:
+        return dumps_json(structured)
+    if not isinstance(result, dict):
+        result = result.model_dump()
+    return dumps_json(result)
 
 def _coerce_primitive(value: Any, schema: Dict[str, Any]) -> Any:
     if not isinstance(value, str):
@@ -178,34 +122,127 @@ def _maybe_deserialize_container(value: Any, schema: Dict[str, Any]) -> Any:
     return value
 
 
-def preprocess_by_schema(value: Any, schema: Dict[str, Any]) -> Any:
+def _identity(value: Any) -> Any:
+    return value
+
+
+def compile_coercer(schema: Dict[str, Any]) -> Callable[[Any], Any]:
+    """
+    Compile `schema` into a function that coerces a value to the schema's
+    types: numbers / booleans given as strings, and arrays / objects given
+    as JSON (or Python literal) strings, recursively through `properties`
+    and `items`. The per-type dispatch and nested property schemas are
+    resolved once instead of on every call.
+    """
     if not isinstance(schema, dict):
-        return value
+        return _identity
 
     sch_type = schema.get("type")
 
-    # object
-    if sch_type == "object" and isinstance(value, dict):
-        props = schema.get("properties", {})
-        return {
-            k: preprocess_by_schema(v, props.get(k, {}))
-            for k, v in value.items()
-        }
+    if sch_type == "object":
+        props = {k: compile_coercer(s) for k, s in schema.get("properties", {}).items()}
+
+        def coerce_object(value: Any) -> Any:
+            if not isinstance(value, dict):
+                value = _maybe_deserialize_container(value, schema)
+                if not isinstance(value, dict):
+                    return value
+            return {k: props.get(k, _identity)(v) for k, v in value.items()}
+
+        return coerce_object
 
-    # array
     if sch_type == "array":
-        value = _maybe_deserialize_container(value, schema)
-        if isinstance(value, list):
-            item_schema = schema.get("items", {})
-            return [preprocess_by_schema(v, item_schema) for v in value]
-        return value
+        item = compile_coercer(schema.get("items", {}))
 
-    # object stringified
-    if sch_type == "object":
-        value = _maybe_deserialize_container(value, schema)
+        def coerce_array(value: Any) -> Any:
+            value = _maybe_deserialize_container(value, schema)
+            if isinstance(value, list):
+                return [item(v) for v in value]
+            return value
+
+        return coerce_array
+
+    if sch_type in ("boolean", "integer", "number"):
+        return lambda value: _coerce_primitive(value, schema)
+
+    return _identity
+
+
+def invalid_arguments_text(tool_name: str, problems: List[str]) -> str:
+    """Tool result telling the model why its call was not made."""
+    return f"Error: invalid arguments for {tool_name}: " + "; ".join(problems)
+
+
+_JSON_TYPES: Dict[str, Callable[[Any], bool]] = {
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: (isinstance(v, int) and not isinstance(v, bool)) or (isinstance(v, float) and v.is_integer()),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "array": lambda v: isinstance(v, list),
+    "object": lambda v: isinstance(v, dict),
+    "null": lambda v: v is None,
+}
+
+
+def _no_problems(value: Any) -> List[str]:
+    return []
+
+
+def _compile_check(schema: Any) -> Optional[Callable[[Any, str, List[str]], None]]:
+    if not isinstance(schema, dict):
+        return None
+
+    names = schema.get("type")
+    names = [names] if isinstance(names, str) else names if isinstance(names, list) else []
+    # A type this checker does not know disables the type check altogether.
+    oks = [_JSON_TYPES[n] for n in names] if all(n in _JSON_TYPES for n in names) else []
+    expected = " or ".join(names)
+    enum = schema.get("enum")
+    required = schema.get("required") or []
+    props = {}
+    for k, s in (schema.get("properties") or {}).items():
+        check = _compile_check(s)
+        if check is not None:
+            props[k] = check
+    item = _compile_check(schema.get("items"))
+
+    if not (oks or enum is not None or required or props or item):
+        return None
+
+    def check_value(value: Any, path: str, out: List[str]) -> None:
+        if oks and not any(ok(value) for ok in oks):
+            out.append(f"{path}: expected {expected}, got {type(value).__name__}")
+            return
+        if enum is not None and value not in enum:
+            out.append(f"{path}: {value!r} is not one of {enum!r}")
         if isinstance(value, dict):
-            return preprocess_by_schema(value, schema)
-        return value
+            for k in required:
+                if k not in value:
+                    out.append(f"{path}: missing required property {k!r}")
+            for k, check in props.items():
+                if k in value:
+                    check(value[k], f"{path}.{k}", out)
+        elif isinstance(value, list) and item is not None:
+            for i, v in enumerate(value):
+                item(v, f"{path}[{i}]", out)
+
+    return check_value
+
+
+def compile_validator(schema: Dict[str, Any]) -> Callable[[Any], List[str]]:
+    """
+    Compile `schema` into a function listing what is wrong with an (already
+    coerced) value: a wrong type, a missing required property, a value
+    outside `enum`. Other keywords are not checked; the MCP server still
+    validates the call.
+    """
+    check = _compile_check(schema)
+    if check is None:
+        return _no_problems
+
+    def validate(value: Any) -> List[str]:
+        out: List[str] = []
+        check(value, "arguments", out)
+        return out
 
-    # primitive coercion
-    return _coerce_primitive(value, schema)
\ No newline at end of file
+    return validate
@@ -3,8 +3,12 @@ from dataclasses import dataclass, field
 from typing import Any, Dict, List, Optional
 
 from openai import OpenAI
+from openai.types.chat import ChatCompletion
 
 from utils.backend import ToolCall, ChatResponse
+from utils.clients import get_openai_client
+from utils.rate_control import limited_create
+from utils.misc import dumps_json
 
 
 def _is_reasoning_model(name: str) -> bool:
@@ -17,7 +21,7 @@ def _is_reasoning_model(name: str) -> bool:
 class OpenAIBackend:
     model: str
     _client: OpenAI = field(
-        default_factory=lambda: OpenAI(max_retries=3, timeout=60.0),
+        default_factory=lambda: get_openai_client(timeout=60.0),
         init=False,
         repr=False,
     )
@@ -32,6 +36,22 @@ class OpenAIBackend:
         seed: int,
         logger: Any,
     ) -> ChatResponse:
+        kwargs = self.build_request(
+            messages, tools, max_new_tokens=max_new_tokens, temperature=temperature, seed=seed
+        )
+        resp = limited_create(self._client.chat.completions, provider="openai", model=self.model, logger=logger, **kwargs)
+        return self.parse_response(resp, logger)
+
+    def build_request(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: Optional[List[Dict[str, Any]]],
+        *,
+        max_new_tokens: int,
+        temperature: float,
+        seed: int,
+    ) -> Dict[str, Any]:
+        """Chat Completions request body (also used as a batch line `body`)."""
         kwargs: Dict[str, Any] = dict(
             model=self.model,
             messages=messages,
@@ -42,10 +62,23 @@ class OpenAIBackend:
             kwargs["seed"] = seed
         if tools:
             kwargs["tools"] = tools
+        return kwargs
 
-        resp = self._client.chat.completions.create(**kwargs)
+    def parse_response(self, resp: Any, logger: Any) -> ChatResponse:
+        """`resp` is a ChatCompletion, or its JSON body (batch results)."""
+        if isinstance(resp, dict):
+            resp = ChatCompletion.model_validate(resp)
         msg = resp.choices[0].message
-        logger.info(f"Raw API Response:\n{msg}\n")
+        logger.debug("Raw API Response:\n%s\n", msg)
+
+        usage = None
+        if resp.usage is not None:
+            details = getattr(resp.usage, "prompt_tokens_details", None)
+            usage = {
+                "input_tokens": resp.usage.prompt_tokens,
+                "output_tokens": resp.usage.completion_tokens,
+                "cached_tokens": getattr(details, "cached_tokens", None) or 0,
+            }
 
         if msg.tool_calls:
             tc = msg.tool_calls[0]
@@ -56,9 +89,10 @@ class OpenAIBackend:
                     name=tc.function.name,
                     args=json.loads(tc.function.arguments),
                 ),
+                usage=usage,
             )
 
-        return ChatResponse(content=(msg.content or "").strip(), tool_call=None)
+        return ChatResponse(content=(msg.content or "").strip(), tool_call=None, usage=usage)
 
     def build_tool_call_message(self, tc: ToolCall) -> Dict[str, Any]:
         return {
@@ -69,7 +103,7 @@ class OpenAIBackend:
                 "type": "function",
                 "function": {
                     "name": tc.name,
-                    "arguments": json.dumps(tc.args, ensure_ascii=False),
+                    "arguments": dumps_json(tc.args),
                 },
             }],
         }
@@ -5,6 +5,9 @@ from typing import Any, Dict, List, Optional
 from openai import OpenAI
 
 from utils.backend import ToolCall, ChatResponse
+from utils.clients import get_openai_client
+from utils.rate_control import limited_create
+from utils.misc import dumps_json
 
 
 def _is_reasoning_model(name: str) -> bool:
@@ -25,14 +28,29 @@ class OpenAIResponsesBackend:
             {"type": "function_call_output", "call_id", "output"}
       - Output is a list of typed items (function_call / message / reasoning ...);
         we scan for function_call first, then fall back to text.
+
+    With `stateful`, the conversation lives on the server: after the first
+    round only the items appended since the previous call are sent, chained
+    with `previous_response_id`. The function_call items that response
+    emitted are skipped because the server already has them; calls made in
+    between by another backend (under RouterBackend) are sent. The state
+    follows one `messages` list (run_agent appends to it in place); passing
+    any other list starts a new chain.
     """
 
     model: str
+    stateful: bool = False
     _client: OpenAI = field(
-        default_factory=lambda: OpenAI(max_retries=3, timeout=60.0),
+        default_factory=lambda: get_openai_client(timeout=60.0),
         init=False,
         repr=False,
     )
+    _tools_src: Optional[List[Dict[str, Any]]] = field(default=None, init=False, repr=False)
+    _tools: List[Dict[str, Any]] = field(default_factory=list, init=False, repr=False)
+    _messages_ref: Optional[List[Dict[str, Any]]] = field(default=None, init=False, repr=False)
+    _sent: int = field(default=0, init=False, repr=False)
+    _previous_id: Optional[str] = field(default=None, init=False, repr=False)
+    _previous_calls: set = field(default_factory=set, init=False, repr=False)
 
     def complete(
         self,
@@ -44,28 +62,44 @@ class OpenAIResponsesBackend:
         seed: int,  # Responses API does not accept a seed; ignored
         logger: Any,
     ) -> ChatResponse:
-        responses_tools = [
-            {
-                "type": "function",
-                "name": t["function"]["name"],
-                "description": t["function"]["description"],
-                "parameters": t["function"]["parameters"],
-            }
-            for t in (tools or [])
-        ]
+        responses_tools = self._convert_tools(tools)
 
         kwargs: Dict[str, Any] = dict(
             model=self.model,
             input=messages,
             max_output_tokens=max_new_tokens,
         )
+        if self.stateful and messages is self._messages_ref and len(messages) >= self._sent:
+            kwargs["previous_response_id"] = self._previous_id
+            kwargs["input"] = [
+                m for m in messages[self._sent:]
+                if not (m.get("type") == "function_call" and m.get("call_id") in self._previous_calls)
+            ]
+            logger.info(f"Continuing {self._previous_id}: sending {len(kwargs['input'])} new item(s)")
         if not _is_reasoning_model(self.model):
             kwargs["temperature"] = temperature
         if responses_tools:
             kwargs["tools"] = responses_tools
+            if self.stateful:
+                # Only the first call gets an output; any other call left on
+                # the server would make the next chained request fail.
+                kwargs["parallel_tool_calls"] = False
+
+        resp = limited_create(self._client.responses, provider="openai", model=self.model, logger=logger, **kwargs)
+        logger.debug("Raw API Response:\n%s\n", resp.output)
 
-        resp = self._client.responses.create(**kwargs)
-        logger.info(f"Raw API Response:\n{resp.output}\n")
+        if self.stateful:
+            self._messages_ref, self._sent, self._previous_id = messages, len(messages), resp.id
+            self._previous_calls = {item.call_id for item in resp.output if item.type == "function_call"}
+
+        usage = None
+        if resp.usage is not None:
+            details = getattr(resp.usage, "input_tokens_details", None)
+            usage = {
+                "input_tokens": resp.usage.input_tokens,
+                "output_tokens": resp.usage.output_tokens,
+                "cached_tokens": getattr(details, "cached_tokens", None) or 0,
+            }
 
         for item in resp.output:
             if item.type == "function_call":
@@ -76,16 +110,31 @@ class OpenAIResponsesBackend:
                         name=item.name,
                         args=json.loads(item.arguments),
                     ),
+                    usage=usage,
                 )
 
-        return ChatResponse(content=(resp.output_text or "").strip(), tool_call=None)
+        return ChatResponse(content=(resp.output_text or "").strip(), tool_call=None, usage=usage)
+
+    def _convert_tools(self, tools: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        if tools is not self._tools_src:
+            self._tools_src = tools
+            self._tools = [
+                {
+                    "type": "function",
+                    "name": t["function"]["name"],
+                    "description": t["function"]["description"],
+                    "parameters": t["function"]["parameters"],
+                }
+                for t in (tools or [])
+            ]
+        return self._tools
 
     def build_tool_call_message(self, tc: ToolCall) -> Dict[str, Any]:
         return {
             "type": "function_call",
             "call_id": tc.id,
             "name": tc.name,
-            "arguments": json.dumps(tc.args, ensure_ascii=False),
+            "arguments": dumps_json(tc.args),
         }
 
     def build_tool_result_message(self, tc: ToolCall, result: str) -> Dict[str, Any]:
@@ -1,14 +1,29 @@
 import json
+import sys
+import time
 from dataclasses import dataclass, field
 from typing import Any, Dict, List, Optional
 
 from openai import OpenAI
 
+from utils.clients import get_openai_client
+from utils.rate_control import limited_create, limited_stream
+
 
 def _is_reasoning_model(name: str) -> bool:
     return name.startswith(("o1-", "o3-", "o4-", "gpt-5"))
 
 
+# Server-side MCP work items worth timing.
+_TIMED_ITEMS = ("mcp_list_tools", "mcp_call")
+
+
+def _describe(item: Any) -> str:
+    if item.type == "mcp_call":
+        return f"mcp_call {item.server_label}.{item.name}"
+    return f"{item.type} {getattr(item, 'server_label', '')}".strip()
+
+
 @dataclass
 class OpenAIResponsesUrlBackend:
     """
@@ -22,6 +37,13 @@ class OpenAIResponsesUrlBackend:
 
     Because of this, the local MCP context (`MultiMcp`) and `agent_loop`
     are bypassed entirely when this backend is used.
+
+    With `stream`, the response is consumed as server-sent events: answer
+    text is printed as it arrives, and every `mcp_list_tools` / `mcp_call`
+    output item is timed from its `output_item.added` to its
+    `output_item.done` event, giving per-call latencies comparable to the
+    client-side loop's. Those log lines are held back until the stream ends
+    so they do not interleave with the printed answer.
     """
 
     model: str
@@ -29,9 +51,10 @@ class OpenAIResponsesUrlBackend:
     mcp_label: str = "custom"
     allowed_tools: Optional[List[str]] = None
     require_approval: str = "never"
+    stream: bool = False
 
     _client: OpenAI = field(
-        default_factory=lambda: OpenAI(max_retries=3, timeout=120.0),
+        default_factory=lambda: get_openai_client(timeout=120.0),
         init=False,
         repr=False,
     )
@@ -76,7 +99,68 @@ class OpenAIResponsesUrlBackend:
             f"[ROUND 1] MCP Tool Spec:\n{json.dumps(mcp_tool, indent=2, ensure_ascii=False)}\n"
         )
 
-        resp = self._client.responses.create(**kwargs)
-        logger.info(f"Raw API Response (full output items):\n{resp.output}\n")
+        if self.stream:
+            return self._run_streaming(kwargs, logger)
+
+        resp = limited_create(self._client.responses, provider="openai", model=self.model, logger=logger, **kwargs)
+        logger.debug("Raw API Response (full output items):\n%s\n", resp.output)
 
         return (resp.output_text or "").strip()
+
+    def _run_streaming(self, kwargs: Dict[str, Any], logger: Any) -> str:
+        t0 = time.perf_counter()
+        events = limited_stream(self._client.responses, provider="openai", model=self.model, logger=logger, **kwargs)
+
+        started: Dict[str, float] = {}  # item id -> seconds since t0
+        timings: List[Dict[str, Any]] = []
+        first_text: Optional[float] = None
+        text: List[str] = []
+        final = None
+        pending: List[str] = []  # log lines held back while text is printed
+
+        for event in events:
+            now = time.perf_counter() - t0
+            if event.type == "response.output_item.added":
+                started[event.item.id] = now
+                if event.item.type in _TIMED_ITEMS:
+                    pending.append(f"[stream +{now:.2f}s] {_describe(event.item)} started")
+            elif event.type == "response.output_item.done":
+                item = event.item
+                if item.type in _TIMED_ITEMS:
+                    start = started.get(item.id, now)
+                    timings.append({"item": _describe(item), "start": start, "seconds": now - start,
+                                    "error": getattr(item, "error", None)})
+                    pending.append(f"[stream +{now:.2f}s] {_describe(item)} done in {(now - start) * 1000:.0f} ms")
+            elif event.type == "response.output_text.delta":
+                if first_text is None:
+                    first_text = now
+                text.append(event.delta)
+                sys.stdout.write(event.delta)
+                sys.stdout.flush()
+            elif event.type == "response.completed":
+                final = event.response
+            elif event.type in ("response.failed", "error"):
+                raise RuntimeError(f"Responses stream failed: {event}")
+        if text:
+            sys.stdout.write("\n")
+            sys.stdout.flush()
+        for line in pending:
+            logger.info(line)
+
+        total = time.perf_counter() - t0
+        if final is not None:
+            logger.debug("Raw API Response (full output items):\n%s\n", final.output)
+        logger.info("[stream] MCP timing summary:")
+        for t in timings:
+            status = f" ERROR: {t['error']}" if t["error"] else ""
+            logger.info(f"  {t['item']:<40} +{t['start']:6.2f}s  {t['seconds'] * 1000:8.0f} ms{status}")
+        mcp_total = sum(t["seconds"] for t in timings)
+        ttft = f"{first_text:.2f}s" if first_text is not None else "-"
+        logger.info(
+            f"  total {total:.2f}s, in MCP items {mcp_total:.2f}s ({len(timings)} item(s)), "
+            f"first answer token at {ttft}"
+        )
+
+        if final is not None and final.output_text:
+            return final.output_text.strip()
+        return "".join(text).strip()
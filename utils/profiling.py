@@ -0,0 +1,198 @@
+"""
+Phase-scoped sampling profiler (--profile).
+
+A background thread snapshots the Python stacks of every thread with
+sys._current_frames() every `interval` seconds. Each sample is tagged with
+the innermost phase that is open at that moment -- phases are opened with
+`phase(name)` / `begin(name)` + `end(name)`, or from tracer spans through
+`span_listener` -- so one run answers "where did the time go" without any
+ad-hoc instrumentation:
+
+  <prefix>.collapsed   "phase;thread;frame;...;frame count" lines, the input
+                       format of flamegraph.pl and speedscope
+  <prefix>.phases.txt  per-phase table: calls, wall time, process CPU time,
+                       samples
+
+Idle threads (thread-pool workers and the log writer waiting for work) are
+not sampled; the event loop waiting in select() is, since that is time spent
+waiting on the network. CPU time is process CPU (all threads) over the
+phase, so it is exact for sequential phases and shared between overlapping
+ones.
+
+This module imports only the standard library, so entry points can start
+the profiler before their own (slow) imports to cover startup.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional
+
+# Tracer spans that become phases.
+SPAN_PHASES = ("backend.complete", "mcp.call_tool")
+
+# (file name, function) of the innermost frame of a thread that is idle.
+_IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),  # concurrent.futures pool worker blocked on its queue
+    ("handlers.py", "dequeue"),  # logging QueueListener
+}
+
+_NO_PHASE = "other"
+
+
+@dataclass
+class PhaseStats:
+    calls: int = 0
+    wall: float = 0.0
+    cpu: float = 0.0
+    samples: int = 0
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks: Counter = Counter()  # collapsed stack -> samples
+        self.phases: Dict[str, PhaseStats] = {}
+        self._open: List[tuple] = []  # (name, wall start, cpu start), innermost last
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = 0.0
+
+    # ---- phases -------------------------------------------------------------------
+
+    def begin(self, name: str) -> None:
+        with self._lock:
+            self._open.append((name, time.perf_counter(), time.process_time()))
+
+    def end(self, name: str) -> None:
+        wall_end, cpu_end = time.perf_counter(), time.process_time()
+        with self._lock:
+            # Phases may overlap (concurrent agents, hedged calls): close the
+            # innermost open phase with this name.
+            for i in range(len(self._open) - 1, -1, -1):
+                if self._open[i][0] == name:
+                    _, wall_start, cpu_start = self._open.pop(i)
+                    break
+            else:
+                return
+            stats = self.phases.setdefault(name, PhaseStats())
+            stats.calls += 1
+            stats.wall += wall_end - wall_start
+            stats.cpu += cpu_end - cpu_start
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    def span_listener(self, event: str, span: Any) -> None:
+        """Tracer listener: SPAN_PHASES spans become phases."""
+        if span.name in SPAN_PHASES:
+            (self.begin if event == "start" else self.end)(span.name)
+
+    # ---- sampling -----------------------------------------------------------------
+
+    def start(self, phase: Optional[str] = None) -> "SamplingProfiler":
+        if phase is not None:
+            self.begin(phase)
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        with self._lock:
+            still_open = [name for name, _, _ in self._open]
+        for name in reversed(still_open):
+            self.end(name)
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            frames = sys._current_frames()
+            with self._lock:
+                phase = self._open[-1][0] if self._open else _NO_PHASE
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                stack.append(phase)
+                self.stacks[";".join(reversed(stack))] += 1
+                with self._lock:
+                    self.phases.setdefault(phase, PhaseStats()).samples += 1
+
+    # ---- output -------------------------------------------------------------------
+
+    def table(self) -> str:
+        rows = sorted(self.phases.items(), key=lambda kv: -kv[1].wall)
+        lines = [f"{'phase':<24} {'calls':>6} {'wall s':>10} {'cpu s':>10} {'samples':>8}"]
+        for name, s in rows:
+            lines.append(f"{name:<24} {s.calls:>6} {s.wall:>10.3f} {s.cpu:>10.3f} {s.samples:>8}")
+        lines.append(f"{'(profiled)':<24} {'':>6} {time.perf_counter() - self._started:>10.3f}")
+        return "\n".join(lines)
+
+    def write(self, prefix: str) -> List[str]:
+        os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+        collapsed, phases = f"{prefix}.collapsed", f"{prefix}.phases.txt"
+        with open(collapsed, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(phases, "w", encoding="utf-8") as f:
+            f.write(self.table() + "\n")
+        return [collapsed, phases]
+
+
+class NullProfiler:
+    """Drop-in for SamplingProfiler that records nothing."""
+
+    def begin(self, name: str) -> None:
+        pass
+
+    def end(self, name: str) -> None:
+        pass
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        yield
+
+
+NULL_PROFILER = NullProfiler()
+
+
+@contextmanager
+def server_profile(server_name: str, enabled: bool, out_dir: str = "profiles") -> Iterator[None]:
+    """Profile an MCP server's whole run_server() as one "serve" phase."""
+    if not enabled:
+        yield
+        return
+    profiler = SamplingProfiler().start("serve")
+    try:
+        yield
+    finally:
+        profiler.stop()
+        paths = profiler.write(os.path.join(out_dir, f"{server_name}-{os.getpid()}"))
+        print(f"[{server_name}] profile written to {', '.join(paths)}")
@@ -0,0 +1,277 @@
+"""
+Client-side adaptive concurrency for the OpenAI / Anthropic backends.
+
+With --adaptive_concurrency every API call goes through an AdaptiveLimiter
+keyed by (provider, model), which replaces the SDK's blind retries (the
+SDK clients are then built with max_retries=0):
+
+  - AIMD on in-flight requests: each success raises the limit by 1/limit
+    (about +1 per full window), each rate-limit / overload response halves
+    it -- once per window, so a burst of 429s from requests that were
+    already in flight does not collapse it to 1;
+  - `retry-after` / `retry-after-ms` and the providers' rate-limit headers
+    (x-ratelimit-* for OpenAI, anthropic-ratelimit-* for Anthropic) pause
+    the whole key until the server says capacity is back, instead of
+    letting every waiting request hit the 429 in turn;
+  - connection errors and 5xx are retried with exponential backoff.
+
+`limiter_stats()` reports the current limit, in-flight count and queue
+wait per key; mcp_client.py logs it at the end of a run.
+"""
+
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+_THROTTLE_STATUS = (429, 503, 529)  # 529: Anthropic "overloaded"
+_RETRY_STATUS = (500, 502, 504)
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def _parse_reset(value: str, now: float) -> Optional[float]:
+    """Seconds until a reset header value: '1m30s' / '20ms' (OpenAI) or an RFC 3339 time (Anthropic)."""
+    value = value.strip()
+    parts = _DURATION_RE.findall(value)
+    if parts and "".join(n + u for n, u in parts) == value:
+        return sum(float(n) * _UNITS[u] for n, u in parts)
+    try:
+        at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    return max(0.0, at.timestamp() - now)
+
+
+def _retry_after(headers: Any) -> Optional[float]:
+    if headers is None:
+        return None
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return float(ms) / 1000.0
+        except ValueError:
+            pass
+    ra = headers.get("retry-after")
+    if ra:
+        try:
+            return float(ra)
+        except ValueError:
+            from email.utils import parsedate_to_datetime
+            try:
+                return max(0.0, parsedate_to_datetime(ra).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return None
+
+
+def _exhausted_for(headers: Any) -> Optional[float]:
+    """If a success response says a rate-limit bucket is empty, seconds until it refills."""
+    if headers is None:
+        return None
+    now = time.time()
+    pause = None
+    for remaining, reset in (
+        ("x-ratelimit-remaining-requests", "x-ratelimit-reset-requests"),
+        ("x-ratelimit-remaining-tokens", "x-ratelimit-reset-tokens"),
+        ("anthropic-ratelimit-requests-remaining", "anthropic-ratelimit-requests-reset"),
+        ("anthropic-ratelimit-tokens-remaining", "anthropic-ratelimit-tokens-reset"),
+    ):
+        left = headers.get(remaining)
+        if left is None or left.strip() not in ("0", "0.0"):
+            continue
+        wait = _parse_reset(headers.get(reset) or "", now)
+        if wait is not None:
+            pause = max(pause or 0.0, wait)
+    return pause
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        key: Tuple[str, str],
+        initial: float = 4.0,
+        min_limit: float = 1.0,
+        max_limit: float = 64.0,
+        max_attempts: int = 6,
+        base_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ):
+        self.key = key
+        self.limit = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._paused_until = 0.0  # monotonic
+        self._last_decrease = 0.0  # monotonic
+
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+        self.failures = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    # ---- slots ----------------------------------------------------------
+
+    def _acquire(self) -> float:
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    self._cond.wait(self._paused_until - now)
+                elif self._in_flight >= max(1, int(self.limit)):
+                    self._cond.wait()
+                else:
+                    break
+            self._in_flight += 1
+            waited = time.monotonic() - start
+            self.requests += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        return time.monotonic()
+
+    def _release(self, started: float, *, ok: bool, throttled: bool, pause: Optional[float]) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            if ok:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            elif throttled:
+                self.throttled += 1
+                # Halve once per window: only requests sent after the last
+                # decrease count as new evidence.
+                if started > self._last_decrease:
+                    self.limit = max(self.min_limit, self.limit / 2.0)
+                    self._last_decrease = time.monotonic()
+            if pause:
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            self._cond.notify_all()
+
+    # ---- calls ----------------------------------------------------------
+
+    def run(self, send: Callable[[], Any], logger: Any = None) -> Any:
+        """
+        `send` performs one request via the SDK's `with_raw_response` and
+        returns the raw response; the parsed response is returned.
+        """
+        raw, started = self._send(send, logger)
+        self._release(started, ok=True, throttled=False, pause=_exhausted_for(raw.headers))
+        return raw.parse()
+
+    def stream(self, send: Callable[[], Any], logger: Any = None) -> Iterator[Any]:
+        """Like `run` for a streaming request; the slot is held until the stream is consumed."""
+        raw, started = self._send(send, logger)
+        ok = False
+        try:
+            yield from raw.parse()
+            ok = True
+        finally:
+            self._release(started, ok=ok, throttled=False, pause=_exhausted_for(raw.headers) if ok else None)
+
+    def _send(self, send: Callable[[], Any], logger: Any) -> Tuple[Any, float]:
+        """Send with retries; returns the raw response with its slot still held."""
+        for attempt in range(1, self.max_attempts + 1):
+            started = self._acquire()
+            try:
+                raw = send()
+            except Exception as e:
+                status = getattr(e, "status_code", None)
+                response = getattr(e, "response", None)
+                throttled = status in _THROTTLE_STATUS
+                retryable = throttled or status in _RETRY_STATUS or (
+                    status is None and any(c.__name__ == "APIConnectionError" for c in type(e).__mro__)
+                )
+                pause = _retry_after(getattr(response, "headers", None)) if throttled else None
+                if retryable and pause is None:
+                    pause = min(self.max_backoff, self.base_backoff * 2 ** (attempt - 1)) * (0.5 + random.random() / 2)
+                self._release(started, ok=False, throttled=throttled, pause=pause if throttled else None)
+
+                if not retryable or attempt == self.max_attempts:
+                    self.failures += 1
+                    raise
+                self.retries += 1
+                if logger:
+                    logger.info(
+                        f"[rate] {self.key[0]}/{self.key[1]}: {status or type(e).__name__}, "
+                        f"retry {attempt}/{self.max_attempts - 1} in {pause:.1f}s (limit {self.limit:.1f})"
+                    )
+                if not throttled:
+                    time.sleep(pause)  # throttles wait in _acquire via the shared pause
+                continue
+
+            return raw, started
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "provider": self.key[0],
+                "model": self.key[1],
+                "limit": round(self.limit, 2),
+                "in_flight": self._in_flight,
+                "paused_for_s": round(max(0.0, self._paused_until - time.monotonic()), 2),
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "retries": self.retries,
+                "failures": self.failures,
+                "avg_wait_s": round(self.wait_total / self.requests, 3) if self.requests else 0.0,
+                "max_wait_s": round(self.wait_max, 3),
+            }
+
+
+_lock = threading.Lock()
+_enabled = False
+_options: Dict[str, Any] = {}
+_limiters: Dict[Tuple[str, str], AdaptiveLimiter] = {}
+
+
+def configure_rate_control(enabled: bool = True, **options: Any) -> None:
+    """Turn limiting on/off; `options` are AdaptiveLimiter keyword arguments."""
+    global _enabled, _options
+    with _lock:
+        _enabled = enabled
+        _options = options
+        _limiters.clear()
+
+
+def get_limiter(provider: str, model: str) -> Optional[AdaptiveLimiter]:
+    if not _enabled:
+        return None
+    with _lock:
+        key = (provider, model)
+        if key not in _limiters:
+            _limiters[key] = AdaptiveLimiter(key, **_options)
+        return _limiters[key]
+
+
+def limiter_stats() -> List[Dict[str, Any]]:
+    with _lock:
+        limiters = list(_limiters.values())
+    return [l.snapshot() for l in limiters]
+
+
+def limited_create(resource: Any, *, provider: str, model: str, logger: Any = None, **kwargs: Any) -> Any:
+    """`resource.create(**kwargs)` (e.g. client.chat.completions), through the limiter if enabled."""
+    limiter = get_limiter(provider, model)
+    if limiter is None:
+        return resource.create(**kwargs)
+    return limiter.run(lambda: resource.with_raw_response.create(**kwargs), logger)
+
+
+def limited_stream(resource: Any, *, provider: str, model: str, logger: Any = None, **kwargs: Any) -> Iterator[Any]:
+    """Events of `resource.create(stream=True, **kwargs)`; the limiter slot is held until they are consumed."""
+    limiter = get_limiter(provider, model)
+    if limiter is None:
+        yield from resource.create(stream=True, **kwargs)
+        return
+    yield from limiter.stream(lambda: resource.with_raw_response.create(stream=True, **kwargs), logger)
@@ -0,0 +1,236 @@
+"""
+Routing over several backends (--route gpt-4o,claude-...,Qwen/...).
+
+`RouterBackend` has the usual backend interface. Each `complete()` goes to
+the fastest healthy backend according to rolling (EWMA) latency and error
+rate; on an error the next one is tried. With `hedge_after`, a call that
+has not returned after that many seconds is also sent to the next backend
+and whichever answers first wins.
+
+Calls to one backend are serialised, and a backend still busy with a call
+(e.g. the losing hedge of the previous round, which cannot be interrupted)
+goes to the back of the order. Backends keep per-conversation state (the
+HF KV cache, the stateful Responses chain) that concurrent calls would
+corrupt.
+
+Because rounds of one conversation may be answered by different backends,
+the router keeps the conversation in a neutral form: its own
+build_tool_call_message / build_tool_result_message return plain
+"router_tool_call" / "router_tool_result" items, which are converted with
+the chosen backend's own builders. Each backend's converted list is kept
+and extended in place as the conversation grows, so backends that key
+state on the list object (stateful Responses) keep working. Tool-call ids
+that repeat are re-assigned by the router so they stay unique whichever
+backend produced them (local models all answer "call_0").
+"""
+
+import itertools
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.backend import ToolCall, ChatResponse
+
+_ids = itertools.count()
+
+
+@dataclass
+class BackendHealth:
+    name: str
+    alpha: float = 0.3
+    latency: Optional[float] = None  # EWMA seconds; None until first success
+    error_rate: float = 0.0  # EWMA of failures
+    consecutive_errors: int = 0
+    down_until: float = 0.0  # monotonic
+    calls: int = 0
+
+    def record(self, seconds: Optional[float], ok: bool, cooldown: float) -> None:
+        self.calls += 1
+        self.error_rate = (1 - self.alpha) * self.error_rate + self.alpha * (0.0 if ok else 1.0)
+        if ok:
+            self.consecutive_errors = 0
+            self.latency = seconds if self.latency is None else (1 - self.alpha) * self.latency + self.alpha * seconds
+        else:
+            self.consecutive_errors += 1
+            # Back off a failing provider for longer each time it keeps failing.
+            self.down_until = time.monotonic() + cooldown * min(2 ** (self.consecutive_errors - 1), 16)
+
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    def score(self) -> float:
+        # Unmeasured backends go first so every route gets a latency sample.
+        if self.latency is None:
+            return 0.0
+        return self.latency * (1.0 + 4.0 * self.error_rate)
+
+
+@dataclass
+class RouterBackend:
+    backends: List[Any]
+    names: List[str]
+    hedge_after: Optional[float] = None
+    cooldown: float = 30.0
+    _health: List[BackendHealth] = field(init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+    _pool: ThreadPoolExecutor = field(init=False, repr=False)
+    _busy: List[int] = field(init=False, repr=False)  # in-flight calls per backend
+    _backend_locks: List[threading.Lock] = field(init=False, repr=False)
+    # backend index -> (source list, items converted, converted list)
+    _converted: Dict[int, Tuple[List[Dict[str, Any]], int, List[Dict[str, Any]]]] = field(
+        default_factory=dict, init=False, repr=False
+    )
+    _seen_ids: set = field(default_factory=set, init=False, repr=False)
+
+    def __post_init__(self):
+        self._health = [BackendHealth(n) for n in self.names]
+        self._busy = [0] * len(self.backends)
+        self._backend_locks = [threading.Lock() for _ in self.backends]
+        self._pool = ThreadPoolExecutor(max_workers=max(2, 2 * len(self.backends)), thread_name_prefix="router")
+
+    def close(self) -> None:
+        """Stop the worker pool; calls already running are not waited for."""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # ---- conversation format --------------------------------------------
+
+    def build_tool_call_message(self, tc: ToolCall) -> Dict[str, Any]:
+        return {"type": "router_tool_call", "id": tc.id, "name": tc.name, "args": tc.args}
+
+    def build_tool_result_message(self, tc: ToolCall, result: str) -> Dict[str, Any]:
+        return {"type": "router_tool_result", "id": tc.id, "name": tc.name, "result": result}
+
+    @staticmethod
+    def _convert_one(backend: Any, m: Dict[str, Any]) -> Dict[str, Any]:
+        kind = m.get("type")
+        if kind == "router_tool_call":
+            return backend.build_tool_call_message(ToolCall(id=m["id"], name=m["name"], args=m["args"]))
+        if kind == "router_tool_result":
+            tc = ToolCall(id=m["id"], name=m["name"], args={})
+            return backend.build_tool_result_message(tc, m["result"])
+        return m
+
+    def _convert(self, i: int, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Backend i's view of `messages`; called with backend i's lock held."""
+        backend = self.backends[i]
+        src, n, out = self._converted.get(i, (None, 0, None))
+        if src is not messages or n > len(messages):
+            # Another conversation (or a rewritten one): start a new list.
+            n, out = 0, []
+        out.extend(self._convert_one(backend, m) for m in messages[n:])
+        self._converted[i] = (messages, len(messages), out)
+        return out
+
+    # ---- routing ----------------------------------------------------------
+
+    def _order(self) -> List[int]:
+        with self._lock:
+            idx = list(range(len(self.backends)))
+            healthy = [i for i in idx if self._health[i].healthy()]
+            # If everything is cooling down, try them all anyway (soonest first).
+            if not healthy:
+                return sorted(idx, key=lambda i: (self._busy[i] > 0, self._health[i].down_until))
+            return sorted(healthy, key=lambda i: (self._busy[i] > 0, self._health[i].score()))
+
+    def _call(self, i: int, messages, tools, kwargs) -> ChatResponse:
+        try:
+            with self._backend_locks[i]:
+                start = time.monotonic()
+                try:
+                    resp = self.backends[i].complete(self._convert(i, messages), tools, **kwargs)
+                except Exception:
+                    with self._lock:
+                        self._health[i].record(None, ok=False, cooldown=self.cooldown)
+                    raise
+                with self._lock:
+                    self._health[i].record(time.monotonic() - start, ok=True, cooldown=self.cooldown)
+                return resp
+        finally:
+            with self._lock:
+                self._busy[i] -= 1
+
+    def complete(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: Optional[List[Dict[str, Any]]],
+        *,
+        max_new_tokens: int,
+        temperature: float,
+        seed: int,
+        logger: Any,
+    ) -> ChatResponse:
+        kwargs = dict(max_new_tokens=max_new_tokens, temperature=temperature, seed=seed, logger=logger)
+        order = self._order()
+        logger.info(f"[router] order: {[self.names[i] for i in order]}")
+
+        pending: Dict[Any, int] = {}
+        last_error: Optional[BaseException] = None
+        queue = list(order)
+
+        def launch() -> None:
+            i = queue.pop(0)
+            with self._lock:
+                self._busy[i] += 1
+            pending[self._pool.submit(self._call, i, messages, tools, kwargs)] = i
+
+        launch()
+        while pending:
+            hedge = self.hedge_after is not None and len(pending) == 1 and queue
+            done, _ = wait(list(pending), timeout=self.hedge_after if hedge else None, return_when=FIRST_COMPLETED)
+            if not done:
+                logger.info(f"[router] {self.names[next(iter(pending.values()))]} slower than {self.hedge_after}s; hedging")
+                launch()
+                continue
+            for fut in done:
+                i = pending.pop(fut)
+                try:
+                    resp = fut.result()
+                except Exception as e:
+                    last_error = e
+                    logger.info(f"[router] {self.names[i]} failed: {e!r}")
+                    if queue and not pending:
+                        launch()
+                    continue
+                # A losing hedge that has not started is cancelled; one that is
+                # already running finishes in the background (its backend stays
+                # busy until then) and its result is dropped.
+                for loser, j in pending.items():
+                    if loser.cancel():
+                        with self._lock:
+                            self._busy[j] -= 1
+                logger.info(f"[router] answered by {self.names[i]}")
+                return self._reassign_id(resp)
+
+        raise RuntimeError(f"All routed backends failed; last error: {last_error!r}")
+
+    def _reassign_id(self, resp: ChatResponse) -> ChatResponse:
+        if resp.tool_call is None:
+            return resp
+        tc = resp.tool_call
+        with self._lock:
+            # Provider ids (which a stateful backend must get back verbatim)
+            # are kept; repeated ones like the local models' "call_0" are not.
+            fresh = bool(tc.id) and tc.id not in self._seen_ids
+            self._seen_ids.add(tc.id)
+        if fresh:
+            return resp
+        return ChatResponse(
+            content=resp.content,
+            tool_call=ToolCall(id=f"router_call_{next(_ids)}", name=tc.name, args=tc.args),
+            usage=resp.usage,
+        )
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {
+                    "backend": h.name,
+                    "calls": h.calls,
+                    "latency_s": None if h.latency is None else round(h.latency, 3),
+                    "error_rate": round(h.error_rate, 3),
+                    "healthy": h.healthy(),
+                }
+                for h in self._health
+            ]
@@ -0,0 +1,251 @@
+"""
+Tool-schema compaction.
+
+`to_llm_tools` copies each MCP `inputSchema` verbatim, and FastMCP's pydantic
+schemas are verbose: a `title` on every property, `"default": null` next to
+an `anyOf [..., {"type": "null"}]` for every Optional, `$defs` for each
+Literal / Annotated type, and long descriptions. All of it is re-sent every
+round. `compact_llm_tools` rewrites the schemas without changing which
+arguments are valid for the model to send:
+
+  - drops `title` keywords and `"default": null`;
+  - collapses `anyOf [X, {"type": "null"}]` to X for optional properties
+    (omitting the argument already means null);
+  - inlines `$defs` entries that are used once or are small, merges
+    identical ones, and drops the unused ones;
+  - optionally shortens tool / parameter descriptions to a character budget.
+
+`tool_token_counts` measures the tool list with the tokenizer of each
+backend that will see it (every routed backend under --route), so the
+saving can be logged (see mcp_client.py --compact_schemas).
+"""
+
+import copy
+import json
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+# $defs entries smaller than this (serialized) are inlined even if used
+# more than once; a $ref costs about as much.
+_INLINE_MAX_CHARS = 200
+
+# Keywords whose value is data (an instance), not a schema: copied as-is.
+_DATA_KEYWORDS = ("default", "const", "enum", "examples")
+# Keywords whose value maps names to schemas.
+_SCHEMA_MAPS = ("patternProperties", "dependentSchemas")
+
+
+def _shorten(text: str, budget: Optional[int]) -> str:
+    text = " ".join(text.split())
+    if budget is None or len(text) <= budget:
+        return text
+    cut = text[:budget]
+    # Prefer ending on a sentence, then on a word.
+    end = cut.rfind(". ")
+    if end >= budget // 2:
+        return cut[:end + 1]
+    end = cut.rfind(" ")
+    if end > 0:
+        cut = cut[:end]
+    return cut.rstrip(",;:") + "…"
+
+
+def _ref_name(ref: str) -> Optional[str]:
+    for prefix in ("#/$defs/", "#/definitions/"):
+        if ref.startswith(prefix):
+            return ref[len(prefix):]
+    return None
+
+
+def _count_refs(node: Any, counts: Dict[str, int]) -> None:
+    if isinstance(node, dict):
+        name = _ref_name(node["$ref"]) if isinstance(node.get("$ref"), str) else None
+        if name is not None:
+            counts[name] = counts.get(name, 0) + 1
+        for v in node.values():
+            _count_refs(v, counts)
+    elif isinstance(node, list):
+        for v in node:
+            _count_refs(v, counts)
+
+
+def _recursive_defs(defs: Dict[str, Any]) -> set:
+    refs = {}
+    for name, body in defs.items():
+        counts: Dict[str, int] = {}
+        _count_refs(body, counts)
+        refs[name] = set(counts) & set(defs)
+
+    recursive = set()
+    for start in defs:
+        stack, seen = list(refs[start]), set()
+        while stack:
+            name = stack.pop()
+            if name == start:
+                recursive.add(start)
+                break
+            if name not in seen:
+                seen.add(name)
+                stack.extend(refs[name])
+    return recursive
+
+
+def _is_null(node: Any) -> bool:
+    return isinstance(node, dict) and node.get("type") == "null" and len(node) == 1
+
+
+class _Compactor:
+    def __init__(self, defs: Dict[str, Any], description_budget: Optional[int]):
+        self.budget = description_budget
+        self.defs = defs
+        self.recursive = _recursive_defs(defs)  # cannot be inlined; stay as refs
+        self.counts: Dict[str, int] = {}
+        self.kept: Dict[str, Any] = {}
+        self.aliases: Dict[str, str] = {}  # def name -> name of an identical kept def
+
+    def root(self, schema: Dict[str, Any]) -> Dict[str, Any]:
+        _count_refs({k: v for k, v in schema.items() if k not in ("$defs", "definitions")}, self.counts)
+        out = self.node(schema)
+        out.pop("$defs", None)
+        out.pop("definitions", None)
+        if self.kept:
+            out["$defs"] = self.kept
+        return out
+
+    def node(self, node: Any) -> Any:
+        if isinstance(node, list):
+            return [self.node(v) for v in node]
+        if not isinstance(node, dict):
+            return node
+
+        ref = node.get("$ref")
+        name = _ref_name(ref) if isinstance(ref, str) else None
+        if name is not None and name in self.defs:
+            resolved = self.ref(name)
+            if resolved is not None:
+                extra = {k: v for k, v in node.items() if k != "$ref"}
+                return {**resolved, **self.node(extra)}
+            return {**self.node({k: v for k, v in node.items() if k != "$ref"}), "$ref": f"#/$defs/{self.aliases.get(name, name)}"}
+
+        out: Dict[str, Any] = {}
+        for key, value in node.items():
+            if key == "title" and isinstance(value, str):
+                continue
+            if key in _DATA_KEYWORDS:
+                if not (key == "default" and value is None):
+                    out[key] = value
+            elif key == "description" and isinstance(value, str):
+                out[key] = _shorten(value, self.budget)
+            elif key == "properties" and isinstance(value, dict):
+                required = set(node.get("required") or [])
+                out[key] = {
+                    prop: self.optional(self.node(sub)) if prop not in required else self.node(sub)
+                    for prop, sub in value.items()
+                }
+            elif key in _SCHEMA_MAPS and isinstance(value, dict):
+                out[key] = {name: self.node(sub) for name, sub in value.items()}
+            elif key in ("$defs", "definitions"):
+                continue  # re-emitted by root() with only what is still referenced
+            else:
+                out[key] = self.node(value)
+        return out
+
+    def optional(self, prop: Any) -> Any:
+        """anyOf [X, null] -> X for a property the model may simply omit."""
+        if not isinstance(prop, dict):
+            return prop
+        branches = prop.get("anyOf")
+        if not isinstance(branches, list) or len(branches) != 2:
+            return prop
+        rest = [b for b in branches if not _is_null(b)]
+        if len(rest) != 1 or not isinstance(rest[0], dict):
+            return prop
+        merged = {k: v for k, v in prop.items() if k != "anyOf"}
+        return {**rest[0], **merged}
+
+    def ref(self, name: str) -> Optional[Dict[str, Any]]:
+        """Inlined body for `name`, or None if it stays a $ref."""
+        body = self.defs[name]
+        if name in self.recursive:
+            self.keep(name, body)
+            return None
+        compacted = self.node(body)
+        if self.counts.get(name, 0) <= 1 or len(json.dumps(compacted)) <= _INLINE_MAX_CHARS:
+            return compacted
+        self.keep(name, compacted)
+        return None
+
+    def keep(self, name: str, body: Any) -> None:
+        if name in self.kept or name in self.aliases:
+            return
+        for other, kept_body in self.kept.items():
+            if kept_body == body:
+                self.aliases[name] = other
+                return
+        if name in self.recursive:
+            self.kept[name] = None  # placeholder: the body refers back to itself
+            body = self.node(body)
+        self.kept[name] = body
+
+
+def compact_schema(schema: Dict[str, Any], description_budget: Optional[int] = None) -> Dict[str, Any]:
+    if not isinstance(schema, dict):
+        return schema
+    defs = dict(schema.get("$defs") or {})
+    defs.update(schema.get("definitions") or {})
+    return _Compactor(defs, description_budget).root(copy.deepcopy(schema))
+
+
+def compact_llm_tools(llm_tools: List[Dict[str, Any]], description_budget: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Compacted copy of a `to_llm_tools` list."""
+    out = []
+    for t in llm_tools:
+        fn = t["function"]
+        out.append({
+            **t,
+            "function": {
+                **fn,
+                "description": _shorten(fn.get("description") or "", description_budget),
+                "parameters": compact_schema(fn["parameters"], description_budget),
+            },
+        })
+    return out
+
+
+def tool_tokens(llm_tools: List[Dict[str, Any]], backend: Any = None, model: str = "") -> Tuple[int, str]:
+    """
+    Size of the tool list in tokens for one backend, and how it was
+    counted: the HF tokenizer for a local model, tiktoken for OpenAI models
+    when installed, otherwise ~4 characters per token (Anthropic, and HF
+    models served by a daemon, have no local tokenizer here). The
+    backend's own model name wins over `model`.
+    """
+    text = json.dumps(llm_tools, ensure_ascii=False)
+    model = getattr(backend, "model", None) or model
+
+    hf = getattr(backend, "hf", None)
+    if hf is not None:
+        return len(hf.tokenizer.encode(text, add_special_tokens=False)), "hf tokenizer"
+
+    from utils.backend import _is_openai_model
+    if _is_openai_model(model):
+        try:
+            import tiktoken
+        except ImportError:
+            pass
+        else:
+            try:
+                enc = tiktoken.encoding_for_model(model)
+            except KeyError:
+                enc = tiktoken.get_encoding("o200k_base")
+            return len(enc.encode(text)), f"tiktoken/{enc.name}"
+
+    return math.ceil(len(text) / 4), "chars/4"
+
+
+def tool_token_counts(llm_tools: List[Dict[str, Any]], backend: Any = None, model: str = "") -> List[Tuple[str, int, str]]:
+    """(model, tokens, counter) for `backend`, or for each backend a RouterBackend routes to."""
+    routed = getattr(backend, "backends", None)
+    if routed is not None:
+        return [(name, *tool_tokens(llm_tools, b, name)) for name, b in zip(backend.names, routed)]
+    return [(model, *tool_tokens(llm_tools, backend, model))]
@@ -0,0 +1,307 @@
+"""
+Single-pass, incremental tool-call parser for local-model output.
+
+Recognizes, in order of appearance and any number of times:
+
+  - Llama 3.1:          <|python_tag|>{"name": ..., "parameters": {...}}
+                        (or the bare JSON object as the whole output)
+  - Qwen2.5 / 3 / Hermes: <tool_call>{"name": ..., "arguments": {...}}</tool_call>
+  - Qwen3.5 XML:        [<tool_call>]<function=name><parameter=k>v</parameter>...</function>[</tool_call>]
+
+Text is consumed chunk by chunk (`feed`) and every call is emitted as soon
+as it closes, so the same parser serves full strings (parse_tool_calls) and
+token streams (early stopping). Anything inside <think>...</think> is
+skipped. Malformed calls are reported as ToolCallParseError with their
+offsets instead of being dropped silently.
+"""
+
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+
+PYTHON_TAG = "<|python_tag|>"
+TOOL_CALL_OPEN = "<tool_call>"
+TOOL_CALL_CLOSE = "</tool_call>"
+FUNCTION_OPEN = "<function="
+FUNCTION_CLOSE = "</function>"
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+_MARKERS = (PYTHON_TAG, TOOL_CALL_OPEN, FUNCTION_OPEN, THINK_OPEN)
+_PARAM_RE = re.compile(r"<parameter=([^>]+)>(.*?)</parameter>", re.DOTALL)
+
+
+@dataclass
+class ParsedToolCall:
+    name: str
+    args: Dict[str, Any]
+    fmt: str  # "llama" | "hermes" | "xml" | "json"
+    start: int  # character offsets into the whole stream
+    end: int
+
+
+@dataclass
+class ToolCallParseError:
+    message: str
+    fmt: str
+    start: int
+    end: int
+    snippet: str
+
+    def __str__(self) -> str:
+        return f"{self.message} [{self.fmt} @ {self.start}:{self.end}] {self.snippet!r}"
+
+
+def _as_call(obj: Any) -> Optional[Tuple[str, Dict[str, Any]]]:
+    if not isinstance(obj, dict) or "name" not in obj:
+        return None
+    # Llama 3.1 emits the args under "parameters"; Qwen2.5/3 / Hermes / OpenAI use "arguments".
+    if isinstance(obj.get("parameters"), dict):
+        return obj["name"], obj["parameters"]
+    if isinstance(obj.get("arguments"), dict):
+        return obj["name"], obj["arguments"]
+    return None
+
+
+class StreamingToolCallParser:
+    def __init__(self):
+        self.calls: List[ParsedToolCall] = []
+        self.errors: List[ToolCallParseError] = []
+
+        self._text = ""
+        self._i = 0  # next character to scan
+        self._state = "text"
+        self._fmt = ""  # format of the call being read
+        self._start = 0  # where the current call / JSON object began
+        self._answered = False  # non-blank text seen since the last <think> block
+        self._in_tool_call = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._closed = False
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def feed(self, chunk: str) -> List[ParsedToolCall]:
+        """Consume more text. Returns the calls completed by this chunk."""
+        if self._closed:
+            raise RuntimeError("feed() after close()")
+        before = len(self.calls)
+        self._text += chunk
+        self._scan()
+        return self.calls[before:]
+
+    def close(self) -> List[ParsedToolCall]:
+        """End of stream: report unterminated calls and apply the bare-JSON fallback."""
+        before = len(self.calls)
+        if not self._closed:
+            self._closed = True
+            self._finish()
+        return self.calls[before:]
+
+    # ---- scanning -------------------------------------------------------
+
+    def _scan(self) -> None:
+        while True:
+            progressed = getattr(self, f"_scan_{self._state}")()
+            if not progressed:
+                return
+
+    def _scan_text(self) -> bool:
+        t = self._text
+        if not self._answered and not self.calls:
+            # An output that *starts* with a JSON object is the tag-less
+            # Llama form.
+            while self._i < len(t) and t[self._i] in " \t\r\n":
+                self._i += 1
+            if self._i >= len(t):
+                return False
+            if t[self._i] == "{":
+                self._begin_json("llama", self._i)
+                return True
+        self._answered = True
+
+        while self._i < len(t):
+            lt = t.find("<", self._i)
+            if lt == -1:
+                self._i = len(t)
+                return False
+            self._i = lt
+            for marker in _MARKERS:
+                if t.startswith(marker, lt):
+                    self._enter(marker, lt)
+                    return True
+                if marker.startswith(t[lt:]):
+                    return False  # marker may be split across chunks
+            self._i = lt + 1
+        return False
+
+    def _enter(self, marker: str, at: int) -> None:
+        self._i = at + len(marker)
+        if marker == THINK_OPEN:
+            self._state = "think"
+        elif marker == PYTHON_TAG:
+            self._state, self._fmt, self._start = "expect_json", "llama", at
+        elif marker == TOOL_CALL_OPEN:
+            self._in_tool_call = True
+            self._state, self._fmt, self._start = "expect_json", "hermes", at
+        else:
+            self._state, self._fmt, self._start = "xml", "xml", at
+
+    def _scan_think(self) -> bool:
+        end = self._text.find(THINK_CLOSE, self._i)
+        if end == -1:
+            self._i = max(self._i, len(self._text) - len(THINK_CLOSE))
+            return False
+        self._i = end + len(THINK_CLOSE)
+        self._answered = False
+        self._state = "text"
+        return True
+
+    def _scan_expect_json(self) -> bool:
+        t = self._text
+        while self._i < len(t) and t[self._i] in " \t\r\n":
+            self._i += 1
+        if self._i >= len(t):
+            return False
+        if t[self._i] == "{":
+            self._begin_json(self._fmt, self._i)
+            return True
+        if self._in_tool_call and t[self._i] == "<":
+            # Qwen3.5 nests the XML form inside <tool_call>.
+            if t.startswith(FUNCTION_OPEN, self._i):
+                self._enter(FUNCTION_OPEN, self._i)
+                return True
+            if FUNCTION_OPEN.startswith(t[self._i:]):
+                return False
+        self._error("expected a JSON object", self._start, self._i + 1)
+        self._after_call()
+        return True
+
+    def _begin_json(self, fmt: str, at: int) -> None:
+        self._state, self._fmt, self._start = "json", fmt, at
+        self._i = at
+        self._depth, self._in_string, self._escape = 0, False, False
+
+    def _scan_json(self) -> bool:
+        t = self._text
+        while self._i < len(t):
+            ch = t[self._i]
+            self._i += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit_json(self._start, self._i)
+                    self._after_call()
+                    return True
+        return False
+
+    def _emit_json(self, start: int, end: int) -> None:
+        raw = self._text[start:end]
+        try:
+            obj = json.loads(raw)
+        except json.JSONDecodeError as e:
+            self._error(f"invalid JSON: {e.msg} (char {e.pos})", start, end)
+            return
+        tc = _as_call(obj)
+        if tc is None:
+            self._error('JSON object is not a tool call (needs "name" and dict "arguments"/"parameters")', start, end)
+            return
+        self.calls.append(ParsedToolCall(name=tc[0], args=tc[1], fmt=self._fmt, start=start, end=end))
+
+    def _scan_xml(self) -> bool:
+        end = self._text.find(FUNCTION_CLOSE, self._i)
+        if end == -1:
+            self._i = max(self._i, len(self._text) - len(FUNCTION_CLOSE))
+            return False
+        end += len(FUNCTION_CLOSE)
+        segment = self._text[self._start:end]
+
+        head = segment[len(FUNCTION_OPEN):]
+        gt = head.find(">")
+        name = head[:gt].strip() if gt != -1 else ""
+        if not name:
+            self._error("missing function name", self._start, end)
+        else:
+            # Values stay strings; the tool's compiled coercer (see
+            # compile_coercer) converts them to the schema's types.
+            args = {m.group(1).strip(): m.group(2).strip() for m in _PARAM_RE.finditer(head[gt + 1:])}
+            self.calls.append(ParsedToolCall(name=name, args=args, fmt="xml", start=self._start, end=end))
+        self._i = end
+        self._after_call()
+        return True
+
+    def _after_call(self) -> None:
+        self._state = "skip_tool_call_close" if self._in_tool_call else "text"
+
+    def _scan_skip_tool_call_close(self) -> bool:
+        end = self._text.find(TOOL_CALL_CLOSE, self._i)
+        if end == -1:
+            self._i = max(self._i, len(self._text) - len(TOOL_CALL_CLOSE))
+            return False
+        self._i = end + len(TOOL_CALL_CLOSE)
+        self._in_tool_call = False
+        self._state = "text"
+        return True
+
+    # ---- end of stream --------------------------------------------------
+
+    def _finish(self) -> None:
+        if self._state in ("json", "expect_json"):
+            self._error("unterminated JSON tool call", self._start, len(self._text))
+        elif self._state == "xml":
+            self._error(f"unterminated {FUNCTION_OPEN}... (no {FUNCTION_CLOSE})", self._start, len(self._text))
+
+        if self.calls or self.errors:
+            return
+
+        # Last resort, as before: the first JSON object in the answer text,
+        # i.e. after the last </think> (nothing if a think block is still
+        # open). Braces that do not start a JSON object are ordinary prose.
+        if self._state == "think":
+            return
+        close = self._text.rfind(THINK_CLOSE)
+        idx = close + len(THINK_CLOSE) if close != -1 else 0
+        decoder = json.JSONDecoder()
+        while True:
+            idx = self._text.find("{", idx)
+            if idx == -1:
+                return
+            try:
+                obj, used = decoder.raw_decode(self._text, idx)
+                break
+            except json.JSONDecodeError:
+                idx += 1
+        tc = _as_call(obj)
+        if tc is not None:
+            self._fmt = "json"
+            self.calls.append(ParsedToolCall(name=tc[0], args=tc[1], fmt="json", start=idx, end=used))
+
+    def _error(self, message: str, start: int, end: int) -> None:
+        snippet = self._text[start:end]
+        if len(snippet) > 120:
+            snippet = snippet[:60] + " ... " + snippet[-55:]
+        self.errors.append(ToolCallParseError(message=message, fmt=self._fmt, start=start, end=end, snippet=snippet))
+
+
+def parse_tool_calls(text: str) -> Tuple[List[ParsedToolCall], List[ToolCallParseError]]:
+    """Parse a complete output string."""
+    parser = StreamingToolCallParser()
+    parser.feed(text)
+    parser.close()
+    return parser.calls, parser.errors
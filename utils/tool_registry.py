@@ -0,0 +1,62 @@
+"""
+Name -> tool lookup for the agent loop.
+
+Built once from the `to_llm_tools` output, so each round resolves the
+model's tool name with a dict lookup instead of scanning `llm_tools` and
+re-splitting the prefixed name, and coerces and validates the arguments
+with functions compiled from the tool's input schema (see `compile_coercer`
+and `compile_validator`).
+"""
+
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.misc import _identity, _no_problems, compile_coercer, compile_validator, split_prefixed
+
+
+@dataclass(frozen=True)
+class ToolEntry:
+    name: str  # prefixed name, as the model sees it
+    server: str
+    tool: str  # name on the MCP server
+    schema: Optional[Dict[str, Any]]
+    coerce: Callable[[Any], Any]
+    validate: Callable[[Any], List[str]]  # problems with the coerced arguments
+
+
+class ToolRegistry:
+    def __init__(self, llm_tools: List[Dict[str, Any]]):
+        self._entries: Dict[str, ToolEntry] = {}
+        for t in llm_tools:
+            fn = t["function"]
+            server, tool = split_prefixed(fn["name"])
+            schema = fn.get("parameters")
+            self._entries[fn["name"]] = ToolEntry(
+                name=fn["name"],
+                server=server,
+                tool=tool,
+                schema=schema,
+                coerce=compile_coercer(schema) if schema else _identity,
+                validate=compile_validator(schema) if schema else _no_problems,
+            )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def get(self, name: str) -> Optional[ToolEntry]:
+        return self._entries.get(name)
+
+    def resolve(self, name: str) -> ToolEntry:
+        """
+        Entry for `name`. A name that was not offered (the model made it up)
+        is still routed by its prefix, with its arguments passed through
+        unchanged and unchecked -- the MCP server reports the error.
+        """
+        entry = self._entries.get(name)
+        if entry is not None:
+            return entry
+        server, tool = split_prefixed(name)
+        return ToolEntry(name=name, server=server, tool=tool, schema=None, coerce=_identity, validate=_no_problems)
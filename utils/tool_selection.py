@@ -0,0 +1,127 @@
+"""
+Per-round tool retrieval.
+
+With many servers enabled, the tool schemas dominate the prompt. When
+enabled (--tool_top_k), `ToolSelector` ranks the offered tools against the
+user's messages with BM25 over each tool's name, description and parameter
+names / descriptions, and only the top k are sent to the model. Tools the
+model has already called in this conversation are always kept, and if no
+tool matches the query at all the full set is sent.
+
+Selection only changes what the model sees; the ToolRegistry still knows
+every tool, so a call to an unselected tool is routed as usual.
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set
+
+_CAMEL_RE = re.compile(r"([a-z0-9])([A-Z])")
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Too common in tool docs / questions to say anything about relevance.
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from how i in is it me of on or the this to "
+    "what when where which who why with you your".split()
+)
+
+
+def _tokenize(text: str) -> List[str]:
+    text = _CAMEL_RE.sub(r"\1 \2", text).lower()
+    return [t for t in _TOKEN_RE.findall(text) if t not in _STOPWORDS]
+
+
+def _schema_text(schema: Any, out: List[str]) -> None:
+    if not isinstance(schema, dict):
+        return
+    if isinstance(schema.get("description"), str):
+        out.append(schema["description"])
+    for name, sub in (schema.get("properties") or {}).items():
+        out.append(name)
+        _schema_text(sub, out)
+    _schema_text(schema.get("items"), out)
+
+
+def _tool_document(tool: Dict[str, Any]) -> List[str]:
+    fn = tool["function"]
+    parts = [fn["name"], fn["name"]]  # name terms count double
+    if fn.get("description"):
+        parts.append(fn["description"])
+    _schema_text(fn.get("parameters"), parts)
+    return _tokenize(" ".join(parts))
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content")
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):  # Anthropic blocks
+        return " ".join(b.get("text", "") for b in content if isinstance(b, dict) and b.get("type") == "text")
+    return ""
+
+
+def called_tool_names(messages: List[Dict[str, Any]]) -> Set[str]:
+    """Names of tools called so far, in any backend's message format."""
+    names = set()
+    for m in messages:
+        if m.get("type") in ("function_call", "router_tool_call"):  # Responses API / RouterBackend item
+            names.add(m["name"])
+        for tc in m.get("tool_calls") or []:  # Chat Completions / HF
+            names.add(tc["function"]["name"])
+        content = m.get("content")
+        if isinstance(content, list):  # Anthropic tool_use blocks
+            names.update(b["name"] for b in content if isinstance(b, dict) and b.get("type") == "tool_use")
+    return names
+
+
+class ToolSelector:
+    def __init__(self, llm_tools: List[Dict[str, Any]], top_k: int, k1: float = 1.5, b: float = 0.75):
+        self.tools = llm_tools
+        self.top_k = top_k
+        self.k1 = k1
+        self.b = b
+
+        self._tf = [Counter(_tool_document(t)) for t in llm_tools]
+        self._len = [sum(tf.values()) for tf in self._tf]
+        self._avg_len = (sum(self._len) / len(self._len)) if self._len else 0.0
+        df = Counter(term for tf in self._tf for term in tf)
+        n = len(llm_tools)
+        self._idf = {term: math.log(1 + (n - d + 0.5) / (d + 0.5)) for term, d in df.items()}
+
+        # Last selection, returned as the same list object while it does not
+        # change so per-tools-list caches in the backends keep hitting.
+        self._last: Optional[List[Dict[str, Any]]] = None
+
+    def scores(self, query: str) -> List[float]:
+        terms = [t for t in _tokenize(query) if t in self._idf]
+        out = []
+        for tf, length in zip(self._tf, self._len):
+            norm = self.k1 * (1 - self.b + self.b * length / (self._avg_len or 1.0))
+            s = 0.0
+            for term in terms:
+                f = tf.get(term, 0)
+                if f:
+                    s += self._idf[term] * f * (self.k1 + 1) / (f + norm)
+            out.append(s)
+        return out
+
+    def select(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if self.top_k <= 0 or len(self.tools) <= self.top_k:
+            return self.tools
+
+        query = " ".join(_message_text(m) for m in messages if m.get("role") == "user")
+        scores = self.scores(query)
+        if max(scores, default=0.0) <= 0.0:
+            return self.tools  # nothing matched: let the model see everything
+
+        ranked = sorted(range(len(self.tools)), key=lambda i: -scores[i])
+        keep = {i for i in ranked[:self.top_k] if scores[i] > 0.0}
+        called = called_tool_names(messages)
+        keep.update(i for i, t in enumerate(self.tools) if t["function"]["name"] in called)
+
+        selected = [t for i, t in enumerate(self.tools) if i in keep]  # original order
+        if self._last is not None and [id(t) for t in self._last] == [id(t) for t in selected]:
+            return self._last
+        self._last = selected
+        return selected
@@ -0,0 +1,221 @@
+"""
+Span tracing for the agent loop (--trace_file).
+
+`Tracer.span(name, **attributes)` is a context manager; spans nest through
+a ContextVar, so spans opened inside `asyncio.to_thread` calls (which copy
+the context) land under the right parent. When a root span (one `run`)
+ends, all spans of that trace are exported together and a latency
+breakdown is attached to the root and logged:
+
+    model    -- time inside backend.complete
+    tools    -- time inside MCP tool calls
+    overhead -- everything else (coercion, message building, logging, ...)
+
+Export formats:
+  jsonl -- one compact JSON object per span
+  otlp  -- one OTLP/JSON ExportTraceServiceRequest per run, one per line,
+           as read by the OpenTelemetry collector's `otlpjsonfile` receiver
+"""
+
+import json
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Span names the breakdown is computed from.
+MODEL_SPAN = "backend.complete"
+TOOL_SPAN = "mcp.call_tool"
+
+_current: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "status")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.status = "ok"
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    @property
+    def duration_s(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e9
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    def set(self, **attributes: Any) -> None:
+        pass
+
+
+class Tracer:
+    def __init__(self, path: Optional[str] = None, fmt: str = "jsonl", service_name: str = "simplemcp", logger: Any = None):
+        if fmt not in ("jsonl", "otlp"):
+            raise ValueError(f"Unknown trace format: {fmt}")
+        self.fmt = fmt
+        self.service_name = service_name
+        self.logger = logger
+        self._file = open(path, "a", encoding="utf-8") if path else None
+        self._lock = threading.Lock()
+        self._open: Dict[str, List[Span]] = {}  # trace_id -> finished spans of a running trace
+        self._listeners: List[Callable[[str, Span], None]] = []
+
+    def add_listener(self, listener: Callable[[str, Span], None]) -> None:
+        """Call `listener("start" | "end", span)` around every span."""
+        self._listeners.append(listener)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        parent = _current.get()
+        trace_id = parent.trace_id if parent is not None else secrets.token_hex(16)
+        span = Span(name, trace_id, parent.span_id if parent is not None else None, attributes)
+        token = _current.set(span)
+        for listener in self._listeners:
+            listener("start", span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.attributes["error"] = repr(e)
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current.reset(token)
+            for listener in self._listeners:
+                listener("end", span)
+            self._finish(span)
+
+    def _finish(self, span: Span) -> None:
+        with self._lock:
+            spans = self._open.setdefault(span.trace_id, [])
+            spans.append(span)
+            if span.parent_id is not None:
+                return
+            del self._open[span.trace_id]
+
+        breakdown = self.breakdown(span, spans)
+        span.attributes["breakdown"] = breakdown
+        if self.logger:
+            self.logger.info(
+                f"[trace] {span.name} {breakdown['total_s']:.3f}s: model {breakdown['model_s']:.3f}s, "
+                f"tools {breakdown['tools_s']:.3f}s, overhead {breakdown['overhead_s']:.3f}s"
+            )
+        self._export(spans)
+
+    @staticmethod
+    def breakdown(root: Span, spans: List[Span]) -> Dict[str, Any]:
+        model = sum(s.duration_s for s in spans if s.name == MODEL_SPAN)
+        tools = sum(s.duration_s for s in spans if s.name == TOOL_SPAN)
+        total = root.duration_s
+        return {
+            "total_s": round(total, 6),
+            "model_s": round(model, 6),
+            "tools_s": round(tools, 6),
+            "overhead_s": round(max(0.0, total - model - tools), 6),
+        }
+
+    # ---- export -----------------------------------------------------------------
+
+    def _export(self, spans: List[Span]) -> None:
+        if self._file is None:
+            return
+        if self.fmt == "jsonl":
+            out = "".join(json.dumps(s.to_dict(), ensure_ascii=False, default=str) + "\n" for s in spans)
+        else:
+            out = json.dumps(self._otlp(spans), ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(out)
+            self._file.flush()
+
+    def _otlp(self, spans: List[Span]) -> Dict[str, Any]:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attr("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "simplemcp.agent_loop"},
+                    "spans": [
+                        {
+                            "traceId": s.trace_id,
+                            "spanId": s.span_id,
+                            **({"parentSpanId": s.parent_id} if s.parent_id else {}),
+                            "name": s.name,
+                            "kind": 1,  # SPAN_KIND_INTERNAL
+                            "startTimeUnixNano": str(s.start_ns),
+                            "endTimeUnixNano": str(s.end_ns),
+                            "attributes": [_otlp_attr(k, v) for k, v in _flatten(s.attributes).items()],
+                            "status": {"code": 2 if s.status == "error" else 1},
+                        }
+                        for s in spans
+                    ],
+                }],
+            }],
+        }
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class NullTracer:
+    """Drop-in for Tracer that records nothing."""
+
+    _span = _NoopSpan()
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[_NoopSpan]:
+        yield self._span
+
+    def close(self) -> None:
+        pass
+
+
+NULL_TRACER = NullTracer()
+
+
+def _flatten(attributes: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    out = {}
+    for k, v in attributes.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict):
+            out.update(_flatten(v, key + "."))
+        else:
+            out[key] = v
+    return out
+
+
+def _otlp_attr(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        v = {"boolValue": value}
+    elif isinstance(value, int):
+        v = {"intValue": str(value)}
+    elif isinstance(value, float):
+        v = {"doubleValue": value}
+    elif isinstance(value, str):
+        v = {"stringValue": value}
+    else:
+        v = {"stringValue": json.dumps(value, ensure_ascii=False, default=str)}
+    return {"key": key, "value": v}